@@ -0,0 +1,87 @@
+"""
+Compares two results files written by run.py, e.g. before and after a
+change:
+
+    python benchmarks/compare.py before.json after.json
+
+For each benchmark present in both files, prints the ratios after/before of
+the best wall time, of the number of calls of the derivatives function (RHS)
+and of the peak memory. Ratios above 1 + threshold (default 0.1) are flagged
+as regressions, and the exit code is then 1.
+"""
+
+
+import argparse
+import json
+import sys
+
+
+def compare(before, after, threshold = 0.1):
+
+    """Compares two sets of results.
+
+    Parameters:
+        before|after (dict):
+            Content of the results files.
+        threshold (float, optional):
+            Relative increase above which a value is a regression.
+
+    Returns:
+        list:
+            For each common benchmark, a dictionary holding its name, the
+            ratios of the time, RHS calls and peak memory, and whether it
+            regressed.
+    """
+
+    previous = {result["name"]: result for result in before["results"]}
+
+    rows = list()
+    for result in after["results"]:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        ratios = dict()
+        for key in ("time_best", "rhs_calls", "peak_memory"):
+            ratios[key] = result[key]/old[key] if old[key] else float("nan")
+        rows.append(dict(
+            name = result["name"],
+            **ratios,
+            regression = any(ratio > 1 + threshold for ratio in ratios.values())
+            ))
+
+    return rows
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__.split("\n\n")[0])
+    parser.add_argument("before", help = "reference results file")
+    parser.add_argument("after", help = "new results file")
+    parser.add_argument(
+        "--threshold", type = float, default = 0.1,
+        help = "relative increase flagged as a regression"
+        )
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['metadata']['commit']}")
+    print(f"after:  {after['metadata']['commit']}")
+    print(f"{'benchmark':<45} {'time':>8} {'RHS':>8} {'memory':>8}")
+
+    rows = compare(before, after, args.threshold)
+    for row in rows:
+        print(
+            f"{row['name']:<45} {row['time_best']:8.2f}" +
+            f" {row['rhs_calls']:8.2f} {row['peak_memory']:8.2f}" +
+            ("  <- regression" if row["regression"] else "")
+            )
+
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Models and datasets used by the benchmarks: the HMF oxidation on WO3 example
+and synthetic reaction networks of increasing size.
+"""
+
+
+import os
+import sys
+import lmfit
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WO3_DIR = os.path.join(ROOT, "examples", "HMF_oxidation_WO3")
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, WO3_DIR)
+
+from chemical_kinetics import data, fit
+from chemical_kinetics.network import Network
+
+
+class CountingFunction:
+
+    """Wraps a function and counts its calls, e.g. the derivatives function."""
+
+    def __init__(self, func):
+        """ Class constructor """
+
+        self.func = func
+        self.calls = 0
+
+
+    def __call__(self, *args, **kws):
+
+        self.calls += 1
+
+        return self.func(*args, **kws)
+
+
+class ChargeConversion:
+
+    """Linear conversion of the concentrations to charge passed."""
+
+    def __init__(self, electrons):
+        """ Class constructor """
+
+        self.electrons = np.asarray(electrons, dtype = float)
+
+
+    def __call__(self, c):
+
+        return c @ self.electrons
+
+
+def wo3_problem():
+
+    """Returns the WO3 example model, dataset and fit parameters.
+
+    Returns:
+        dict:
+            The model module ("model"), the dataset ("dataset") and the
+            arguments of fit.fit_dataset ("parameters", "c0",
+            "c0_untracked", "c_to_q").
+    """
+
+    import model
+
+    folders = [os.path.join(WO3_DIR, "data", f"run{i}") for i in range(1, 4)]
+    dataset = data.Dataset(
+        [os.path.join(folder, "Reaction Monitoring.csv") for folder in folders],
+        [os.path.join(folder, "Charge Passed.csv") for folder in folders]
+        )
+
+    rate_constants = [
+        "k11", "k12", "k21", "k22", "k3",
+        "kH1", "kH21", "kH22", "kH3", "kH4", "kHx"
+        ]
+
+    return dict(
+        model = model,
+        dataset = dataset,
+        parameters = {k: dict(value = 0.05, min = 0) for k in rate_constants},
+        c0 = {name: dict(vary = False) for name in model.measured_species},
+        c0_untracked = {
+            name: dict(value = 0, vary = False)
+            for name in model.all_species[5:]
+            },
+        c_to_q = model.c_to_q
+        )
+
+
+def synthetic_network(n_species, seed = 0):
+
+    """Builds a synthetic reaction network with n_species species.
+
+    The network is a chain of first order reactions S0 -> S1 -> ... with
+    a second order reaction Si + S0 -> S(i+1) every third species, so
+    that the model is nonlinear.
+
+    Returns:
+        network.Network, dict:
+            The network and the values of its rate constants.
+    """
+
+    rng = np.random.default_rng(seed)
+    species = [f"S{i}" for i in range(n_species)]
+
+    reactions = list()
+    for i in range(n_species - 1):
+        reactions.append(([species[i]], [species[i + 1]], f"k{i}"))
+        if i % 3 == 2:
+            reactions.append(
+                ([species[i], species[0]], [species[i + 1]], f"kb{i}")
+                )
+
+    network = Network(reactions, species)
+
+    # rate constants spread over two orders of magnitude, scaled with the
+    # length of the chain so that the last species are formed in the time
+    # range of the data
+    k = {
+        name: float(10**rng.uniform(-1, 1))*n_species/10
+        for name in network.rate_constants
+        }
+
+    return network, k
+
+
+def synthetic_dataset(
+    directory,
+    n_species,
+    n_points,
+    charge = False,
+    n_tracked = 5,
+    seed = 0
+    ):
+
+    """Builds a dataset from a synthetic network with noisy data.
+
+    The data are written to .csv files in directory, loaded in a
+    data.Dataset object.
+
+    Parameters:
+        directory (str):
+            Directory of the .csv files.
+        n_species (int):
+            Number of species of the network.
+        n_points (int):
+            Number of time values of the data.
+        charge (bool, optional):
+            If True, charge passed data are also generated.
+        n_tracked (int, optional):
+            Maximum number of tracked species.
+        seed (int, optional):
+            Seed of the random rate constants and noise.
+
+    Returns:
+        dict:
+            The network ("network"), the dataset ("dataset"), the true
+            parameters ("params") and the arguments of fit.fit_dataset
+            ("parameters", "c0", "c0_untracked", "c_to_q").
+    """
+
+    rng = np.random.default_rng(seed)
+    network, k = synthetic_network(n_species, seed)
+
+    tracked = network.species[:min(n_tracked, n_species)]
+    untracked = network.species[len(tracked):]
+
+    parameters = {name: dict(value = value, min = 0) for name, value in k.items()}
+    c0 = {name: dict(value = 1.0 if name == "S0" else 0.0, vary = False) for name in tracked}
+    c0_untracked = {name: dict(value = 0.0, vary = False) for name in untracked}
+    c_to_q = ChargeConversion(2.0*np.arange(n_species))
+
+    # true model evaluation
+    params = lmfit.Parameters()
+    for name, value in parameters.items(): params.add(name, **value)
+    for name, value in {**c0, **c0_untracked}.items(): params.add(f"c0_{name}", **value)
+
+    # evaluated on a grid of at least 1000 intervals, a few time values far
+    # apart take too many integration steps for the larger networks
+    step = int(np.ceil(1000/(n_points - 1)))
+    t = np.linspace(0, 10, n_points)
+    c = fit.evaluate(
+        network.derivatives, params, np.linspace(0, 10, (n_points - 1)*step + 1)
+        )[::step]
+
+    # noisy data files
+    os.makedirs(directory, exist_ok = True)
+    df_c = pd.DataFrame({"t": t})
+    for i, name in enumerate(tracked):
+        df_c[name] = c[:,i]*(1 + 0.02*rng.standard_normal(n_points))
+    file_c = os.path.join(directory, "c.csv")
+    df_c.to_csv(file_c, index = False)
+
+    files_q = None
+    if charge:
+        df_q = pd.DataFrame({"t": t})
+        df_q["Q"] = c_to_q(c)*(1 + 0.01*rng.standard_normal(n_points))
+        files_q = [os.path.join(directory, "q.csv")]
+        df_q.to_csv(files_q[0], index = False)
+
+    return dict(
+        network = network,
+        dataset = data.Dataset([file_c], files_q),
+        params = params,
+        parameters = parameters,
+        c0 = c0,
+        c0_untracked = c0_untracked,
+        c_to_q = c_to_q if charge else None
+        )
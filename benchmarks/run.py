@@ -0,0 +1,273 @@
+"""
+Runs the benchmarks of the evaluation and fitting functions, and writes the
+results to a .json file that can be compared to the results of another
+commit with compare.py:
+
+    python benchmarks/run.py --output before.json
+    (checkout another commit)
+    python benchmarks/run.py --output after.json
+    python benchmarks/compare.py before.json after.json
+
+The benchmarks cover the HMF oxidation on WO3 example and synthetic reaction
+networks from 5 to 500 species, with 10 to 100 000 time values, with and
+without charge passed data. For each benchmark the wall time (best and mean
+of several repeats), the number of calls of the derivatives function (RHS)
+and the peak memory allocated (measured by tracemalloc in a separate run, so
+that it does not slow down the timed runs) are recorded.
+
+Use --quick to only run the smaller benchmarks and --filter to select the
+benchmarks by name.
+"""
+
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import lmfit
+import numpy as np
+import scipy
+
+from models import (
+    ROOT, CountingFunction, fit, synthetic_dataset, wo3_problem
+    )
+from chemical_kinetics.problem import FitProblem
+
+
+def benchmark(name, setup, repeat = 3, **config):
+
+    """Runs a benchmark and returns its results.
+
+    Parameters:
+        name (str):
+            Name of the benchmark.
+        setup (function):
+            Returns the function to be timed, without arguments, and the
+            CountingFunction wrapping the derivatives function.
+        repeat (int, optional):
+            Number of timed runs.
+        config:
+            Description of the benchmark stored with the results.
+
+    Returns:
+        dict:
+            The benchmark results.
+    """
+
+    func, counter = setup()
+
+    times = list()
+    for i in range(repeat):
+        counter.calls = 0
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    rhs_calls = counter.calls
+
+    tracemalloc.start()
+    func()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = dict(
+        name = name,
+        config = config,
+        time_best = min(times),
+        time_mean = float(np.mean(times)),
+        repeat = repeat,
+        rhs_calls = rhs_calls,
+        peak_memory = peak_memory
+        )
+
+    print(
+        f"{name:<45} {result['time_best']:10.4f} s {rhs_calls:10d} RHS" +
+        f" {peak_memory/1e6:10.1f} MB"
+        )
+
+    return result
+
+
+def wo3_benchmarks():
+
+    """Yields the (name, setup, repeat, config) of the WO3 benchmarks."""
+
+    problem = wo3_problem()
+    dataset = problem["dataset"]
+    model = problem["model"]
+    params = fit.make_parameters(
+        dataset, problem["parameters"], problem["c0"], problem["c0_untracked"]
+        )
+    t, _ = fit.merge_times(dataset.df_c["t"], dataset.df_q["t"])
+    config = dict(model = "WO3", species = 15, points = len(t), charge = True)
+
+    def evaluate():
+        counter = CountingFunction(model.derivatives)
+        return lambda: fit.evaluate(counter, params, t), counter
+
+    def residuals():
+        counter = CountingFunction(model.derivatives)
+        return lambda: fit.residuals(
+            params, dataset.df_c, counter, dataset.names,
+            dataset.df_q, model.c_to_q
+            ), counter
+
+    def fit_problem_residuals():
+        counter = CountingFunction(model.derivatives)
+        compiled = FitProblem(
+            params, dataset.df_c, counter, dataset.names,
+            dataset.df_q, model.c_to_q
+            )
+        return lambda: compiled.residuals(params), counter
+
+    def fit_dataset(sensitivities):
+        def setup():
+            if sensitivities:
+                counter = CountingFunction(model.network.derivatives)
+                kws = dict(
+                    sensitivities = True,
+                    jac = model.network.jac,
+                    jac_p = model.network.jac_p
+                    )
+            else:
+                counter = CountingFunction(model.derivatives)
+                kws = dict()
+            return lambda: fit.fit_dataset(
+                dataset, counter, problem["parameters"], problem["c0"],
+                problem["c0_untracked"], problem["c_to_q"], **kws
+                ), counter
+        return setup
+
+    yield "wo3/evaluate", evaluate, 5, config
+    yield "wo3/residuals", residuals, 5, config
+    yield "wo3/fit_problem_residuals", fit_problem_residuals, 5, config
+    yield "wo3/fit_dataset", fit_dataset(False), 1, config
+    yield "wo3/fit_dataset_sensitivities", fit_dataset(True), 1, config
+
+
+def synthetic_benchmarks(directory, quick = False):
+
+    """Yields the (name, setup, repeat, config) of the synthetic benchmarks."""
+
+    species = (5, 50) if quick else (5, 50, 500)
+    points = (10, 1000) if quick else (10, 1000, 100000)
+
+    for n_species in species:
+        for n_points in points:
+            for charge in (False, True):
+
+                name = f"synthetic/{n_species}x{n_points}" + ("+q" if charge else "")
+                config = dict(
+                    model = "synthetic",
+                    species = n_species,
+                    points = n_points,
+                    charge = charge
+                    )
+                problem = synthetic_dataset(
+                    f"{directory}/{n_species}_{n_points}_{charge}",
+                    n_species, n_points, charge
+                    )
+                network = problem["network"]
+                dataset = problem["dataset"]
+                params = problem["params"]
+
+                def evaluate(network = network, params = params, dataset = dataset):
+                    counter = CountingFunction(network.derivatives)
+                    t = dataset.df_c["t"]
+                    return lambda: fit.evaluate(counter, params, t), counter
+
+                def residuals(problem = problem):
+                    counter = CountingFunction(problem["network"].derivatives)
+                    dataset = problem["dataset"]
+                    compiled = FitProblem(
+                        problem["params"], dataset.df_c, counter,
+                        dataset.names, dataset.df_q, problem["c_to_q"]
+                        )
+                    return lambda: compiled.residuals(problem["params"]), counter
+
+                yield name + "/evaluate", evaluate, 3, config
+                yield name + "/residuals", residuals, 3, config
+
+                # fits from rate constants 50% off, only for the smaller models
+                if n_species > 5 or n_points > 1000:
+                    continue
+
+                def fit_dataset(problem = problem):
+                    network = problem["network"]
+                    counter = CountingFunction(network.derivatives)
+                    parameters = {
+                        name: dict(value = 1.5*value["value"], min = 0)
+                        for name, value in problem["parameters"].items()
+                        }
+                    return lambda: fit.fit_dataset(
+                        problem["dataset"], counter, parameters,
+                        problem["c0"], problem["c0_untracked"],
+                        problem["c_to_q"], sensitivities = True,
+                        jac = network.jac, jac_p = network.jac_p
+                        ), counter
+
+                yield name + "/fit_dataset_sensitivities", fit_dataset, 1, config
+
+
+def metadata():
+
+    """Describes the commit, machine and packages versions of the run."""
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd = ROOT, capture_output = True, text = True, check = True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return dict(
+        commit = commit,
+        date = datetime.datetime.now().isoformat(timespec = "seconds"),
+        machine = platform.machine(),
+        processor = platform.processor(),
+        python = platform.python_version(),
+        numpy = np.__version__,
+        scipy = scipy.__version__,
+        lmfit = lmfit.__version__
+        )
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = __doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--output", "-o", default = "benchmark-results.json",
+        help = "path of the results file"
+        )
+    parser.add_argument(
+        "--quick", action = "store_true",
+        help = "only run the smaller benchmarks"
+        )
+    parser.add_argument(
+        "--filter", "-k", default = "",
+        help = "only run the benchmarks whose name contains this string"
+        )
+    args = parser.parse_args()
+
+    results = list()
+
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks = [wo3_benchmarks(), synthetic_benchmarks(directory, args.quick)]
+        for benchmarks_set in benchmarks:
+            for name, setup, repeat, config in benchmarks_set:
+                if args.filter in name:
+                    results.append(benchmark(name, setup, repeat, **config))
+
+    with open(args.output, "w") as f:
+        json.dump(dict(metadata = metadata(), results = results), f, indent = 2)
+
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
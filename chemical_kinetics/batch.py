@@ -0,0 +1,600 @@
+"""
+This module fits many experiments with the same model, e.g. the runs
+produced every week by an automated setup, each run being a directory
+holding its concentration and charge passed .csv files:
+
+    data/run1/Reaction Monitoring.csv
+    data/run1/Charge Passed.csv
+    data/run2/Reaction Monitoring.csv
+    ...
+
+The :func:`fit_runs` function fits each run on a pool of processes, each
+fit being aborted past a time limit (and its process killed if it does
+not stop, e.g. in an integration that hangs), and writes to an output
+directory:
+
+    results.csv         one row per run: status and statistics of the fit,
+                        value and standard deviation of each parameter
+    runs/<run>/         fit curves of the run (fit_c.csv, fit_q.csv) and
+                        the fitted dataset (dataset.npz, see
+                        data.Dataset.save)
+    manifest.json       hash of the inputs of each fitted run
+
+With skip_unchanged, the runs whose inputs (data files, model module and
+fit options) have the same hash as in the manifest are not fitted again,
+their previous results being kept in results.csv.
+
+The model is a Python module, given by the path of its file or by its
+name if it can be imported, defining:
+
+    derivatives         see the fit.fit_dataset function
+    parameters          see the fit.fit_dataset function
+
+and optionally c0, c0_untracked, c_to_q, jac, jac_p, solver and
+sensitivities (see the fit.fit_dataset function). The charge passed is
+only fitted if the model defines c_to_q and the run has a charge passed
+file.
+
+The same is available from the command line, e.g.:
+
+    chemical-kinetics model.py "data/run*" -o fits -j 8 --timeout 600 --skip-unchanged
+
+where the --plots option also renders the plots of the fitted runs to
+<output>/plots, see the plot.render_report function.
+"""
+
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+import pandas as pd
+
+from . import data, fit, plot
+
+
+# version of the manifest written by fit_runs
+MANIFEST_VERSION = 1
+
+# model modules loaded in the current process, by path or name
+_models = dict()
+
+
+def fit_runs(
+    model,
+    runs,
+    output,
+    c_file = "Reaction Monitoring.csv",
+    q_file = "Charge Passed.csv",
+    processes = None,
+    timeout = None,
+    hard_timeout = None,
+    skip_unchanged = False,
+    decimate_q = None
+    ):
+
+    """Fits each run directory with the model and writes the results.
+
+    See the module description for the model module and the output
+    files. The runs are named by their path relative to the common
+    directory of all the runs (or by their directory name if there is
+    a single run).
+
+    Parameters:
+        model (str):
+            Path of the model module file, or name of the module.
+        runs (list):
+            Paths of the run directories.
+        output (str):
+            Path of the output directory, created if needed.
+        c_file|q_file (str, optional):
+            Names of the concentration and charge passed files in each
+            run directory.
+        processes (int, optional):
+            Number of processes used to run the fits, if None or 1 they
+            run one after the other in the current process.
+        timeout (float, optional):
+            Wall time limit in seconds of each fit. It is checked
+            between the model evaluations, a fit past it is aborted and
+            its fit curves are not written.
+        hard_timeout (float, optional):
+            Wall time limit in seconds after which the process of a fit
+            is killed, for the fits that do not reach the next check of
+            timeout (e.g. in an integration that hangs), by default
+            timeout plus the larger of timeout and 10 s. With a hard
+            timeout, each fit runs in its own process, even if processes
+            is None or 1.
+        skip_unchanged (bool, optional):
+            If True, the runs fitted successfully by a previous call with
+            the same inputs are skipped, see the module description. The
+            runs that failed or timed out are always fitted again.
+        decimate_q (int, optional):
+            If given, the charge passed data are reduced to about this
+            number of points before fitting, see the
+            data.Dataset.decimate_q method.
+
+    Returns:
+        pandas.DataFrame:
+            The results table written to results.csv, indexed by run,
+            with the "status" of each fit ("fitted", "timeout", "killed"
+            or "error"), whether it was fitted by this call ("refitted"),
+            the "success", "chisqr", "redchi", "nfev", wall time
+            ("elapsed") and "message" of the fit, and the value and
+            standard deviation ("<name>_stderr") of each parameter.
+    """
+
+    runs = [os.path.normpath(run) for run in runs]
+    names = _run_names(runs)
+    if len(set(names)) != len(names):
+        raise ValueError("the run directories must be distinct")
+
+    os.makedirs(output, exist_ok = True)
+    manifest_path = os.path.join(output, "manifest.json")
+    manifest = _read_manifest(manifest_path)
+
+    options = dict(
+        c_file = c_file,
+        q_file = q_file,
+        timeout = timeout,
+        decimate_q = decimate_q
+        )
+    model_hash = _model_hash(model)
+
+    if hard_timeout is None and timeout is not None:
+        hard_timeout = timeout + max(timeout, 10)
+
+
+    ############################################################################
+    # runs to fit, the others keep their previous results
+    ############################################################################
+
+    rows = dict()
+    jobs = list()
+    for name, run in zip(names, runs):
+        digest = _inputs_hash(model_hash, run, options)
+        entry = manifest.get(name)
+        if skip_unchanged and entry is not None and entry["hash"] == digest:
+            rows[name] = dict(entry["row"], refitted = False)
+            print(f"{name}: unchanged, skipped")
+        else:
+            jobs.append((name, run, digest))
+
+    def store(name, digest, row):
+        rows[name] = dict(row, refitted = True)
+        print(f"{name}: {row['status']} ({row['elapsed']:.1f} s) {row['message']}")
+        # only the successful fits are kept in the manifest, which is written
+        # after each fit so that an interrupted call keeps its progress
+        if row["status"] == "fitted":
+            manifest[name] = dict(hash = digest, row = row)
+        else:
+            manifest.pop(name, None)
+        _write_manifest(manifest_path, manifest)
+
+
+    ############################################################################
+    # run the fits
+    ############################################################################
+
+    if (processes is not None and processes > 1) or hard_timeout is not None:
+        _run_processes(
+            jobs, model, output, options, processes or 1, hard_timeout, store
+            )
+    else:
+        for name, run, digest in jobs:
+            store(name, digest, _fit_run(model, run, output, name, options))
+
+
+    ############################################################################
+    # results table, in the order of the runs
+    ############################################################################
+
+    results = pd.DataFrame([rows[name] for name in names], index = names)
+    results.index.name = "run"
+
+    first = [
+        "status", "refitted", "success", "chisqr", "redchi", "nfev",
+        "elapsed", "message"
+        ]
+    results = results.reindex(
+        columns = first + [c for c in results.columns if c not in first]
+        )
+    results.to_csv(os.path.join(output, "results.csv"))
+
+    return results
+
+
+def load_model(model):
+
+    """Loads a model module from the path of its file or from its name.
+
+    The modules are loaded once per process, e.g. once in each process
+    of the pool used by :func:`fit_runs`.
+
+    Parameters:
+        model (str):
+            Path of the module file (ending with .py), or name of an
+            importable module.
+
+    Returns:
+        module:
+            The model module.
+    """
+
+    if model in _models:
+        return _models[model]
+
+    if model.endswith(".py") or os.path.isfile(model):
+        path = os.path.abspath(model)
+        # the directory of the model is importable by the model itself, e.g.
+        # to import modules next to it
+        directory = os.path.dirname(path)
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+        name = "_model_" + hashlib.sha1(path.encode()).hexdigest()[:12]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(model)
+
+    for name in ("derivatives", "parameters"):
+        if not hasattr(module, name):
+            raise ValueError(f"the model module '{model}' does not define {name}")
+
+    _models[model] = module
+
+    return module
+
+
+def _run_processes(jobs, model, output, options, processes, hard_timeout, store):
+
+    """Fits the runs of jobs, each in its own process, see fit_runs.
+
+    At most processes fits run at once. Contrary to a pool of processes,
+    the process of a fit running past hard_timeout can be killed; its
+    row is then stored with the "killed" status.
+    """
+
+    pending = list(jobs)
+    running = dict()
+
+    while pending or running:
+
+        # start the next fits
+        while pending and len(running) < processes:
+            name, run, digest = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex = False)
+            process = multiprocessing.Process(
+                target = _fit_run_process,
+                args = (sender, model, run, output, name, options),
+                daemon = True
+                )
+            process.start()
+            sender.close()
+            running[receiver] = (name, digest, process, time.time())
+
+        # wait for a fit to end, or for the next hard timeout
+        wait = None
+        if hard_timeout is not None:
+            deadline = min(start for *_, start in running.values()) + hard_timeout
+            wait = max(deadline - time.time(), 0)
+        ready = multiprocessing.connection.wait(list(running), timeout = wait)
+
+        for receiver in ready:
+            name, digest, process, start = running.pop(receiver)
+            try:
+                row = receiver.recv()
+            except EOFError:
+                row = None
+            receiver.close()
+            process.join()
+            # the process ended without sending its row, e.g. if it crashed
+            if row is None:
+                row = dict(
+                    status = "error",
+                    success = False,
+                    message = f"process ended with exit code {process.exitcode}",
+                    elapsed = time.time() - start
+                    )
+            store(name, digest, row)
+
+        if hard_timeout is None:
+            continue
+
+        for receiver, (name, digest, process, start) in list(running.items()):
+            if time.time() - start < hard_timeout:
+                continue
+            process.kill()
+            process.join()
+            receiver.close()
+            del running[receiver]
+            store(name, digest, dict(
+                status = "killed",
+                success = False,
+                message = f"killed after {hard_timeout} s",
+                elapsed = time.time() - start
+                ))
+
+
+def _fit_run_process(sender, model, run, output, name, options):
+
+    """Fits a single run in a child process, sending its row to the parent."""
+
+    try:
+        sender.send(_fit_run(model, run, output, name, options))
+    finally:
+        sender.close()
+
+
+def _fit_run(model, run, output, name, options):
+
+    """Fits a single run, see the fit_runs function.
+
+    Returns:
+        dict:
+            The row of the run in the results table.
+    """
+
+    start = time.time()
+    row = dict(status = "error", success = False, message = "")
+
+    try:
+        module = load_model(model)
+        c_to_q = getattr(module, "c_to_q", None)
+        solver = getattr(module, "solver", None)
+        jac = getattr(module, "jac", None)
+        jac_p = getattr(module, "jac_p", None)
+
+        file_q = os.path.join(run, options["q_file"])
+        if c_to_q is None or not os.path.isfile(file_q):
+            file_q, c_to_q = None, None
+
+        dataset = data.Dataset(
+            [os.path.join(run, options["c_file"])],
+            None if file_q is None else [file_q]
+            )
+        if file_q is not None and options["decimate_q"] is not None:
+            dataset.decimate_q(options["decimate_q"])
+
+
+        ########################################################################
+        # fit, aborted past the time limit
+        ########################################################################
+
+        # the message printed by fit_dataset is reported in the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fit.fit_dataset(
+                dataset,
+                module.derivatives,
+                module.parameters,
+                getattr(module, "c0", {}),
+                getattr(module, "c0_untracked", {}),
+                c_to_q,
+                sensitivities = getattr(module, "sensitivities", False),
+                jac = jac,
+                jac_p = jac_p,
+                solver = solver,
+                timeout = options["timeout"]
+                )
+
+        # the statistics of an aborted fit are not calculated
+        row.update(
+            status = "timeout" if result.timed_out else "fitted",
+            success = bool(result.success),
+            message = (
+                f"aborted after {options['timeout']} s" if result.timed_out
+                else result.message
+                ),
+            chisqr = getattr(result, "chisqr", None),
+            redchi = getattr(result, "redchi", None),
+            nfev = result.nfev
+            )
+        for key in result.params:
+            row[key] = result.params[key].value
+            row[f"{key}_stderr"] = result.params[key].stderr
+
+
+        ########################################################################
+        # fit curves and dataset of the run
+        ########################################################################
+
+        if not result.timed_out:
+            directory = os.path.join(output, "runs", name)
+            os.makedirs(directory, exist_ok = True)
+            dataset.df_c_fit.to_csv(
+                os.path.join(directory, "fit_c.csv"), index = False
+                )
+            if dataset.df_q_fit is not None:
+                dataset.df_q_fit.to_csv(
+                    os.path.join(directory, "fit_q.csv"), index = False
+                    )
+            dataset.save(os.path.join(directory, "dataset.npz"))
+
+    except Exception as error:
+        row.update(status = "error", message = f"{type(error).__name__}: {error}")
+
+    row["elapsed"] = time.time() - start
+
+    return row
+
+
+def _run_names(runs):
+
+    """Names of the runs, their paths relative to their common directory."""
+
+    if len(runs) == 1:
+        return [os.path.basename(os.path.abspath(runs[0]))]
+
+    root = os.path.commonpath([os.path.abspath(run) for run in runs])
+
+    return [
+        os.path.relpath(os.path.abspath(run), root).replace(os.sep, "/")
+        for run in runs
+        ]
+
+
+def _model_hash(model):
+
+    """Hash of the model module file, or of its name if it has no file."""
+
+    path = model
+    if not (model.endswith(".py") or os.path.isfile(model)):
+        path = getattr(importlib.util.find_spec(model), "origin", None)
+
+    if path is None or not os.path.isfile(path):
+        return hashlib.sha1(model.encode()).hexdigest()
+
+    return data._file_hash(path)
+
+
+def _inputs_hash(model_hash, run, options):
+
+    """Hash of the inputs of a run: model, data files and fit options."""
+
+    sha1 = hashlib.sha1(model_hash.encode())
+    sha1.update(json.dumps(options, sort_keys = True).encode())
+
+    for name in (options["c_file"], options["q_file"]):
+        path = os.path.join(run, name)
+        sha1.update(data._file_hash(path).encode() if os.path.isfile(path) else b"-")
+
+    return sha1.hexdigest()
+
+
+def _read_manifest(path):
+
+    """Reads the manifest of a previous call, empty if there is none."""
+
+    if not os.path.isfile(path):
+        return dict()
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return dict()
+
+    return manifest["runs"]
+
+
+def _write_manifest(path, runs):
+
+    """Writes the manifest, replacing the previous one at once."""
+
+    text = json.dumps(
+        dict(version = MANIFEST_VERSION, runs = runs),
+        indent = 2, default = data._json_value
+        )
+    data._write_atomic(path, lambda f: f.write(text.encode()))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        prog = "chemical-kinetics",
+        description = "Fits run directories with a kinetic model, see" +
+        " the chemical_kinetics.batch module."
+        )
+    parser.add_argument(
+        "model", help = "path of the model module file, or its name"
+        )
+    parser.add_argument(
+        "runs", nargs = "+",
+        help = "run directories, or glob patterns of run directories"
+        )
+    parser.add_argument(
+        "--output", "-o", default = "fits", help = "output directory"
+        )
+    parser.add_argument(
+        "--c-file", default = "Reaction Monitoring.csv",
+        help = "name of the concentration file in each run directory"
+        )
+    parser.add_argument(
+        "--q-file", default = "Charge Passed.csv",
+        help = "name of the charge passed file in each run directory"
+        )
+    parser.add_argument(
+        "--processes", "-j", type = int, default = None,
+        help = "number of processes running the fits"
+        )
+    parser.add_argument(
+        "--timeout", type = float, default = None,
+        help = "wall time limit in seconds of each fit"
+        )
+    parser.add_argument(
+        "--hard-timeout", type = float, default = None,
+        help = "wall time limit in seconds after which the process of a fit" +
+        " is killed, by default the timeout plus the larger of the timeout" +
+        " and 10 s"
+        )
+    parser.add_argument(
+        "--skip-unchanged", action = "store_true",
+        help = "skip the runs whose inputs did not change since the last call"
+        )
+    parser.add_argument(
+        "--decimate-q", type = int, default = None,
+        help = "number of points the charge passed data are reduced to"
+        )
+    parser.add_argument(
+        "--plots", action = "append", choices = ["png", "svg", "pdf"],
+        help = "render the plots of the fitted runs in this format" +
+        " (can be repeated)"
+        )
+    args = parser.parse_args()
+
+    # the patterns are expanded here as well, e.g. when quoted in the shell
+    runs = list()
+    for pattern in args.runs:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        runs.extend(path for path in matches if os.path.isdir(path))
+    if not runs:
+        parser.error("no run directory found")
+
+    results = fit_runs(
+        args.model,
+        runs,
+        args.output,
+        c_file = args.c_file,
+        q_file = args.q_file,
+        processes = args.processes,
+        timeout = args.timeout,
+        hard_timeout = args.hard_timeout,
+        skip_unchanged = args.skip_unchanged,
+        decimate_q = args.decimate_q
+        )
+
+    # the status of the skipped runs is the one of their previous fit
+    refitted = results["refitted"].astype(bool)
+    summary = [
+        f"{count} {status}"
+        for status, count in results["status"][refitted].value_counts().items()
+        ]
+    if (~refitted).any():
+        summary.append(f"{int((~refitted).sum())} unchanged (skipped)")
+    print(f"{len(results)} runs: " + ", ".join(summary))
+    print(f"results written to {os.path.join(args.output, 'results.csv')}")
+
+    if args.plots:
+        fitted = list(results.index[results["status"] == "fitted"])
+        directory = os.path.join(args.output, "plots")
+        plot.render_report(
+            [os.path.join(args.output, "runs", name, "dataset.npz") for name in fitted],
+            directory,
+            names = [name.replace("/", "_") for name in fitted],
+            formats = args.plots,
+            processes = args.processes
+            )
+        print(f"plots written to {directory}")
+
+
+if __name__ == "__main__":
+    main()
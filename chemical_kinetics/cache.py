@@ -0,0 +1,260 @@
+"""
+This module defines the cache of the model evaluations of the
+:func:`fit.evaluate` function and of the functions relying on it (e.g.
+:func:`fit.residuals` and the fit functions), enabled by the
+:func:`enable_cache` function.
+
+The evaluations are stored in a least recently used
+:class:`EvaluationCache`, keyed on the model functions, the parameters
+values and the solver options, e.g. so that the fit curves of a fit
+(:class:`curves.FitCurves`) reuse the last evaluations of the fit instead
+of solving the model again.
+"""
+
+
+import collections
+import scipy.sparse
+import numpy as np
+
+
+# cache of the evaluations used by the fit._evaluate function, None if
+# disabled
+_cache = None
+
+
+def enable_cache(max_bytes = 4e6):
+
+    """Enables the cache of the model evaluations.
+
+    The evaluations of the :func:`fit.evaluate` function (and of the
+    functions relying on it, e.g. :func:`fit.residuals`) are stored in a
+    least recently used cache, keyed on the model functions, the
+    parameters values and the solver options. An evaluation is reused if
+    the requested time values start with the same value (the initial
+    concentrations being the values at the first time value) and are
+    among the time values of a stored evaluation, or are within its time
+    range if the solve_ivp method used provides a dense output
+    (interpolated solution). The odeint integrator has no dense output,
+    its evaluations are only reused for the same time values or a subset
+    of them. The :class:`curves.FitCurves` of a fit reuse the dense output
+    of the last evaluations of the fit if a solve_ivp method is used. With
+    odeint they reuse the last evaluation of the fit at its own time
+    values (the time values of the data), and are solved with the
+    equivalent "LSODA" method at other time values, whose dense output is
+    then stored.
+
+    During a fit nearly all the evaluations have new parameters values:
+    only the last evaluations are reused, the default memory budget
+    (about ten dense outputs of a model with ten species) is set
+    accordingly.
+
+    The model functions are identified by the objects passed to
+    evaluate, the cache must therefore be cleared if a function is
+    modified in place (e.g. a global variable it uses).
+
+    Parameters:
+        max_bytes (float, optional):
+            Memory budget of the cache in bytes, the least recently used
+            evaluations are discarded when it is exceeded.
+
+    Returns:
+        EvaluationCache:
+            The cache, holding in particular the number of hits and
+            misses.
+    """
+
+    global _cache
+    _cache = EvaluationCache(max_bytes)
+
+    return _cache
+
+
+def disable_cache():
+
+    """Disables and clears the cache of the model evaluations."""
+
+    global _cache
+    _cache = None
+
+
+def enabled_cache():
+
+    """Returns the enabled EvaluationCache, None if the cache is disabled."""
+
+    return _cache
+
+
+class EvaluationCache:
+
+    """Least recently used cache of model evaluations, see enable_cache.
+
+    Parameters:
+        max_bytes (float, optional):
+            Memory budget of the cache in bytes.
+
+    Attributes:
+        max_bytes (float):
+            Memory budget of the cache in bytes.
+        nbytes (int):
+            Estimated memory used by the stored evaluations.
+        hits|misses (int):
+            Number of evaluations found or not found in the cache.
+    """
+
+    def __init__(self, max_bytes = 4e6):
+        """ Class constructor """
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        # key: (t, c, info, sol, nbytes), ordered from the least recently used
+        self._entries = collections.OrderedDict()
+
+
+    def __repr__(self):
+
+        return (
+            f"EvaluationCache(entries = {len(self._entries)}," +
+            f" nbytes = {self.nbytes}, hits = {self.hits}," +
+            f" misses = {self.misses})"
+            )
+
+
+    def key(self, derivatives, c0, p, solver = None, jac = None):
+
+        """Builds the key of an evaluation.
+
+        The parameters values are packed in a single bytes string, the
+        solver options are converted to hashable values.
+        """
+
+        values = np.concatenate([
+            np.asarray(c0, dtype = float).ravel(),
+            np.asarray(list(p.values()), dtype = float).ravel()
+            ])
+
+        options = tuple(sorted(
+            (name, _hashable(value))
+            for name, value in (solver or {}).items()
+            ))
+
+        return derivatives, jac, tuple(p), values.tobytes(), options
+
+
+    def get(self, key, t):
+
+        """Returns the stored (c, info) evaluation at t, or None if missing."""
+
+        entry = self._entries.get(key)
+        c = None
+
+        # the initial concentrations are the values at the first time value,
+        # an evaluation can only be reused for the same first time value
+        t = np.asarray(t, dtype = float)
+        if entry is not None and entry[0][0] != t[0]:
+            entry = None
+
+        if entry is not None:
+            t_entry, c_entry, info, sol, _ = entry
+
+            # the time values are among the stored ones
+            idx = np.searchsorted(t_entry, t).clip(max = len(t_entry) - 1)
+            if np.array_equal(t_entry[idx], t):
+                c = c_entry[idx]
+
+            # else interpolate the dense output within its time range
+            elif sol is not None and t.min() >= sol.t_min and t.max() <= sol.t_max:
+                c = sol(t).T
+
+        if c is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return c.copy(), info.copy()
+
+
+    def dense(self, key, t_span):
+
+        """Returns the stored dense output over t_span, or None if missing.
+
+        The dense output must start at t_span[0] (the initial
+        concentrations being the values at the first time value) and
+        cover t_span.
+        """
+
+        entry = self._entries.get(key)
+        sol = None if entry is None else entry[3]
+
+        if sol is None or entry[0][0] != t_span[0] or sol.t_max < t_span[1]:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return sol
+
+
+    def put(self, key, t, c, info, sol = None):
+
+        """Stores an evaluation, discards the least recently used ones if needed."""
+
+        t = np.array(t, dtype = float)
+        c = np.array(c, dtype = float)
+
+        nbytes = t.nbytes + c.nbytes + _solution_nbytes(sol)
+        if nbytes > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[-1]
+
+        self._entries[key] = (t, c, info.copy(), sol, nbytes)
+        self.nbytes += nbytes
+
+        while self.nbytes > self.max_bytes:
+            self.nbytes -= self._entries.popitem(last = False)[1][-1]
+
+
+    def clear(self):
+
+        """Removes all the stored evaluations and resets the counters."""
+
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+def _hashable(value):
+
+    """Converts a solver option value to a hashable value."""
+
+    if scipy.sparse.issparse(value):
+        value = value.toarray()
+    if isinstance(value, np.ndarray):
+        return value.shape, value.tobytes()
+
+    return value
+
+
+def _solution_nbytes(sol):
+
+    """Estimates the memory used by a scipy.integrate.OdeSolution."""
+
+    if sol is None:
+        return 0
+
+    nbytes = sol.ts.nbytes
+    for interpolant in sol.interpolants:
+        nbytes += sum(
+            value.nbytes for value in vars(interpolant).values()
+            if isinstance(value, np.ndarray)
+            )
+
+    return nbytes
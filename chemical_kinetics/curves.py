@@ -0,0 +1,350 @@
+"""
+This module defines the :class:`FitCurves` of a fit, the curves of the
+model for the best fit parameters, stored as dataset.fit_curves by the
+fit functions. The model is solved once, when the curves are first
+needed, and the curves are then interpolated at any time values, e.g. to
+build the df_c_fit and df_q_fit DataFrames of the dataset or to plot
+them.
+"""
+
+
+import pandas as pd
+import numpy as np
+
+from .cache import enabled_cache
+from .fit import LinearModel, as_observable, integrate
+
+
+class FitCurves:
+
+    """Fit curves of a model, evaluated lazily at any time values.
+
+    The model is solved a single time, when the curves are first
+    needed, with the dense output of a scipy.integrate.solve_ivp method
+    (an interpolant of the solution between the integrator steps), and
+    the curves are then interpolated at any time values. With the
+    default integrator (odeint) the "LSODA" method of solve_ivp is used
+    with the same tolerances. Linear models (:class:`fit.LinearModel`) are
+    evaluated in closed form instead, and reduced models (see the
+    reduction module) integrate their reduced system as
+    :func:`fit.evaluate` does.
+
+    If the cache of the evaluations is enabled (see the
+    :func:`cache.enable_cache` function), the evaluations of the fit are
+    reused: the dense output of a solve_ivp method at any time values,
+    and the evaluation of odeint, which has no dense output, at its own
+    time values (e.g. the time values of the data) as long as the curves
+    have not been solved.
+
+    The :meth:`sample` method chooses time values adapted to the
+    curvature of the curves, e.g. to plot them with few points, and the
+    :meth:`frames` method builds the fit DataFrames of a dataset.
+
+    Parameters:
+        derivatives (function):
+            The derivatives function of the model.
+        params (lmfit.parameter.Parameters):
+            Parameters values, e.g. the best fit parameters.
+        names (list):
+            Names of the tracked species, the first species of the
+            model state.
+        t_span (tuple):
+            Time range (t_min, t_max) of the curves, the initial
+            concentrations being the values at t_min.
+        c_to_q (function, optional):
+            Converts the concentrations into charge passed.
+        solver|jac (optional):
+            See the :func:`fit.evaluate` function.
+
+    Attributes:
+        derivatives|params|names|t_span|c_to_q|solver|jac:
+            The stored parameters.
+    """
+
+    def __init__(
+        self,
+        derivatives,
+        params,
+        names,
+        t_span,
+        c_to_q = None,
+        solver = None,
+        jac = None
+        ):
+        """ Class constructor """
+
+        self.derivatives = derivatives
+        self.params = params.copy()
+        self.names = list(names)
+        self.t_span = (float(t_span[0]), float(t_span[1]))
+        self.c_to_q = as_observable(c_to_q)
+        self.solver = solver
+        self.jac = jac
+
+        # dense output of the solution, calculated when first needed
+        self._sol = None
+
+
+    def concentrations(self, t):
+
+        """Concentrations of all the species with shape (time, species).
+
+        Parameters:
+            t (list):
+                Time values within t_span.
+        """
+
+        t = np.atleast_1d(np.asarray(t, dtype = float))
+
+        if np.any(t < self.t_span[0]) or np.any(t > self.t_span[1]):
+            raise ValueError(f"the time values are not within {self.t_span}")
+
+        c0 = [self.params[key].value for key in self.params if "c0_" in key]
+        p = {key: self.params[key].value for key in self.params if "c0_" not in key}
+
+        # linear models are solved in closed form at any time values, the
+        # initial time (first time value) being the start of t_span
+        if isinstance(self.derivatives, LinearModel):
+            solution = self.derivatives.solve(
+                c0, p, np.concatenate([[self.t_span[0]], t])
+                )
+            if solution is not None:
+                return solution[1:]
+
+        if self._sol is None:
+            cached = self._cached(c0, p, t)
+            if cached is not None:
+                return cached
+            self._sol = self._solve(c0, p)
+
+        return self._sol(t).T
+
+
+    def __call__(self, t):
+
+        """Concentrations of the tracked species with shape (time, species)."""
+
+        return self.concentrations(t)[:,:len(self.names)]
+
+
+    def charge(self, t):
+
+        """Charge passed at the time values t."""
+
+        if self.c_to_q is None:
+            raise ValueError("no charge passed conversion function (c_to_q)")
+
+        return self.c_to_q(self.concentrations(t))
+
+
+    def sample(self, n_points = 150, tol = 1e-3, n_init = 17):
+
+        """Time values adapted to the curvature of the curves.
+
+        Starting from n_init evenly spaced time values, the intervals
+        are split in two where the curves deviate from a straight line
+        between the interval ends by more than tol (relative to the
+        range of each curve), the largest deviations first, until the
+        deviations are below tol or n_points time values are used. Fast
+        transients then get dense time values, and flat parts few ones.
+
+        Parameters:
+            n_points (int, optional):
+                Maximum number of time values.
+            tol (float, optional):
+                Tolerance on the deviation from a straight line.
+            n_init (int, optional):
+                Number of initial time values.
+
+        Returns:
+            numpy.ndarray:
+                The time values, sorted.
+        """
+
+        t = np.linspace(*self.t_span, min(n_init, n_points))
+        y = self._curves(t)
+
+        while len(t) < n_points:
+
+            # deviation of the curves at the middle of each interval from the
+            # straight line between its ends, i.e. proportional to the
+            # curvature times the squared interval length
+            t_mid = 0.5*(t[:-1] + t[1:])
+            y_mid = self._curves(t_mid)
+            span = np.ptp(np.concatenate([y, y_mid]), axis = 0)
+            span[span == 0] = 1
+            deviation = np.nanmax(
+                np.abs(y_mid - 0.5*(y[:-1] + y[1:]))/span,
+                axis = 1
+                )
+
+            # split the intervals with the largest deviations
+            split = np.flatnonzero(deviation > tol)
+            if len(split) == 0:
+                break
+            split = split[np.argsort(-deviation[split])][:n_points - len(t)]
+
+            t = np.concatenate([t, t_mid[split]])
+            y = np.concatenate([y, y_mid[split]])
+            order = np.argsort(t)
+            t, y = t[order], y[order]
+
+        return t
+
+
+    def frames(self, t = None, n_points = 150):
+
+        """Builds the fit DataFrames of the concentrations and charge passed.
+
+        Parameters:
+            t (list, optional):
+                Time values of the DataFrames, if None they are chosen
+                by the :meth:`sample` method.
+            n_points (int, optional):
+                Maximum number of time values chosen by :meth:`sample`.
+
+        Returns:
+            pandas.DataFrame, pandas.DataFrame:
+                The concentrations of the tracked species and the charge
+                passed (None if there is no c_to_q function), with the
+                time in their "t" column.
+        """
+
+        if t is None:
+            t = self.sample(n_points)
+        t = np.asarray(t, dtype = float)
+
+        c = self.concentrations(t)
+
+        df_c = pd.DataFrame({"t": t})
+        for i, name in enumerate(self.names): df_c[name] = c[:,i]
+
+        df_q = None
+        if self.c_to_q is not None:
+            df_q = pd.DataFrame({"t": t})
+            df_q["Q"] = self.c_to_q(c)
+
+        return df_c, df_q
+
+
+    def _curves(self, t):
+
+        """Tracked concentrations and charge passed with shape (time, curves)."""
+
+        c = self.concentrations(t)
+        curves = [c[:,:len(self.names)]]
+        if self.c_to_q is not None:
+            curves.append(np.reshape(self.c_to_q(c), (len(t), -1)))
+
+        return np.concatenate(curves, axis = 1)
+
+
+    def _cached(self, c0, p, t):
+
+        """Evaluation at t of the default integrator found in the cache.
+
+        The evaluations of odeint have no dense output, the evaluation of
+        the fit (with the same solver options) is reused if t is among its
+        time values, as :func:`fit.evaluate` would do. Returns None
+        otherwise, or if the cache is disabled.
+        """
+
+        cache = enabled_cache()
+        solver = dict() if self.solver is None else self.solver
+        if cache is None or solver.get("method", "odeint") != "odeint":
+            return None
+
+        key = cache.key(self.derivatives, c0, p, self.solver, self.jac)
+        cached = cache.get(key, np.concatenate([[self.t_span[0]], t]))
+
+        return None if cached is None else cached[0][1:]
+
+
+    def _solve(self, c0, p):
+
+        """Solves the model over t_span, returns its dense output."""
+
+        # odeint has no dense output, the LSODA method of solve_ivp implements
+        # the same algorithm
+        solver = dict() if self.solver is None else dict(self.solver)
+        if solver.get("method", "odeint") == "odeint":
+            solver = dict(
+                method = "LSODA",
+                rtol = solver.get("rtol", 1.49012e-8),
+                atol = solver.get("atol", 1.49012e-8)
+                )
+
+        derivatives = self.derivatives
+        jac = self.jac
+
+        # reuse the dense output of an evaluation with the same values and
+        # solver options if the cache is enabled, e.g. the last evaluation of
+        # a fit using a solve_ivp method, see the cache.enable_cache function
+        cache = enabled_cache()
+        if cache is not None:
+            key = cache.key(derivatives, c0, p, solver, jac)
+            sol = cache.dense(key, self.t_span)
+            if sol is not None:
+                return sol
+
+        # reduced models integrate a smaller system, the concentrations of all
+        # the species being rebuilt from its dense output, see fit.evaluate
+        if hasattr(derivatives, "reduce"):
+            func, z0, reduced_jac, expand = derivatives.reduce(c0, p, jac)
+            solver.pop("jac_sparsity", None)
+            z, info = integrate(
+                func = func,
+                y0 = z0,
+                t = self.t_span,
+                args = (p,),
+                solver = solver,
+                jac = reduced_jac,
+                dense_output = True
+                )
+            c = expand(z, np.asarray(self.t_span))
+            sol = _ExpandedSolution(info.pop("sol"), expand)
+            if cache is not None and info["success"]:
+                cache.put(key, self.t_span, c, info, sol)
+            return sol
+
+        if isinstance(derivatives, LinearModel) and jac is None:
+            jac = derivatives.jac
+
+        c, info = integrate(
+            func = derivatives,
+            y0 = c0,
+            t = self.t_span,
+            args = (p,),
+            solver = solver,
+            jac = jac,
+            dense_output = True
+            )
+
+        sol = info.pop("sol")
+        if cache is not None and info["success"]:
+            cache.put(key, self.t_span, c, info, sol)
+
+        return sol
+
+
+class _ExpandedSolution:
+
+    """Dense output of a reduced system, returning all the concentrations."""
+
+    def __init__(self, sol, expand):
+        """ Class constructor """
+
+        self.sol = sol
+        self.expand = expand
+
+
+    def __call__(self, t):
+
+        t = np.atleast_1d(np.asarray(t, dtype = float))
+
+        return self.expand(self.sol(t).T, t).T
+
+
+    def __getattr__(self, name):
+
+        return getattr(self.sol, name)
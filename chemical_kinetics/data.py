@@ -5,20 +5,60 @@ stores the initial parameters, the fitted parameters and the fit
 estimations.
 
 This module also defines the function :func:`load` used in the
-:meth:`Dataset.load_c` and :meth:`Dataset.load_q` methods to load the .csv files.
+:meth:`Dataset.load_c` and :meth:`Dataset.load_q` methods to load the .csv files,
+which relies on the :class:`Replicates` class holding the individual runs
+aligned on a common time axis.
+
+Large .csv files (e.g. long charge passed traces) can be converted once into
+a binary cache, see the :func:`read` function, the following loads then
+memory-map the cache instead of parsing the .csv files again. Dense charge
+passed data can then be reduced to fewer points before fitting with the
+:meth:`Dataset.decimate_q` method, see the :func:`decimate` function.
+
+A fitted dataset can be saved to a single binary file with the
+:meth:`Dataset.save` method and reloaded without refitting with the
+:func:`load_dataset` function. The :func:`catalogue` function builds a
+table of the fitted parameters of many saved datasets, only reading
+their parameters, e.g. to select past fits before loading them.
 """
 
 
+import hashlib
+import json
+import os
+import tempfile
+import lmfit
+import numpy as np
 import pandas as pd
 
+from . import fit
+
+
+# default directory of the binary cache of the .csv files, see read()
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chemical_kinetics")
+
+# version of the files written by Dataset.save
+FILE_VERSION = 1
+
+# DataFrames attributes of Dataset stored by Dataset.save
+_FRAMES = ["df_c", "df_c_std", "df_c_fit", "df_q", "df_q_std", "df_q_fit"]
+
+# attributes of the lmfit.MinimizerResult stored by Dataset.save
+_RESULT_ATTRIBUTES = [
+    "method", "success", "message", "errorbars", "nfev", "ndata", "nvarys",
+    "nfree", "chisqr", "redchi", "aic", "bic", "var_names"
+    ]
+
 
 class Dataset:
 
     """Loads and stores kinetics data, also stores fit results and axes labels.
 
     Parameters:
-        files_c (list):
-            The path(s) of the concentration vs time files.
+        files_c (list, optional):
+            The path(s) of the concentration vs time files. If None, no
+            data are loaded, e.g. to fill the dataset from a saved file
+            (see :func:`load_dataset`).
         files_q (list, optional):
             The path(s) of the charge passed vs time files, if this
             parameter is not set, further fitting will proceed without
@@ -26,28 +66,43 @@ class Dataset:
         t_label|c_label|q_label (str, optional):
             Set the corresponding attributes values. Used to set the
             x and y axes labels when plotting.
+        cache (bool, optional):
+            If True, the .csv files are loaded through the binary cache,
+            see the :func:`read` function.
     
     Attributes:
         df_c|df_c_std|df_c_fit (pandas.DataFrame):
             Store respectively the mean concentration, the concentration
             standard deviations and the corresponding fit results.
             Defined by the load_c method or directly at initialization
-            using the files_c parameter.
+            using the files_c parameter, df_c_fit being built from
+            fit_curves when first accessed.
         df_q|df_q_std|df_q_fit (pandas.DataFrame):
             Store respectively the mean charge passed, the charge passed
             standard deviations and the corresponding fit results.
             Defined by the load_q method or directly at initialization
-            using the files_q parameter.
+            using the files_q parameter, df_q and df_q_std being
+            calculated from replicates_q and df_q_fit being built from
+            fit_curves when first accessed.
+        fit_curves (curves.FitCurves):
+            The fit curves, evaluated lazily at any time values. Defined
+            when the fit.fit_dataset() function is run on the Dataset
+            object.
         t_label|c_label|q_label (str):
             Labels to be used for the x and y axes when plotting the
             datasets.
-        fit_results (lmfit.MinimizerResult):
+        fit_result (lmfit.MinimizerResult):
             Stores the results of the fit, for details see the
             lmfit.minimizer.MinimizerResult documentation:
             https://lmfit.github.io/lmfit-py/fitting.html
 
             Defined when the fit.fit_dataset() function is run on the
             Dataset object.
+        fit_problem (problem.FitProblem):
+            The compiled problem of the last fit and its last model
+            evaluation, used to warm start the fit.refit_dataset()
+            function. Defined when the fit.fit_dataset() function is run
+            on the Dataset object.
         init_params (lmfit.parameter.Parameters):
             Stores the initial parameters for the fit, for details on
             this object class see:
@@ -59,20 +114,38 @@ class Dataset:
             Species names which concentration evolution over time is
             tracked. Used in particular to label the data when plotting.
             Defined in the load_c method.
+        files_c|files_q (list):
+            Paths of the loaded files, each file holding a run of the
+            experiment.
+        replicates_c|replicates_q (Replicates):
+            The individual runs of the concentrations and charge passed
+            data, e.g. used to resample the runs in the
+            uncertainty.bootstrap() function.
+        q_decimation (dict):
+            Parameters of the decimate() function used to reduce df_q,
+            None if df_q is not reduced. Defined by the decimate_q
+            method.
+        profiles|profile_intervals (dict|pandas.DataFrame):
+            The profile likelihood of the fitted parameters and the
+            corresponding confidence intervals. Defined by the
+            uncertainty.profile_likelihood() function.
     """
 
     def __init__(
         self,
-        files_c,
+        files_c = None,
         files_q = None,
         t_label = "t [s]",
         c_label = "C [M]",
-        q_label = "Q [C]"
+        q_label = "Q [C]",
+        cache = False
         ):
         """ Class constructor """
 
         # initialize attributes
 
+        self._lazy_q = set()
+
         self.df_c = None
         self.df_c_std = None
         self.df_c_fit = None
@@ -81,20 +154,90 @@ class Dataset:
         self.df_q_std = None
         self.df_q_fit = None
 
+        self.fit_curves = None
+
         self.t_label = t_label
         self.c_label = c_label
         self.q_label = q_label
 
         self.names = None
-        self.fit_results = None
+        self.files_c = None
+        self.files_q = None
+        self.replicates_c = None
+        self.replicates_q = None
+        self.q_decimation = None
+        self.fit_result = None
+        self.fit_problem = None
         self.init_params = None
+        self.profiles = None
+        self.profile_intervals = None
 
         # load data from list of files
-        self.load_c(files_c)
-        if files_q is not None: self.load_q(files_q)
+        if files_c is not None: self.load_c(files_c, cache)
+        if files_q is not None: self.load_q(files_q, cache)
+
+
+    @property
+    def df_c_fit(self):
+
+        # built from the fit curves on first access
+        if self._df_c_fit is None and getattr(self, "fit_curves", None) is not None:
+            self._df_c_fit, self._df_q_fit = self.fit_curves.frames()
+
+        return self._df_c_fit
+
+    @df_c_fit.setter
+    def df_c_fit(self, df):
+        self._df_c_fit = df
+
+
+    @property
+    def df_q_fit(self):
 
+        # built from the fit curves on first access, with df_c_fit
+        if self._df_c_fit is None and getattr(self, "fit_curves", None) is not None:
+            self._df_c_fit, self._df_q_fit = self.fit_curves.frames()
 
-    def load_c(self, files):
+        return self._df_q_fit
+
+    @df_q_fit.setter
+    def df_q_fit(self, df):
+        self._df_q_fit = df
+
+
+    @property
+    def df_q(self):
+
+        # the mean of the runs loaded by load_q is calculated on first access
+        if "df_q" in getattr(self, "_lazy_q", ()):
+            self._df_q = self.replicates_q._frame(self.replicates_q.mean)
+            self._lazy_q.discard("df_q")
+
+        return self._df_q
+
+    @df_q.setter
+    def df_q(self, df):
+        getattr(self, "_lazy_q", set()).discard("df_q")
+        self._df_q = df
+
+
+    @property
+    def df_q_std(self):
+
+        # the standard deviation of the runs is calculated on first access
+        if "df_q_std" in getattr(self, "_lazy_q", ()):
+            self._df_q_std = self.replicates_q._frame(self.replicates_q.std)
+            self._lazy_q.discard("df_q_std")
+
+        return self._df_q_std
+
+    @df_q_std.setter
+    def df_q_std(self, df):
+        getattr(self, "_lazy_q", set()).discard("df_q_std")
+        self._df_q_std = df
+
+
+    def load_c(self, files, cache = False):
 
         """Loads / processes .csv files holding concentration over time data.
 
@@ -110,16 +253,20 @@ class Dataset:
         Parameters:
             files (list):
                 Path(s) of the .csv files.
+            cache (bool, optional):
+                If True, use the binary cache of the .csv files.
         """
 
         # load the files in Dataframes
-        self.df_c, self.df_c_std = load(files)
+        self.replicates_c = Replicates(files, cache = cache)
+        self.df_c, self.df_c_std = self.replicates_c.frames()
+        self.files_c = list(files)
 
         # initialize the species names
         self.names = [name for name in self.df_c.columns if name != "t"]
 
 
-    def load_q(self, files):
+    def load_q(self, files, cache = False):
 
         """Loads / processes .csv files holding charge passed over time data.
 
@@ -132,28 +279,400 @@ class Dataset:
         Relies on the load() function from this module, see also this
         function Docstring for more details.
 
+        The charge passed data can be long records: the runs stay
+        memory-mapped when loaded from the binary cache, df_q and
+        df_q_std being only calculated when first accessed (a single
+        run being used as is for df_q, without standard deviation).
+
         Parameters:
             files (list):
                 Paths of the .csv files.
+            cache (bool, optional):
+                If True, use the binary cache of the .csv files.
+        """
+
+        self.replicates_q = Replicates(files, cache = cache)
+        self.df_q = self.df_q_std = None
+        self._lazy_q = {"df_q", "df_q_std"}
+        self.files_q = list(files)
+        self.q_decimation = None
+
+
+    def decimate_q(self, n_points = 500, method = "adaptive", weights = False):
+
+        """Reduces the charge passed data to about n_points points.
+
+        The df_q and df_q_std DataFrames are replaced by their reduced
+        version, see the :func:`decimate` function; the reduced data are
+        then used by the fit functions. The reduction always starts
+        from the data loaded by load_q, it can therefore be repeated
+        with other parameters.
+
+        Parameters:
+            n_points|method|weights (optional):
+                See the :func:`decimate` function.
+        """
+
+        if self.replicates_q is None:
+            raise ValueError("no charge passed data to decimate")
+
+        self.q_decimation = dict(
+            n_points = n_points,
+            method = method,
+            weights = weights
+            )
+
+        df_q, df_q_std = self.replicates_q.frames()
+        self.df_q, self.df_q_std = decimate(df_q, df_q_std, **self.q_decimation)
+
+
+    def append(self, c = None, q = None, c_std = None, q_std = None):
+
+        """Appends new data points, e.g. as they arrive during a reaction.
+
+        The new rows are added to df_c and df_q (and to df_c_std and
+        df_q_std, with missing standard deviations if not given), sorted
+        by time. The new charge passed points have a weight of 1 if df_q
+        is decimated. The appended rows are not part of the replicates,
+        and are discarded by the load_c, load_q and decimate_q methods.
+
+        After appending data, the :func:`fit.refit_dataset` function
+        updates the fit starting from the previous fit results.
+
+        Parameters:
+            c (pandas.DataFrame, optional):
+                New concentrations, with the "t" and species columns of
+                df_c; missing species are missing values (nan).
+            q (pandas.DataFrame, optional):
+                New charge passed, with the "t" and "Q" columns.
+            c_std|q_std (pandas.DataFrame, optional):
+                Standard deviations of the new values, with the same
+                time values as c and q.
+        """
+
+        if c is not None:
+            self.df_c, self.df_c_std = _append_rows(
+                self.df_c, self.df_c_std, c, c_std
+                )
+
+        if q is not None:
+            if self.df_q is None:
+                raise ValueError(
+                    "no charge passed data to append to, use the load_q method"
+                    )
+            self.df_q, self.df_q_std = _append_rows(
+                self.df_q, self.df_q_std, q, q_std
+                )
+
+
+    def save(self, path):
+
+        """Saves the data, fit curves and fit results in a single file.
+
+        The file is a compressed numpy .npz archive holding the
+        DataFrames (df_c, df_c_std, df_c_fit, df_q, df_q_std, df_q_fit)
+        as arrays, the fitted and initial parameters (values, bounds,
+        vary, stderr), the covariance matrix and residuals of the fit,
+        and a JSON description of the rest (labels, species names,
+        files paths, fit statistics). Each part of the archive is read
+        separately, see the :func:`load_dataset` and :func:`catalogue`
+        functions. The individual runs (replicates_c, replicates_q) are
+        not saved, only the paths of their files.
+
+        The fit curves (fit_curves) cannot be saved, since they hold the
+        model functions: the df_c_fit and df_q_fit DataFrames built from
+        them are saved instead, the model being solved at this point if
+        these DataFrames were not built yet.
+
+        Parameters:
+            path (str):
+                Path of the file, the .npz extension is added if missing.
         """
 
-        self.df_q, self.df_q_std = load(files)
+        arrays = dict()
+        frames = dict()
+        for name in _FRAMES:
+            df = getattr(self, name, None)
+            if df is not None:
+                arrays[name] = df.to_numpy(dtype = float)
+                frames[name] = [str(column) for column in df.columns]
+
+        meta = dict(
+            version = FILE_VERSION,
+            t_label = self.t_label,
+            c_label = self.c_label,
+            q_label = self.q_label,
+            names = self.names,
+            files_c = self.files_c,
+            files_q = self.files_q,
+            q_decimation = self.q_decimation,
+            frames = frames,
+            params = None,
+            init_params = None,
+            result = None
+            )
+
+        # the parameters are stored as arrays, with their keys and expressions
+        # in the description
+        result = getattr(self, "fit_result", None)
+        if result is not None:
+            meta["params"], arrays["params"] = _params_arrays(result.params)
+            meta["result"] = {
+                name: _json_value(getattr(result, name, None))
+                for name in _RESULT_ATTRIBUTES
+                }
+            if getattr(result, "covar", None) is not None:
+                arrays["covar"] = np.asarray(result.covar, dtype = float)
+            if getattr(result, "residual", None) is not None:
+                arrays["residual"] = np.asarray(result.residual, dtype = float)
+
+        if self.init_params is not None:
+            meta["init_params"], arrays["init_params"] = _params_arrays(
+                self.init_params
+                )
+
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype = np.uint8)
+
+        np.savez_compressed(path, **arrays)
+
+
+def load_dataset(path, derivatives = None, c_to_q = None, solver = None, jac = None):
+
+    """Loads a dataset saved by the Dataset.save method.
 
+    The fit results are restored as an lmfit.MinimizerResult object
+    holding the parameters (values, bounds, stderr and correlations),
+    the covariance matrix, the residuals and the fit statistics, so that
+    e.g. the :func:`fit.print_result` function and the plotting functions
+    can be used without refitting.
 
-def load(files):
+    The saved df_c_fit and df_q_fit DataFrames are restored, but not the
+    fit curves (fit_curves is None) unless the model is given with
+    **derivatives**: the curves are then created for the fitted
+    parameters, and solved when first evaluated at other time values.
+
+    Parameters:
+        path (str):
+            Path of the .npz file.
+        derivatives|c_to_q|solver|jac (optional):
+            The model of the fit, see the :func:`fit.fit_dataset`
+            function, used to restore the fit curves.
+
+    Returns:
+        Dataset:
+            The dataset, without replicates.
+    """
+
+    with np.load(path) as archive:
+
+        meta = json.loads(archive["meta"].tobytes())
+        if meta["version"] > FILE_VERSION:
+            raise ValueError(
+                f"'{path}' was saved by a more recent version (file version" +
+                f" {meta['version']})"
+                )
+
+        dataset = Dataset(
+            t_label = meta["t_label"],
+            c_label = meta["c_label"],
+            q_label = meta["q_label"]
+            )
+        dataset.names = meta["names"]
+        dataset.files_c = meta["files_c"]
+        dataset.files_q = meta["files_q"]
+        dataset.q_decimation = meta["q_decimation"]
+
+        for name, columns in meta["frames"].items():
+            setattr(dataset, name, pd.DataFrame(archive[name], columns = columns))
+
+        if meta["init_params"] is not None:
+            dataset.init_params = _params_from_arrays(
+                meta["init_params"], archive["init_params"]
+                )
+
+        if meta["result"] is not None:
+            result = lmfit.minimizer.MinimizerResult(**meta["result"])
+            result.params = _params_from_arrays(meta["params"], archive["params"])
+            result.covar = archive["covar"] if "covar" in archive else None
+            result.residual = archive["residual"] if "residual" in archive else None
+            if result.covar is not None:
+                _set_correlations(result.params, result.var_names, result.covar)
+            dataset.fit_result = result
+
+    # the saved fit DataFrames are kept along with the restored curves
+    if derivatives is not None and dataset.fit_result is not None:
+        df_c_fit, df_q_fit = dataset.df_c_fit, dataset.df_q_fit
+        fit._store_fit(
+            dataset, derivatives, dataset.fit_result.params, c_to_q, solver, jac
+            )
+        dataset.df_c_fit, dataset.df_q_fit = df_c_fit, df_q_fit
+
+    return dataset
+
+
+def catalogue(paths):
+
+    """Tabulates the fitted parameters of datasets saved by Dataset.save.
+
+    Only the description and the parameters of each file are read, not
+    the data and fit curves, so that many files can be indexed quickly,
+    e.g. to select the fits to load with the :func:`load_dataset`
+    function:
+
+    >>> df = data.catalogue(glob.glob("fits/*.npz"))
+    >>> selected = df[(df["k1"] > 0.1) & df["success"]].index
+
+    Parameters:
+        paths (list):
+            Paths of the .npz files.
+
+    Returns:
+        pandas.DataFrame:
+            One row per file (indexed by path), with the value and the
+            standard deviation ("<name>_stderr") of each parameter, and
+            the "chisqr", "redchi", "nfev" and "success" of the fit. The
+            files without fit results have missing values.
+    """
+
+    rows = list()
+    for path in paths:
+        with np.load(path) as archive:
+            meta = json.loads(archive["meta"].tobytes())
+            row = dict(path = path)
+            if meta["params"] is not None:
+                values = archive["params"]
+                for key, (value, stderr) in zip(meta["params"]["keys"], values[:,:2]):
+                    row[key] = value
+                    row[f"{key}_stderr"] = stderr
+                for name in ("chisqr", "redchi", "nfev", "success"):
+                    row[name] = meta["result"][name]
+        rows.append(row)
+
+    return pd.DataFrame(rows).set_index("path")
+
+
+def _params_arrays(params):
+
+    """Converts lmfit.Parameters to a description and an array.
+
+    The array has shape (parameters, 5): value, stderr (nan if not
+    calculated), min, max and vary (0 or 1).
+    """
+
+    keys = list(params)
+    array = np.array(
+        [
+            [
+                params[key].value,
+                np.nan if params[key].stderr is None else params[key].stderr,
+                params[key].min,
+                params[key].max,
+                params[key].vary
+            ]
+            for key in keys
+        ],
+        dtype = float
+        ).reshape(-1, 5)
+
+    description = dict(
+        keys = keys,
+        expr = [params[key].expr for key in keys]
+        )
+
+    return description, array
+
+
+def _params_from_arrays(description, array):
+
+    """Converts the output of _params_arrays back to lmfit.Parameters."""
+
+    params = lmfit.Parameters()
+
+    for key, (value, stderr, p_min, p_max, vary) in zip(description["keys"], array):
+        params.add(key, value = value, min = p_min, max = p_max, vary = bool(vary))
+        params[key].stderr = None if np.isnan(stderr) else float(stderr)
+
+    # expressions are set once all the parameters are defined, the values
+    # being restored afterwards as setting an expression evaluates it
+    for key, expr in zip(description["keys"], description["expr"]):
+        if expr is not None:
+            params[key].expr = expr
+    for key, value in zip(description["keys"], array[:,0]):
+        params[key].value = value
+
+    return params
+
+
+def _set_correlations(params, var_names, covar):
+
+    """Sets the correl attribute of the varying parameters from covar."""
+
+    std = np.sqrt(np.abs(np.diag(covar)))
+    for i, name in enumerate(var_names):
+        if name not in params: continue
+        params[name].correl = {
+            other: float(covar[i, j]/(std[i]*std[j]))
+            for j, other in enumerate(var_names) if j != i
+            }
+
+
+def _json_value(value):
+
+    """Converts numpy scalars and arrays to values that can be written to JSON."""
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
+
+
+def _append_rows(df, df_std, rows, rows_std = None):
+
+    """Appends rows to the df and df_std DataFrames, see Dataset.append."""
+
+    rows = pd.DataFrame(rows).reindex(columns = df.columns)
+
+    # rows appended to decimated data have a weight of 1
+    if "weight" in df:
+        rows["weight"] = rows["weight"].fillna(1.0)
+
+    if rows_std is None:
+        rows_std = pd.DataFrame({"t": rows["t"]})
+    rows_std = pd.DataFrame(rows_std).reindex(columns = df_std.columns)
+    rows_std["t"] = rows["t"].to_numpy()
+
+    # sort by time, keeping the order of rows with the same time value
+    df = pd.concat([df, rows], ignore_index = True)
+    df_std = pd.concat([df_std, rows_std], ignore_index = True)
+    order = np.argsort(df["t"].to_numpy(), kind = "stable")
+
+    return (
+        df.iloc[order].reset_index(drop = True),
+        df_std.iloc[order].reset_index(drop = True)
+        )
+
+
+def load(files, t = None, cache = False):
     """Loads and processes data from .csv files, stores it in Dataframes.
 
-    The .csv files should have the same headers, the same number of
-    columns and the same number of rows. The header should be held in
-    the first row.
+    The .csv files should have the same headers, the header should be
+    held in the first row and the first column should be the time. Each
+    file holds a run of the experiment, the runs are aligned on a common
+    time axis (see the :class:`Replicates` class) and averaged.
 
     These .csv files are typically generated from raw data files from
     experiments using custom code to satisfy these requirements.
 
     Parameters:
         files (list):
-            Path(s) to the file(s), each column in each file must have
-            the same number of rows.
+            Path(s) to the file(s).
+        t (list, optional):
+            Common time axis, see the :class:`Replicates` class.
+        cache (bool, optional):
+            If True, use the binary cache of the .csv files, see the
+            :func:`read` function.
 
     Returns:
         pandas.DataFrame, pandas.DataFrame:
@@ -161,13 +680,514 @@ def load(files):
 
     """
 
-    # load files in a list of DataFrames
-    dfs = [pd.read_csv(fr"{file}") for file in files]
+    return Replicates(files, t, cache).frames()
 
-    # concatenate DataFrames along their rows and merge the rows with same
-    # index by calculating their average or their standard deviation
-    df_concat = pd.concat(dfs)
-    df = df_concat.groupby(level=0).mean()
-    df_std = df_concat.groupby(level=0).std()
-    
-    return df, df_std
\ No newline at end of file
+
+class Replicates:
+
+    """Holds the runs of an experiment aligned on a common time axis.
+
+    Each .csv file holds a run, its first column being the time "t" and
+    the other columns the measured values, with the same headers in all
+    the files. The values of all the runs can be seen as a single array
+    with shape (runs, time, columns):
+
+    - if all the runs have the same time values, they are used as the
+      common time axis;
+    - otherwise the values of each run are linearly interpolated on the
+      common time axis, which is **t** if given or else the time values
+      of the first run. The values outside of the time range of a run
+      are missing (nan).
+
+    The runs are kept separately, as memory-mapped arrays when they are
+    loaded from the binary cache and not interpolated. The mean,
+    standard deviation, mask and the (runs, time, columns) array are
+    only calculated when first needed, the mean and standard deviation
+    being accumulated run by run: only one run at a time is then read
+    from the disk, but all of them are read (the :meth:`Dataset.load_c`
+    method calculates the mean and standard deviation right away). A
+    single run is its own mean, it is then not read.
+
+    Parameters:
+        files (list):
+            Path(s) to the .csv file(s).
+        t (list, optional):
+            Common time axis.
+        cache (bool, optional):
+            If True, use the binary cache of the .csv files, see the
+            :func:`read` function.
+
+    Attributes:
+        files (list):
+            Path(s) to the .csv file(s).
+        columns (list):
+            Names of the measured values (without "t").
+        t (numpy.ndarray):
+            Common time axis.
+        runs (list):
+            Values of each run with shape (time, columns).
+        interpolated (bool):
+            True if the runs were interpolated on the common time axis.
+    """
+
+    def __init__(self, files, t = None, cache = False):
+        """ Class constructor """
+
+        self.files = list(files)
+
+        tables = [read(file, cache) for file in self.files]
+
+        names = tables[0][0]
+        self.columns = [name for name in names if name != "t"]
+        for file, (names_run, _) in zip(self.files, tables):
+            if sorted(names_run) != sorted(names):
+                raise ValueError(
+                    f"the columns of '{file}' differ from the columns of" +
+                    f" '{self.files[0]}'"
+                    )
+
+        times = [_columns(table, names_run, ["t"])[:,0] for names_run, table in tables]
+        values = [_columns(table, names_run, self.columns) for names_run, table in tables]
+
+        same_times = all(
+            len(t_run) == len(times[0]) and np.array_equal(t_run, times[0])
+            for t_run in times
+            )
+
+        if t is None and same_times:
+            self.t = times[0]
+            self.runs = values
+            self.interpolated = False
+        else:
+            self.t = times[0] if t is None else np.asarray(t, dtype = float)
+            self.runs = [
+                _interpolate(self.t, t_run, v) for t_run, v in zip(times, values)
+                ]
+            self.interpolated = True
+
+        # lazily calculated attributes, see the corresponding properties
+        self._values = None
+        self._mean = None
+        self._std = None
+        self._mask = None
+
+
+    def __len__(self):
+
+        return len(self.runs)
+
+
+    @property
+    def values(self):
+
+        """Values of all the runs with shape (runs, time, columns)."""
+
+        if self._values is None:
+            self._values = np.stack(self.runs)
+
+        return self._values
+
+
+    @property
+    def mask(self):
+
+        """Boolean array with shape (runs, time, columns), True for the data."""
+
+        if self._mask is None:
+            self._mask = np.isfinite(self.values)
+
+        return self._mask
+
+
+    @property
+    def mean(self):
+
+        """Mean of the runs with shape (time, columns), ignoring missing data."""
+
+        if self._mean is None:
+            self._mean, self._std = _moments(self.runs)
+
+        return self._mean
+
+
+    @property
+    def std(self):
+
+        """Sample standard deviation of the runs with shape (time, columns)."""
+
+        if self._std is None:
+            self._mean, self._std = _moments(self.runs)
+
+        return self._std
+
+
+    def frames(self, runs = None):
+
+        """Returns the mean and standard deviation of the runs as DataFrames.
+
+        Parameters:
+            runs (list, optional):
+                Index of the runs to be averaged, a run can be repeated
+                to weight it (e.g. to resample the runs). If None all
+                the runs are used.
+
+        Returns:
+            pandas.DataFrame, pandas.DataFrame:
+                Averages DataFrame and standard deviation DataFrame,
+                with the time values in their "t" column.
+        """
+
+        if runs is None:
+            mean, std = self.mean, self.std
+        else:
+            weights = np.bincount(
+                np.asarray(runs, dtype = int),
+                minlength = len(self.runs)
+                )
+            mean, std = _moments(self.runs, weights)
+
+        return self._frame(mean), self._frame(std)
+
+
+    def _frame(self, array):
+
+        """DataFrame of an array with shape (time, columns) and the time values."""
+
+        # not copied, e.g. a memory-mapped single run
+        df = pd.DataFrame(array, columns = self.columns, copy = False)
+        df.insert(0, "t", self.t)
+
+        return df
+
+
+def read(file, cache = False, cache_dir = None):
+
+    """Reads a .csv file, optionally through a binary cache.
+
+    With the cache, the .csv file is parsed a single time and its
+    columns are stored in a .npy file, along with a .json file holding
+    the columns names and the identification of the .csv file: path,
+    modification time, size and SHA-1 hash of its content. The following
+    reads memory-map the .npy file instead of parsing the .csv file: the
+    values are read from the disk when they are used (e.g. once, run by
+    run, when the :class:`Replicates` mean and standard deviation are
+    calculated) rather than copied in memory. The cache is rebuilt if
+    the .csv file is modified: a file with a different modification
+    time but the same size and content (e.g. copied) keeps its cache.
+
+    The cache files are written to temporary files then renamed, the
+    .npy file first, so that a concurrent read or an interrupted write
+    never sees a partial cache.
+
+    Parameters:
+        file (str):
+            Path of the .csv file.
+        cache (bool, optional):
+            If True, use the binary cache.
+        cache_dir (str, optional):
+            Directory of the cache files, by default the CACHE_DIR
+            variable of this module.
+
+    Returns:
+        list, numpy.ndarray:
+            The columns names and the values with shape (rows, columns),
+            memory-mapped with the cache (a read-only view of the
+            columnar .npy array).
+    """
+
+    if not cache:
+        df = pd.read_csv(fr"{file}")
+        return list(df.columns), df.to_numpy(dtype = float)
+
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+
+    # the cache files are named after the absolute path of the .csv file
+    path = os.path.abspath(file)
+    name = hashlib.sha1(path.encode()).hexdigest()
+    npy_file = os.path.join(cache_dir, name + ".npy")
+    json_file = os.path.join(cache_dir, name + ".json")
+
+    stat = os.stat(path)
+    info = None
+    if os.path.exists(npy_file) and os.path.exists(json_file):
+        with open(json_file) as f:
+            info = json.load(f)
+
+    # check that the cache matches the .csv file, first from its modification
+    # time and size, then from its content if only the time changed
+    valid = (
+        info is not None and
+        info["size"] == stat.st_size and (
+            info["mtime_ns"] == stat.st_mtime_ns or
+            info["sha1"] == _file_hash(path)
+            )
+        )
+
+    if not valid:
+        df = pd.read_csv(path)
+        info = dict(
+            path = path,
+            mtime_ns = stat.st_mtime_ns,
+            size = stat.st_size,
+            sha1 = _file_hash(path),
+            columns = list(df.columns)
+            )
+        os.makedirs(cache_dir, exist_ok = True)
+        # columnar storage: each column is contiguous in the file
+        array = np.ascontiguousarray(df.to_numpy(dtype = float).T)
+        _write_atomic(npy_file, lambda f: np.save(f, array))
+        _write_atomic(json_file, lambda f: f.write(json.dumps(info).encode()))
+    elif info["mtime_ns"] != stat.st_mtime_ns:
+        info["mtime_ns"] = stat.st_mtime_ns
+        _write_atomic(json_file, lambda f: f.write(json.dumps(info).encode()))
+
+    return info["columns"], np.load(npy_file, mmap_mode = "r").T
+
+
+def decimate(df, df_std = None, n_points = 500, method = "adaptive", weights = False):
+
+    """Reduces dense data to about n_points points by averaging bins of points.
+
+    The data are split in consecutive time bins and each bin is replaced
+    by the average time and values of its points. With the "uniform"
+    method the bins have the same duration. With the "adaptive" method
+    the bins are narrower where the data vary quickly: the bins edges
+    are placed at regular intervals of a coordinate mixing the time and
+    the length of the data curve (both normalized), calculated on a
+    finer uniform binning to average out the noise. Empty bins are
+    removed.
+
+    The standard deviations are propagated as their root mean square
+    over each bin, not divided by the square root of the number of
+    points: the errors of neighbouring points of a trace are strongly
+    correlated (they mostly come from the spread between the runs), so
+    that a bin is not more certain than any of its points. Consistently,
+    by default each bin counts as a single point in the fit, and the
+    reduced trace only has n_points points: it no longer outweighs the
+    sparse concentrations data by the number of its original points.
+
+    With weights=True each point of the reduced data instead carries the
+    number of data points it replaces as its weight (column "weight"),
+    the residuals of the fit functions being multiplied by the square
+    root of the weights. The chi-square of the reduced data then
+    approximates the chi-square of the full data, i.e. the points of a
+    bin are counted as independent measurements, each with the root mean
+    square standard deviation.
+
+    Parameters:
+        df (pandas.DataFrame):
+            Data with the time in its "t" column, sorted by time.
+        df_std (pandas.DataFrame, optional):
+            Standard deviations of the data.
+        n_points (int, optional):
+            Number of bins.
+        method (str, optional):
+            Either "adaptive" or "uniform", see above.
+        weights (bool, optional):
+            If True the "weight" column is added, see above. By default
+            all the points of the reduced data have the same weight in
+            the fit.
+
+    Returns:
+        pandas.DataFrame, pandas.DataFrame:
+            The reduced data and standard deviations (None if df_std is
+            None).
+    """
+
+    t = df["t"].to_numpy(dtype = float)
+    columns = [name for name in df.columns if name not in ("t", "weight")]
+    values = df[columns].to_numpy(dtype = float)
+
+
+    ############################################################################
+    # bins edges
+    ############################################################################
+
+    if method == "uniform":
+        edges = np.linspace(t[0], t[-1], n_points + 1)
+    elif method == "adaptive":
+        # average the data on a finer uniform binning, then measure the length
+        # of the resulting curve with the time and the values normalized
+        fine_edges = np.linspace(t[0], t[-1], 10*n_points + 1)
+        fine_t, fine_values, _ = _bin_means(t, values, fine_edges)
+        curve = [fine_t] + [
+            fine_values[:,j] for j in range(fine_values.shape[1])
+            ]
+        length = np.zeros(len(fine_t))
+        for x in curve:
+            span = np.nanmax(x) - np.nanmin(x)
+            dx = np.diff(x)/span if span > 0 else np.zeros(len(x) - 1)
+            length[1:] += np.nan_to_num(dx)**2
+        length = np.concatenate([[0], np.cumsum(np.sqrt(length[1:]))])
+
+        # half of the bins follow the curve length, half the time, so that
+        # flat parts of the data keep some points
+        coordinate = 0.5*length/length[-1] if length[-1] > 0 else 0*length
+        coordinate += 0.5*(fine_t - fine_t[0])/(fine_t[-1] - fine_t[0])
+        coordinate[-1] = 1
+        edges = np.interp(
+            np.linspace(0, 1, n_points + 1),
+            coordinate,
+            fine_t
+            )
+        edges[0], edges[-1] = t[0], t[-1]
+    else:
+        raise ValueError(f"unknown decimation method: '{method}'")
+
+
+    ############################################################################
+    # averages of the bins
+    ############################################################################
+
+    t_bins, value_bins, counts = _bin_means(t, values, edges)
+
+    df_reduced = pd.DataFrame(value_bins, columns = columns)
+    df_reduced.insert(0, "t", t_bins)
+    if weights:
+        df_reduced["weight"] = counts
+
+    if df_std is None:
+        return df_reduced, None
+
+    std = df_std[columns].to_numpy(dtype = float)
+    _, variance_bins, _ = _bin_means(t, std**2, edges)
+    df_std_reduced = pd.DataFrame(np.sqrt(variance_bins), columns = columns)
+    df_std_reduced.insert(0, "t", t_bins)
+
+    return df_reduced, df_std_reduced
+
+
+def _bin_means(t, values, edges):
+
+    """Mean time and values of the points in each bin, empty bins removed.
+
+    The missing values (nan) are ignored, the counts are the number of
+    points in each bin.
+    """
+
+    index = np.searchsorted(edges, t, side = "right") - 1
+    index = index.clip(0, len(edges) - 2)
+    n_bins = len(edges) - 1
+
+    counts = np.bincount(index, minlength = n_bins)
+    t_means = np.bincount(index, weights = t, minlength = n_bins)
+
+    means = np.empty((n_bins, values.shape[1]))
+    for j in range(values.shape[1]):
+        finite = np.isfinite(values[:,j])
+        total = np.bincount(index[finite], weights = values[finite,j], minlength = n_bins)
+        count = np.bincount(index[finite], minlength = n_bins)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            means[:,j] = np.where(count > 0, total/count, np.nan)
+
+    kept = counts > 0
+
+    return t_means[kept]/counts[kept], means[kept], counts[kept]
+
+
+def _file_hash(path):
+
+    """SHA-1 hash of the content of a file."""
+
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+
+def _write_atomic(file, write):
+
+    """Writes a file with write(f) on a temporary file, then renames it."""
+
+    fd, temp_file = tempfile.mkstemp(
+        dir = os.path.dirname(file), prefix = ".", suffix = ".tmp"
+        )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(temp_file, file)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+
+def _columns(table, names, columns):
+
+    """Selects columns of table, as a view if they are consecutive."""
+
+    index = [names.index(name) for name in columns]
+
+    if index == list(range(index[0], index[0] + len(index))):
+        return table[:,index[0]:index[0] + len(index)]
+
+    return table[:,index]
+
+
+def _interpolate(t, t_run, values):
+
+    """Interpolates the values of a run on t, nan outside of the run range."""
+
+    order = np.argsort(t_run)
+    t_run, values = t_run[order], values[order]
+
+    result = np.full((len(t), values.shape[1]), np.nan)
+    for j in range(values.shape[1]):
+        valid = np.isfinite(values[:,j])
+        if valid.sum() == 0:
+            continue
+        t_valid = t_run[valid]
+        inside = (t >= t_valid[0]) & (t <= t_valid[-1])
+        result[inside,j] = np.interp(t[inside], t_valid, values[valid,j])
+
+    return result
+
+
+def _moments(runs, weights = None):
+
+    """Mean and sample standard deviation of the runs, ignoring missing data.
+
+    The runs are accumulated one by one, a run being counted weights[i]
+    times, so that the (runs, time, columns) array is not needed. The
+    values are nan where less than 1 (mean) or 2 (standard deviation)
+    values are available, as with pandas.
+    """
+
+    if weights is None:
+        # a single run is its own mean, without standard deviation
+        if len(runs) == 1:
+            return runs[0], np.full(runs[0].shape, np.nan)
+        weights = np.ones(len(runs), dtype = int)
+
+    used = [(run, w) for run, w in zip(runs, weights) if w > 0]
+
+    # runs without missing data (the usual case) are summed directly
+    complete = [bool(np.isfinite(run).all()) for run, w in used]
+
+    total = np.zeros(runs[0].shape)
+    count = np.zeros(runs[0].shape)
+    for (run, w), full in zip(used, complete):
+        if full:
+            total += w*run
+            count += w
+        else:
+            finite = np.isfinite(run)
+            total += w*np.where(finite, run, 0)
+            count += w*finite
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        mean = np.where(count > 0, total/count, np.nan)
+
+    squares = np.zeros(runs[0].shape)
+    for (run, w), full in zip(used, complete):
+        deviation = run - mean
+        if not full:
+            deviation[~np.isfinite(run)] = 0
+        squares += w*deviation**2
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        std = np.where(count > 1, np.sqrt(squares/(count - 1)), np.nan)
+
+    return mean, std
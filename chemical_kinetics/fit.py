@@ -2,201 +2,2228 @@
 This module defines a set of functions used to fit the species
 concentrations evolution over time and optionally the charge passed
 evolution over time, stored in an object of Dataset class. This fit
-proceeds via the :func:`fit_dataset` function that uses the functions
-:func:`residuals`, :func:`calculate_residuals` and :func:`evaluate`.
+proceeds via the :func:`fit_dataset` function that compiles the data to
+be fitted into a :class:`problem.FitProblem` object, which calculates the
+residuals from the model evaluations of the :func:`evaluate` function.
+Optionally the Jacobian of the residuals can be computed from the forward
+sensitivity equations of the model, see the :func:`evaluate_sensitivities`
+function.
+The functions :func:`residuals` and :func:`jacobian` calculate the same
+values directly from the data DataFrames.
+
+When new data points are appended to a fitted dataset (see
+data.Dataset.append), the :func:`refit_dataset` function updates the fit
+starting from the previous fit results, and only integrates the model
+over the new time interval for the previous best fit parameters.
+
+To avoid getting stuck in a local minimum, the :func:`fit_dataset_multistart`
+function repeats the fit from starting points sampled within the parameters
+bounds and keeps the best fit.
+
+Several datasets, e.g. the same reaction monitored in different
+conditions, can be fitted together with the :func:`fit_datasets`
+function, some parameters being shared between the datasets and others
+being specific to each dataset.
 
 After the fit is performed the :func:`print_result` function can be used to
 print the fit parameters initial values and setup (min, max, vary) and
 their fitted values and standard deviations.
 
-The function :func:`evaluate` can be used to get values from a kinetic model
-outside of the scope of fitting data, e.g. to test the influence of
-model parameters on the concentrations evolution over time.
-"""
+The function :func:`evaluate` can be used to get values from a kinetic model
+outside of the scope of fitting data, e.g. to test the influence of
+model parameters on the concentrations evolution over time. The function
+:func:`evaluate_batch` evaluates a model for many sets of parameters at
+once, e.g. for parameter scans or uncertainty propagation.
+
+When the charge passed is fitted, the model is solved once per residuals
+calculation on the time values of both the concentration and the charge
+passed data, merged by the :func:`merge_times` function. The charge passed
+is an :class:`Observable` of the concentrations, calculated in a single
+vectorised call on the model solution along with its derivatives with
+respect to the parameters; a :class:`LinearObservable` declares it by the
+charge passed per unit of concentration of each species.
+
+The models are integrated by scipy.integrate.odeint by default, the
+**solver** parameter of these functions can be used to select one of the
+scipy.integrate.solve_ivp methods instead (e.g. the stiff solvers "BDF" and
+"Radau"), to set the tolerances and to pass a Jacobian sparsity pattern.
+
+To find where the time of a slow fit goes, :func:`fit_dataset` can record
+a :class:`profiling.FitProfile` of the fit (calls and time of the derivatives
+function, of the integrator, of the residuals and Jacobian assembly, and
+the convergence of the fit), attached to dataset.fit_result.
+
+Repeated evaluations of a model with the same parameters, e.g. when
+rebuilding the fit curves after a fit, can be avoided by enabling a cache
+of the evaluations with the :func:`cache.enable_cache` function.
+
+Linear models, i.e. networks of first order reactions dy/dt = K.y, can be
+described by a :class:`LinearModel` object used as the derivatives
+function, these models are then solved in closed form from the
+eigendecomposition of the rate matrix K instead of being integrated.
+
+Models reduced by the reduction module (e.g. with their conservation laws)
+are also used as the derivatives function, only their reduced system is
+then integrated.
+"""
+
+
+from scipy.integrate import odeint, solve_ivp
+from scipy.stats import qmc
+import scipy.sparse
+import concurrent.futures
+import functools
+import itertools
+import time
+import warnings
+import pandas as pd
+import numpy as np
+import lmfit
+
+from .cache import enabled_cache
+
+
+def fit_dataset(
+    dataset,
+    derivatives,
+    parameters,
+    c0 = {},
+    c0_untracked = {},
+    c_to_q = None,
+    sensitivities = False,
+    jac = None,
+    jac_p = None,
+    solver = None,
+    profile = False,
+    timeout = None
+    ):
+
+    """Fit a dataset holding concentration vs t data and optionally charge vs t.
+    
+    The parameters **parameters**, **c0** and **c0_untracked** are dictionaries
+    in which each value is a dictionary of the parameters to use in order
+    to initialize objects of the lmfit.Parameter class. The parameters
+    that can be passed via this dictionary are in particular: value,
+    vary, min, max and expr. Details on the Parameter class can be found
+    here: https://lmfit.github.io/lmfit-py/parameters.html
+
+    Parameters:
+        dataset (chemical_kinetics.data.Dataset):
+            Object holding the different DataFrames containing the data
+            to be fitted.
+        derivatives (function):
+            A function in the form dy = f(y, t, p) used to compute
+            d(concentration)/dt at a time t for each species. Used by
+            scipy.integrate.odeint by default
+        parameters (dict):
+            Stores parameter names (str): parameters (dict) (e.g. value,
+            min, max, vary) to be passed to the corresponding
+            lmfit.Parameter. Represents all the parameters of the
+            kinetic model.
+        c0 (dict, optional):
+            Stores species name (str): parameters (dict) (e.g. value,
+            min, max, vary) to be passed to the corresponding
+            lmfit.Parameter. Represent the concentrations at initial
+            time for the species whose concentration evolution over time
+            is stored in dataset.df_c.
+        c0_untracked (collections.OrderedDict, optional):
+            Stores species name (str): parameters (dict) (e.g. value,
+            min, max, vary) to be passed to the corresponding
+            lmfit.Parameter. Represent concentrations at initial time
+            for the species whose concentrations evolution over time is
+            NOT stored in dataset.df_c. An ordered dictionary is
+            necessary in this case to be able to pass parameters properly
+            to the scipy.integrate.odeint solver.
+        c_to_q (function or Observable, optional):
+            Used to convert the concentrations over time evolution into
+            charge passed, e.g. a :class:`LinearObservable`. A function
+            is converted by the :func:`as_observable` function.
+        sensitivities (bool, optional):
+            If True, the Jacobian of the residuals is calculated by the
+            :func:`jacobian` function, i.e. by solving the model together
+            with its forward sensitivity equations, and is passed to
+            lmfit.minimize. Else (default) the Jacobian is estimated by
+            lmfit.minimize using finite differences, which requires one
+            additional solution of the model per varying parameter.
+            When the charge passed is fitted, c_to_q is assumed to be
+            linear in the concentrations, unless it is an
+            :class:`Observable` with a jac function.
+        jac (function, optional):
+            A function in the form J = f(y, t, p) returning the
+            d(derivatives)/d(concentration) matrix, J[i, j] being the
+            derivative of the species i derivative with respect to the
+            concentration of species j. Used by the implicit integrators
+            and, if **sensitivities** is True, by the sensitivity
+            equations. If not given this matrix is estimated by finite
+            differences of the derivatives function.
+        jac_p (function, optional):
+            A function in the form dp = f(y, t, p) returning a
+            dictionary of parameter name (str): d(derivatives)/d(parameter)
+            (numpy.ndarray). Only used if **sensitivities** is True,
+            parameters missing from this dictionary are estimated by
+            finite differences of the derivatives function.
+        solver (dict, optional):
+            Integrator options, see the :func:`evaluate` function.
+        profile (bool, optional):
+            If True, the calls and time of the derivatives function, of
+            the integrator and of the residuals and Jacobian assembly are
+            recorded for each evaluation, along with the convergence of
+            the fit. The :class:`profiling.FitProfile` object is stored as
+            dataset.fit_result.profile.
+        timeout (float, optional):
+            Wall time limit in seconds of the fit. It is checked between
+            the model evaluations, a fit past it is aborted: its result
+            has "aborted" and "timed_out" attributes set to True and no
+            fit statistics (e.g. chisqr), and the fit curves of the
+            dataset are removed instead of being evaluated. The fits
+            aborted by lmfit (e.g. after its maximum number of function
+            evaluations) keep their fit curves, "timed_out" being False.
+
+    Returns:
+        lmfit.MinimizerResult:
+            The result of the fit, also stored as dataset.fit_result.
+    """
+
+    ############################################################################
+    # create the lmfit.Parameters object with all parameters from the
+    # **parameters**, **c0** and **c0_untracked** variables
+    ############################################################################
+
+    params = make_parameters(dataset, parameters, c0, c0_untracked)
+
+    # the Jacobian calculated from the sensitivity equations does not account
+    # for constrained parameters, so these are not supported in that case
+    if sensitivities and any(params[key].expr for key in params):
+        raise ValueError(
+            "parameters constrained by an expression cannot be fitted" +
+            " with sensitivities = True"
+            )
+
+    # store these parameters, used in the print_result function
+    dataset.init_params = params
+
+
+    ############################################################################
+    # perform the fit
+    ############################################################################
+
+    # the derivatives function and the model Jacobian are wrapped to count and
+    # time their calls if the fit is profiled
+    if profile:
+        from .profiling import FitProfile
+        profile = FitProfile()
+        problem = _compile_problem(
+            dataset, profile.wrap_rhs(derivatives), params, c_to_q, solver,
+            profile.wrap_jac(jac), jac_p
+            )
+        problem.profile = profile
+    else:
+        problem = _compile_problem(
+            dataset, derivatives, params, c_to_q, solver, jac, jac_p
+            )
+
+    # the fit is aborted by the iteration callback past the time limit
+    iter_cb = None
+    if timeout is not None:
+        deadline = time.time() + timeout
+        iter_cb = functools.partial(_past_deadline, deadline)
+
+    result = _minimize(problem, params, sensitivities, iter_cb = iter_cb)
+
+    result.timed_out = bool(
+        result.aborted and timeout is not None and time.time() > deadline
+        )
+
+    if profile:
+        profile.stop()
+        result.profile = profile
+
+    print(result.message)
+
+
+    ############################################################################
+    # store the fit results in dataset
+    ############################################################################
+
+    # store the lmfit.MinimizerResult object, and the compiled problem holding
+    # the last model evaluation used by refit_dataset
+    dataset.fit_result = result
+    dataset.fit_problem = problem
+
+    # store the evaluations from the best fit, the curves of a previous fit
+    # are discarded if the fit was aborted at the time limit
+    if result.timed_out:
+        dataset.fit_curves = None
+        dataset.df_c_fit = None
+        dataset.df_q_fit = None
+    else:
+        _store_fit(dataset, derivatives, result.params, c_to_q, solver, jac)
+
+    return result
+
+
+def refit_dataset(
+    dataset,
+    derivatives,
+    c_to_q = None,
+    sensitivities = False,
+    jac = None,
+    jac_p = None,
+    solver = None
+    ):
+
+    """Updates the fit of a dataset after new data points were appended.
+
+    The fit is warm started from the parameters of the previous fit
+    (dataset.fit_result.params), with the same bounds and varying
+    parameters, instead of the initial guesses. In addition, the model
+    evaluation of the previous fit at its best fit parameters is kept
+    (see dataset.fit_problem): when the new data points come after the
+    previous ones, the model is evaluated for these parameters by only
+    integrating it from the last previous time value over the new time
+    values. Near the previous best fit, the minimizer then converges in
+    a few iterations.
+
+    Typical use, each time new samples arrive:
+
+    >>> dataset.append(c = new_c, q = new_q)
+    >>> result = fit.refit_dataset(dataset, derivatives, c_to_q)
+
+    Parameters:
+        dataset (chemical_kinetics.data.Dataset):
+            Object holding the data, fitted by the :func:`fit_dataset`
+            function before new data were appended.
+        derivatives|c_to_q|sensitivities|jac|jac_p|solver:
+            See the :func:`fit_dataset` function, these should be the
+            same as for the previous fit.
+
+    Returns:
+        lmfit.MinimizerResult:
+            The result of the fit, also stored as dataset.fit_result.
+    """
+
+    previous = getattr(dataset, "fit_result", None)
+    if previous is None:
+        raise ValueError(
+            "the dataset has not been fitted, use the fit_dataset function"
+            )
+
+    # start from the previous best fit parameters, the initial parameters
+    # are kept for the print_result function
+    params = previous.params.copy()
+
+
+    ############################################################################
+    # perform the fit
+    ############################################################################
+
+    problem = _compile_problem(
+        dataset, derivatives, params, c_to_q, solver, jac, jac_p
+        )
+
+    # reuse the previous evaluation if it was calculated with the same model
+    # and parameters layout
+    last = getattr(dataset, "fit_problem", None)
+    if (
+        last is not None and last.solution is not None and
+        last.keys == problem.keys and
+        getattr(last.derivatives, "__wrapped__", last.derivatives) is derivatives
+        ):
+        problem.seed(last.t, *last.solution)
+
+    result = _minimize(problem, params, sensitivities)
+
+    print(result.message)
+
+
+    ############################################################################
+    # store the fit results in dataset
+    ############################################################################
+
+    dataset.fit_result = result
+    dataset.fit_problem = problem
+
+    _store_fit(dataset, derivatives, result.params, c_to_q, solver, jac)
+
+    return result
+
+
+def fit_datasets(
+    datasets,
+    derivatives,
+    parameters,
+    c0 = {},
+    c0_untracked = {},
+    c_to_q = None,
+    local = [],
+    sensitivities = False,
+    jac = None,
+    jac_p = None,
+    solver = None,
+    processes = None
+    ):
+
+    """Fit several datasets together with shared and per-dataset parameters.
+
+    The parameters are the same as for the :func:`fit_dataset` function,
+    the parameters from **c0** and **c0_untracked** (initial
+    concentrations) and the parameters from **parameters** whose names
+    are in **local** (e.g. scale factors) are specific to each dataset,
+    the other parameters (e.g. rate constants) are shared by all the
+    datasets. The specific parameters of the dataset number i are named
+    after the corresponding parameter with the suffix "_d{i}", e.g.
+    "c0_HMF_d0".
+
+    All the datasets are fitted with a single minimization: the
+    residuals (and the Jacobian if **sensitivities** is True) of the
+    datasets are concatenated. The models of the different datasets can
+    be solved in parallel by a pool of **processes**, in that case
+    derivatives and c_to_q must be defined in a module or in the main
+    script so that they can be passed to the processes.
+
+    After the fit each dataset stores the result of the global fit in
+    its fit_result and init_params attributes, and the evaluation of the
+    model with its own parameters in its df_c_fit and df_q_fit
+    attributes.
+
+    Parameters:
+        datasets (list):
+            The chemical_kinetics.data.Dataset objects to be fitted.
+        derivatives|parameters|c0|c0_untracked|c_to_q (optional):
+            See the :func:`fit_dataset` function.
+        local (list, optional):
+            Names of the parameters from **parameters** that are
+            specific to each dataset.
+        sensitivities|jac|jac_p|solver (optional):
+            See the :func:`fit_dataset` function.
+        processes (int, optional):
+            Number of processes used to solve the models of the
+            different datasets, if None or 1 they are solved one after
+            the other in the current process.
+
+    Returns:
+        lmfit.MinimizerResult:
+            The result of the global fit.
+    """
+
+
+    ############################################################################
+    # create the global lmfit.Parameters object from the parameters of each
+    # dataset
+    ############################################################################
+
+    params = lmfit.Parameters()
+    problem = list()
+
+    for i, dataset in enumerate(datasets):
+
+        # parameters of this dataset, updated from the global parameters before
+        # each evaluation of its model
+        dataset_params = make_parameters(dataset, parameters, c0, c0_untracked)
+
+        # name of each parameter of this dataset in the global parameters
+        keys = dict()
+        for key, param in dataset_params.items():
+            if "c0_" in key or key in local:
+                keys[key] = f"{key}_d{i}"
+                if param.expr:
+                    raise ValueError(
+                        f"parameter '{key}' is specific to each dataset and" +
+                        " cannot be constrained by an expression"
+                        )
+            else:
+                keys[key] = key
+            if keys[key] not in params:
+                params.add(
+                    keys[key],
+                    value = param.value,
+                    vary = param.vary,
+                    min = param.min,
+                    max = param.max,
+                    expr = param.expr
+                    )
+
+        # same problem as fitted by fit_dataset for a single dataset
+        problem.append(dict(
+            params = dataset_params,
+            keys = keys,
+            problem = _compile_problem(
+                dataset, derivatives, dataset_params, c_to_q, solver, jac, jac_p
+                )
+            ))
+
+    # see fit_dataset
+    if sensitivities and any(params[key].expr for key in params):
+        raise ValueError(
+            "parameters constrained by an expression cannot be fitted" +
+            " with sensitivities = True"
+            )
+
+    init_params = params.copy()
+
+
+    ############################################################################
+    # perform the fit
+    ############################################################################
+
+    if processes is not None and processes > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers = processes,
+            initializer = _init_worker,
+            initargs = (problem,)
+            )
+    else:
+        executor = None
+
+    try:
+        result = lmfit.minimize(
+            global_residuals,
+            params,
+            args = [problem, executor],
+            nan_policy='omit',
+            Dfun = global_jacobian if sensitivities else None
+            )
+    finally:
+        if executor is not None: executor.shutdown()
+
+    print(result.message)
+
+
+    ############################################################################
+    # store the fit results in the datasets
+    ############################################################################
+
+    for dataset, entry in zip(datasets, problem):
+        dataset.fit_result = result
+        dataset.init_params = init_params
+        dataset_params = _update_dataset_params(entry, result.params)
+        _store_fit(dataset, derivatives, dataset_params, c_to_q, solver, jac)
+
+    return result
+
+
+def global_residuals(params, problem, executor = None):
+
+    """Calculates the concatenated residuals of several datasets.
+
+    Used by the :func:`fit_datasets` function.
+
+    Parameters:
+        params (lmfit.parameter.Parameters):
+            The global parameters.
+        problem (list):
+            For each dataset a dictionary holding its parameters
+            ("params"), the name of each of these parameters in the
+            global parameters ("keys") and its
+            :class:`problem.FitProblem` object ("problem").
+        executor (concurrent.futures.Executor, optional):
+            Used to calculate the residuals of the datasets in parallel,
+            its processes must be initialized with the same problem.
+
+    Returns:
+        numpy.ndarray:
+            Residuals values.
+    """
+
+    values = {key: params[key].value for key in params}
+
+    if executor is None:
+        res = [_dataset_residuals(entry, values) for entry in problem]
+    else:
+        res = executor.map(
+            _worker_residuals,
+            range(len(problem)),
+            itertools.repeat(values)
+            )
+
+    return np.concatenate(list(res))
+
+
+def global_jacobian(params, problem, executor = None):
+
+    """Calculates the block Jacobian of the global_residuals function.
+
+    Each block is calculated by the :func:`jacobian` function, its
+    columns are placed in the columns of the corresponding global
+    varying parameters, the other columns are 0.
+
+    Parameters:
+        params|problem|executor:
+            See the :func:`global_residuals` function.
+
+    Returns:
+        numpy.ndarray:
+            Jacobian with shape (residuals, varying parameters).
+    """
+
+    values = {key: params[key].value for key in params}
+
+    if executor is None:
+        jacs = [_dataset_jacobian(entry, values) for entry in problem]
+    else:
+        jacs = executor.map(
+            _worker_jacobian,
+            range(len(problem)),
+            itertools.repeat(values)
+            )
+
+    # index of each varying parameter in the columns of the Jacobian
+    columns = {key: i for i, key in enumerate(k for k in params if params[k].vary)}
+
+    blocks = list()
+    for entry, jac in zip(problem, jacs):
+        block = np.zeros((jac.shape[0], len(columns)))
+        dataset_params = entry["params"]
+        names = [key for key in dataset_params if dataset_params[key].vary]
+        for i, key in enumerate(names):
+            block[:,columns[entry["keys"][key]]] = jac[:,i]
+        blocks.append(block)
+
+    return np.concatenate(blocks)
+
+
+def _update_dataset_params(entry, values):
+
+    """Updates the parameters of a dataset from the global values."""
+
+    dataset_params = entry["params"]
+    for key, global_key in entry["keys"].items():
+        value = values[global_key]
+        dataset_params[key].value = getattr(value, "value", value)
+
+    return dataset_params
+
+
+def _dataset_residuals(entry, values):
+
+    """Residuals of a single dataset, see global_residuals."""
+
+    dataset_params = _update_dataset_params(entry, values)
+
+    return entry["problem"].residuals(dataset_params)
+
+
+def _dataset_jacobian(entry, values):
+
+    """Jacobian of a single dataset, see global_jacobian."""
+
+    dataset_params = _update_dataset_params(entry, values)
+
+    return entry["problem"].jacobian(dataset_params)
+
+
+# problem used by the processes of the pool created in fit_datasets, it is
+# set once when the processes are initialized so that only the parameters
+# values are sent to the processes at each iteration
+_worker_problem = None
+
+
+def _init_worker(problem):
+
+    """Initializer of the processes used by fit_datasets."""
+
+    global _worker_problem
+    _worker_problem = problem
+
+
+def _worker_residuals(i, values):
+
+    """Residuals of the dataset number i, computed in a worker process."""
+
+    return _dataset_residuals(_worker_problem[i], values)
+
+
+def _worker_jacobian(i, values):
+
+    """Jacobian of the dataset number i, computed in a worker process."""
+
+    return _dataset_jacobian(_worker_problem[i], values)
+
+
+def fit_dataset_multistart(
+    dataset,
+    derivatives,
+    parameters,
+    c0 = {},
+    c0_untracked = {},
+    c_to_q = None,
+    n_starts = 16,
+    sampling = "sobol",
+    spread = 10,
+    seed = None,
+    processes = None,
+    timeout = None,
+    tol = 1e-3,
+    sensitivities = False,
+    jac = None,
+    jac_p = None,
+    solver = None
+    ):
+
+    """Fit a dataset from several starting points and keep the best fit.
+
+    The starting values of the varying parameters are sampled within
+    their bounds (min, max) with a Latin hypercube or a Sobol sequence.
+    Parameters with an infinite bound are sampled log-uniformly within a
+    factor **spread** of their initial value (clipped to their bounds),
+    or uniformly within +/- **spread** if their initial value is 0. The
+    first starting point is always the initial parameters.
+
+    The fits can run in parallel on a pool of **processes**, in that case
+    derivatives and c_to_q must be defined in a module or in the main
+    script so that they can be passed to the processes. When the
+    **timeout** is reached the running fits are aborted and the fits not
+    started yet are skipped. A start whose fit raises an error (e.g. a
+    model that cannot be evaluated there) is dropped with a warning, the
+    numbers of failed, aborted and skipped starts being printed.
+
+    The completed fits are then grouped into distinct minima: two fits
+    belong to the same minimum if their chi-square and all their varying
+    parameters are equal within the relative tolerance **tol**, see
+    :func:`group_minima`. The best fit is stored in dataset as with the
+    :func:`fit_dataset` function, and the distinct minima in the
+    dataset.minima attribute.
+
+    Parameters:
+        dataset|derivatives|parameters|c0|c0_untracked|c_to_q:
+            See the :func:`fit_dataset` function.
+        n_starts (int, optional):
+            Number of starting points, including the initial parameters.
+            Sobol sequences are balanced for powers of 2.
+        sampling (str, optional):
+            Either "sobol" or "lhs" (Latin hypercube).
+        spread (float, optional):
+            Range used for the parameters with an infinite bound.
+        seed (int, optional):
+            Seed of the random sampling, for reproducible starts.
+        processes (int, optional):
+            Number of processes used to run the fits, if None or 1 they
+            run one after the other in the current process.
+        timeout (float, optional):
+            Wall time budget in seconds for all the fits.
+        tol (float, optional):
+            Relative tolerance used to group the fits into minima.
+        sensitivities|jac|jac_p|solver (optional):
+            See the :func:`fit_dataset` function.
+
+    Returns:
+        lmfit.MinimizerResult, pandas.DataFrame:
+            The best fit result, and the distinct minima ranked by
+            increasing chi-square, with the number of starts that
+            converged to each of them ("count") and the values of the
+            varying parameters.
+    """
+
+    params = make_parameters(dataset, parameters, c0, c0_untracked)
+    dataset.init_params = params
+
+    starts = sample_parameters(params, n_starts, sampling, spread, seed)
+
+    problem = _compile_problem(
+        dataset, derivatives, params, c_to_q, solver, jac, jac_p
+        )
+    deadline = None if timeout is None else time.time() + timeout
+
+    # run the fits
+    jobs = [
+        (problem, start, sensitivities, deadline, i)
+        for i, start in enumerate(starts)
+        ]
+    if processes is not None and processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(_multistart_worker, *zip(*jobs)))
+    else:
+        results = [_multistart_worker(*job) for job in jobs]
+
+    # the starts past the deadline return None, those that raised an error
+    # return a _FailedStart and the fits aborted at the deadline are flagged
+    skipped = sum(result is None for result in results)
+    failed = [result for result in results if isinstance(result, _FailedStart)]
+    results = [
+        result for result in results
+        if result is not None and not isinstance(result, _FailedStart)
+        ]
+    aborted = sum(bool(result.aborted) for result in results)
+    results = [result for result in results if not result.aborted]
+
+    for failure in failed:
+        warnings.warn(
+            f"start {failure.index} failed: {failure.message}", RuntimeWarning
+            )
+    if not results:
+        raise RuntimeError(
+            f"no fit completed: {skipped} starts skipped at the timeout," +
+            f" {aborted} aborted at the timeout and {len(failed)} failed"
+            )
+
+    # group the fits into distinct minima, starting from the best ones
+    minima = group_minima(results, tol)
+    best = minima[0][0]
+
+    print(
+        f"{len(results)} fits ({len(failed)} failed, {aborted} aborted," +
+        f" {skipped} skipped), {len(minima)} distinct minima, best:" +
+        f" {best.message}"
+        )
+
+    # store the results in dataset
+    dataset.fit_result = best
+    dataset.minima = _minima_table(minima)
+    _store_fit(dataset, derivatives, best.params, c_to_q, solver, jac)
+
+    return best, dataset.minima
+
+
+def sample_parameters(params, n, sampling = "sobol", spread = 10, seed = None):
+
+    """Samples starting values for the varying parameters within their bounds.
+
+    See the :func:`fit_dataset_multistart` function.
+
+    Parameters:
+        params (lmfit.parameter.Parameters):
+            The initial parameters.
+        n (int):
+            Number of sets of parameters, the first one being params.
+        sampling|spread|seed (optional):
+            See the :func:`fit_dataset_multistart` function.
+
+    Returns:
+        list:
+            The n lmfit.parameter.Parameters objects.
+    """
+
+    names = [key for key in params if params[key].vary]
+
+    if sampling == "sobol":
+        sampler = qmc.Sobol(len(names), seed = seed)
+    elif sampling == "lhs":
+        sampler = qmc.LatinHypercube(len(names), seed = seed)
+    else:
+        raise ValueError(f"unknown sampling: '{sampling}'")
+
+    # the Sobol sequence warns when n is not a power of 2, which is only
+    # relevant for integration, not for sampling starting points
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        unit = sampler.random(max(n - 1, 0))
+
+    samples = [params]
+    for u in unit:
+        sample = params.copy()
+        for name, u_i in zip(names, u):
+            sample[name].value = _scale_sample(params[name], u_i, spread)
+        samples.append(sample)
+
+    return samples
+
+
+def _scale_sample(param, u, spread):
+
+    """Scales u in [0, 1) to the range of values of param."""
+
+    low, high = param.min, param.max
+
+    if np.isfinite(low) and np.isfinite(high):
+        return low + u*(high - low)
+
+    # infinite bound: range around the initial value, clipped to the bounds
+    value = param.value
+    if value == 0:
+        return float(np.clip(spread*(2*u - 1), low, high))
+    log_range = np.log(abs(value)) + np.log(spread)*(2*u - 1)
+
+    return float(np.clip(np.sign(value)*np.exp(log_range), low, high))
+
+
+def group_minima(results, tol = 1e-3):
+
+    """Groups fit results into distinct minima.
+
+    Two results belong to the same minimum if their chi-square are equal
+    within the relative tolerance tol and all their varying parameters
+    are equal within tol, relative to the scale of each parameter: its
+    largest magnitude over the fitted and starting values of all the
+    results. A parameter converging to a bound at 0 (e.g. 1e-11 and
+    2e-9) then does not split a minimum. The aborted results (see
+    fit_dataset_multistart) are ignored, and only the successful
+    results are grouped, unless none of them succeeded.
+
+    Parameters:
+        results (list):
+            The lmfit.MinimizerResult objects.
+        tol (float, optional):
+            Relative tolerance on the parameters values and chi-square.
+
+    Returns:
+        list:
+            For each minimum, ranked by increasing chi-square, the list
+            of the results belonging to it, the first one being the
+            best.
+    """
+
+    # the aborted fits have no statistics, e.g. no chi-square
+    completed = [r for r in results if not getattr(r, "aborted", False)]
+    if not completed:
+        raise ValueError("no completed fit to group, all the fits were aborted")
+
+    converged = [r for r in completed if r.success]
+    if not converged:
+        converged = completed
+
+    converged = sorted(converged, key = lambda r: r.chisqr)
+    values = np.array([
+        [result.params[key].value for key in result.var_names]
+        for result in converged
+        ])
+    init_values = np.array([
+        [getattr(result, "init_values", {}).get(key, 0) for key in result.var_names]
+        for result in converged
+        ])
+    chisqr = np.array([result.chisqr for result in converged])
+
+    atol = tol*np.max(np.abs(np.concatenate([values, init_values])), axis = 0)
+
+    minima = list()
+    first = list()
+    for i, result in enumerate(converged):
+        for minimum, j in zip(minima, first):
+            if (
+                abs(chisqr[i] - chisqr[j]) <= tol*abs(chisqr[j]) and
+                np.all(np.abs(values[i] - values[j]) <= atol)
+                ):
+                minimum.append(result)
+                break
+        else:
+            minima.append([result])
+            first.append(i)
+
+    return minima
+
+
+def _minima_table(minima):
+
+    """Builds the DataFrame describing the distinct minima."""
+
+    rows = list()
+    for minimum in minima:
+        best = minimum[0]
+        row = dict(
+            chisqr = best.chisqr,
+            redchi = best.redchi,
+            count = len(minimum),
+            nfev = best.nfev
+            )
+        row.update({key: best.params[key].value for key in best.var_names})
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def _multistart_worker(problem, params, sensitivities, deadline, index = 0):
+
+    """Runs a single fit of fit_dataset_multistart, aborted at deadline.
+
+    Returns None if the deadline is passed before the fit starts, and a
+    _FailedStart if the fit raises an error, e.g. for a model that
+    cannot be evaluated from this start.
+    """
+
+    if deadline is None:
+        iter_cb = None
+    elif time.time() > deadline:
+        return None
+    else:
+        iter_cb = functools.partial(_past_deadline, deadline)
+
+    try:
+        result = _minimize(problem, params, sensitivities, iter_cb = iter_cb)
+    except Exception as error:
+        return _FailedStart(index, f"{type(error).__name__}: {error}")
+
+    # the callback cannot be sent back from a process
+    result.iter_cb = None
+
+    return result
+
+
+class _FailedStart:
+
+    """Marker of a start of fit_dataset_multistart that raised an error."""
+
+    def __init__(self, index, message):
+        """ Class constructor """
+
+        self.index = index
+        self.message = message
+
+
+def _past_deadline(deadline, *args, **kws):
+
+    """Iteration callback aborting a fit once the deadline is passed."""
+
+    return time.time() > deadline
+
+
+def _compile_problem(
+    dataset,
+    derivatives,
+    params,
+    c_to_q = None,
+    solver = None,
+    jac = None,
+    jac_p = None
+    ):
+
+    """Compiles the problem.FitProblem object used to fit dataset."""
+
+    from .problem import FitProblem
+
+    return FitProblem(
+        params,
+        dataset.df_c,
+        derivatives,
+        dataset.names,
+        df_q = dataset.df_q,
+        c_to_q = c_to_q,
+        solver = solver,
+        jac = jac,
+        jac_p = jac_p
+        )
+
+
+def _minimize(problem, params, sensitivities = False, **fit_kws):
+
+    """Minimizes the residuals of a problem.FitProblem, see fit_dataset."""
+
+    # the Jacobian of the residuals is passed as the Dfun argument of the
+    # leastsq method
+    if sensitivities:
+        fit_kws["Dfun"] = problem.jacobian
+
+    return lmfit.minimize(
+        problem.residuals,
+        params,
+        nan_policy='omit',
+        **fit_kws
+        )
+
+
+def make_parameters(dataset, parameters, c0 = {}, c0_untracked = {}):
+
+    """Creates the lmfit.Parameters object used to fit dataset.
+
+    See the :func:`fit_dataset` function for a description of the
+    parameters **parameters**, **c0** and **c0_untracked**. The initial
+    concentrations parameters are named after the species with a 'c0_'
+    prefix, the tracked species come first in the order of dataset.names,
+    followed by the untracked species.
+
+    Parameters:
+        dataset (chemical_kinetics.data.Dataset):
+            Object holding the concentration vs time data, used to get
+            the default initial concentrations of the tracked species.
+        parameters|c0|c0_untracked (dict):
+            See the :func:`fit_dataset` function.
+
+    Returns:
+        lmfit.parameter.Parameters:
+            The parameters of the fit.
+    """
+
+    # rename variables to simplify code
+    tracked_species = dataset.names
+    df_c = dataset.df_c
+
+    params = lmfit.Parameters()
+
+    # unpack parameters from **parameters**
+    for key, value in parameters.items():
+        # to avoid issues with having "c0_" in the key for these parameters an
+        # error is raised in that case, else the unpacking proceeds
+        if "c0_" in key:
+            raise ValueError(
+                f"parameters key: '{key}' is invalid," +
+                " keys in this dictionary should not contain the string 'c0_'"
+                )
+        else: params.add(key, **value)
+
+    # unpack parameters from **c0**
+    for name in tracked_species:
+        key = fr"c0_{name}"
+        # default initial concentration value to be used if needed
+        default_val = df_c[name][0]
+        if name in c0:
+            # unpacking if parameters are given for this specie
+            params.add(key, **c0[name])
+            if "value" not in c0[name]:
+                # if the "value" parameter was not give it the default value
+                params[key].value = default_val
+        else:
+            # if no parameters were passed for this specie: initialize with the
+            # default value
+            params.add(key, value = default_val)
+
+    # unpack parameters from **c0_untracked**
+    for name, value in c0_untracked.items():
+        key = fr"c0_{name}"
+        params.add(key, **value)
+
+    return params
+
+
+def _store_fit(dataset, derivatives, params, c_to_q = None, solver = None, jac = None):
+
+    """Stores in dataset the fit curves of the model for params.
+
+    The curves are only evaluated when first needed, see the
+    :class:`curves.FitCurves` class; the df_c_fit and df_q_fit DataFrames
+    of dataset are then built from them on first access.
+    """
+
+    from .curves import FitCurves
+
+    # rename variables to simplify code
+    df_c = dataset.df_c
+    df_q = dataset.df_q
+
+    # time range of the data
+    t_min, t_max = df_c["t"].min(), df_c["t"].max()
+    if df_q is not None and c_to_q is not None:
+        t_min = min(t_min, df_q["t"].min())
+        t_max = max(t_max, df_q["t"].max())
+    else:
+        c_to_q = None
+
+    dataset.fit_curves = FitCurves(
+        derivatives,
+        params,
+        dataset.names,
+        (t_min, t_max),
+        c_to_q = c_to_q,
+        solver = solver,
+        jac = jac
+        )
+
+    # discard the DataFrames of a previous fit, they are rebuilt from the
+    # curves when needed
+    dataset.df_c_fit = None
+    dataset.df_q_fit = None
+
+
+def evaluate(
+    derivatives,
+    params,
+    t,
+    solver = None,
+    jac = None,
+    full_output = False
+    ):
+
+    """Evaluate the concentration(s) evolution(s) over time.
+
+    The **solver** dictionary sets the integrator used, its key "method"
+    is either "odeint" (default) for scipy.integrate.odeint, or the name
+    of a scipy.integrate.solve_ivp method: "RK45", "RK23", "DOP853",
+    "Radau", "BDF" or "LSODA". The other keys are passed to the
+    integrator, in particular:
+
+    - rtol, atol: relative and absolute tolerances, the default values
+      are those of the scipy function used.
+    - jac_sparsity: sparsity pattern of the Jacobian (see e.g.
+      :attr:`network.Network.jac_sparsity`), used by the "Radau" and
+      "BDF" methods when **jac** is not given.
+    - vectorized: if True, derivatives is called with several sets of
+      concentrations at once (axis 1) to estimate the Jacobian, only
+      for solve_ivp methods.
+
+    Parameters:
+        derivatives (function):
+            A function in the form dy = f(y, t, p) used to compute
+            d(concentration)/dt at a time t for each species. Used by
+            scipy.integrate.odeint by default
+        params (lmfit.parameter.Parameters):
+            The parameters values used to compute the derivatives
+            function, for details on this object class see:
+            https://lmfit.github.io/lmfit-py/parameters.html
+        t (list):
+            Time values at which the concentrations should be evaluated.
+        solver (dict, optional):
+            Integrator options, see above.
+        jac (function, optional):
+            A function in the form J = f(y, t, p) returning the
+            d(derivatives)/d(concentration) matrix, used by the implicit
+            integrators instead of a finite differences estimation.
+        full_output (bool, optional):
+            If True, also return a dictionary holding information on the
+            solve: the number of calls of the derivatives function
+            ("nfev") and of the Jacobian ("njev"), "success" and
+            "message".
+
+    Returns:
+        numpy.ndarray or tuple:
+            Concentrations with shape (time, species), and the solve
+            information if **full_output** is True.
+    """
+
+    # convert the parameters corresponding to the species initial
+    # concentrations to a list of values; these parameters are recognized by
+    # the string 'c0_' in their key
+    c0 = [params[key].value for key in params if "c0_" in key]
+
+    # convert the parameters corresponding to other parameters used by the
+    # derivatives function to a dictionary; these parameters have keys that
+    # does not contain the string 'c_0'
+    p = {key: params[key].value for key in params if "c0_" not in key}
+
+    c, info = _evaluate(derivatives, c0, p, t, solver, jac)
+
+    return (c, info) if full_output else c
+
+
+def _evaluate(derivatives, c0, p, t, solver = None, jac = None):
+
+    """Evaluates the model for the values c0 and p, see evaluate."""
+
+    # look for a previous evaluation with the same values if the cache is
+    # enabled, see the cache.enable_cache function
+    cache = enabled_cache()
+    if cache is not None:
+        key = cache.key(derivatives, c0, p, solver, jac)
+        cached = cache.get(key, t)
+        if cached is not None:
+            return cached
+
+    # reduced models (see the reduction module) integrate a smaller system,
+    # from which the concentrations of all the species are rebuilt; the
+    # Jacobian sparsity pattern of the full model is not used in that case
+    if hasattr(derivatives, "reduce"):
+        func, z0, reduced_jac, expand = derivatives.reduce(c0, p, jac)
+        if solver is not None:
+            solver = {
+                key: value for key, value in solver.items()
+                if key != "jac_sparsity"
+                }
+        z, info = integrate(
+            func = func,
+            y0 = z0,
+            t = t,
+            args = (p,),
+            solver = solver,
+            jac = reduced_jac
+            )
+        c = expand(z, t)
+        if cache is not None and info["success"]: cache.put(key, t, c, info)
+        return c, info
+
+    # linear models are solved in closed form, unless their rate matrix is
+    # (nearly) defective, in which case they are integrated as other models
+    if isinstance(derivatives, LinearModel):
+        solution = derivatives.solve(c0, p, t)
+        if solution is not None:
+            info = _closed_form_info(solution)
+            if cache is not None and info["success"]:
+                cache.put(key, t, solution, info)
+            return solution, info
+        if jac is None:
+            jac = derivatives.jac
+
+    # use the integrator to compute the concentrations for all times, the
+    # dense output of the solve_ivp methods is kept in the cache to answer
+    # later requests on other time values
+    c, info = integrate(
+        func = derivatives,
+        y0 = c0,
+        t = t,
+        args = (p,),
+        solver = solver,
+        jac = jac,
+        dense_output = cache is not None
+        )
+
+    if cache is not None:
+        sol = info.pop("sol", None)
+        if info["success"]: cache.put(key, t, c, info, sol)
+
+    return c, info
+
+
+def evaluate_batch(
+    derivatives,
+    param_matrix,
+    t,
+    params = None,
+    names = None,
+    solver = None,
+    vectorized = True,
+    batch_size = 256,
+    processes = None
+    ):
+
+    """Evaluate the concentrations evolution over time for many parameter sets.
+
+    The parameter sets are split in batches of **batch_size** sets. If
+    **vectorized** is True, the sets of a batch are stacked in a single
+    system integrated at once, derivatives being called a single time
+    per step for all the sets with the concentrations as an array with
+    shape (species, sets) and each parameter as an array with shape
+    (sets,); this is the case of the :meth:`network.Network.derivatives`
+    method and of most functions written with numpy operations. The
+    Jacobian of the stacked system being block diagonal, it is estimated
+    by finite differences with a few calls of derivatives only. If
+    **vectorized** is False, the sets are integrated one after the other
+    as by the :func:`evaluate` function, which is also the case for the
+    :class:`LinearModel` objects, solved in closed form.
+
+    The batches can be evaluated in parallel on a pool of **processes**,
+    in that case derivatives must be defined in a module or in the main
+    script so that it can be passed to the processes.
+
+    Parameters:
+        derivatives (function):
+            A function in the form dy = f(y, t, p), see the
+            :func:`evaluate` function.
+        param_matrix (pandas.DataFrame|numpy.ndarray|list):
+            The parameter sets, either a DataFrame with a column per
+            parameter and a row per set, an array with shape (sets,
+            parameters) whose columns are named by **names**, or a list
+            of lmfit.parameter.Parameters objects. The initial
+            concentrations parameters are recognized by the string 'c0_'
+            in their name, as in the :func:`evaluate` function.
+        t (list):
+            Time values at which the concentrations should be evaluated.
+        params (lmfit.parameter.Parameters, optional):
+            Values of the parameters missing in param_matrix, e.g. when
+            scanning a single parameter. The parameters constrained by
+            an expression are updated for each set.
+        names (list, optional):
+            Names of the columns of param_matrix if it is an array.
+        solver (dict, optional):
+            Integrator options, see the :func:`evaluate` function.
+        vectorized (bool, optional):
+            See above.
+        batch_size (int, optional):
+            Maximum number of parameter sets integrated together.
+        processes (int, optional):
+            Number of processes used to evaluate the batches, if None or
+            1 they are evaluated one after the other in the current
+            process.
+
+    Returns:
+        numpy.ndarray:
+            Concentrations with shape (sets, time, species).
+    """
+
+    values = _batch_values(param_matrix, params, names)
+
+    # split the parameters as in the evaluate function: initial concentrations
+    # with shape (sets, species) and other parameters arrays with shape (sets,)
+    c0 = np.stack([v for key, v in values.items() if "c0_" in key], axis = 1)
+    p = {key: v for key, v in values.items() if "c0_" not in key}
+
+    batches = [
+        (c0[i:i + batch_size], {key: v[i:i + batch_size] for key, v in p.items()})
+        for i in range(0, len(c0), batch_size)
+        ]
+
+    solve = functools.partial(
+        _solve_batch,
+        derivatives,
+        t = t,
+        solver = solver,
+        vectorized = vectorized
+        )
+
+    if processes is not None and processes > 1 and len(batches) > 1:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            c = list(executor.map(solve, *zip(*batches)))
+    else:
+        c = [solve(*batch) for batch in batches]
+
+    return np.concatenate(c)
+
+
+def _batch_values(param_matrix, params = None, names = None):
+
+    """Converts the parameter sets of evaluate_batch to a dictionary of arrays.
+
+    The keys follow the order of params if given, then the order of the
+    columns of param_matrix.
+    """
+
+    if isinstance(param_matrix, pd.DataFrame):
+        columns = {key: param_matrix[key].to_numpy(dtype = float) for key in param_matrix}
+    elif isinstance(param_matrix, np.ndarray):
+        if names is None:
+            raise ValueError("names must be given when param_matrix is an array")
+        columns = {key: param_matrix[:,i].astype(float) for i, key in enumerate(names)}
+    else:
+        columns = {
+            key: np.array([param_set[key].value for param_set in param_matrix])
+            for key in param_matrix[0]
+            }
+
+    if params is None:
+        return columns
+
+    n_sets = len(next(iter(columns.values())))
+    values = {
+        key: columns.get(key, np.full(n_sets, params[key].value))
+        for key in params
+        }
+    values.update(columns)
+
+    # the parameters constrained by an expression depend on the values of the
+    # other parameters, they are updated for each set
+    constrained = [
+        key for key in params
+        if params[key].expr is not None and key not in columns
+        ]
+    if constrained:
+        params = params.copy()
+        for i in range(n_sets):
+            for key in columns:
+                params[key].value = columns[key][i]
+            params.update_constraints()
+            for key in constrained:
+                values[key][i] = params[key].value
+
+    return values
+
+
+def _solve_batch(derivatives, c0, p, t, solver = None, vectorized = True):
+
+    """Evaluates a batch of parameter sets, see evaluate_batch."""
+
+    n_sets, n_species = c0.shape
+
+    # integrate the sets one after the other
+    if not vectorized or isinstance(derivatives, LinearModel):
+        c = list()
+        for i in range(n_sets):
+            p_i = {key: v[i] for key, v in p.items()}
+            c.append(_evaluate(derivatives, c0[i], p_i, t, solver)[0])
+        return np.stack(c)
+
+    # the stacked state holds the concentrations of each set one after the
+    # other, the Jacobian of the stacked system is then block diagonal (banded)
+    solver = dict() if solver is None else dict(solver)
+    method = solver.get("method", "odeint")
+    solver.pop("vectorized", None)
+
+    if method == "odeint":
+        solver["ml"] = solver["mu"] = n_species - 1
+    elif method == "LSODA":
+        solver["lband"] = solver["uband"] = n_species - 1
+    elif method in ("Radau", "BDF"):
+        sparsity = solver.get("jac_sparsity", np.ones((n_species, n_species)))
+        solver["jac_sparsity"] = scipy.sparse.kron(
+            scipy.sparse.identity(n_sets),
+            scipy.sparse.csr_matrix(sparsity),
+            format = "csc"
+            )
+
+    z, _ = integrate(
+        func = _stacked_derivatives,
+        y0 = c0.ravel(),
+        t = t,
+        args = (derivatives, p, c0.shape),
+        solver = solver
+        )
+
+    return z.reshape(len(z), n_sets, n_species).transpose(1, 0, 2)
+
+
+def _stacked_derivatives(z, t, derivatives, p, shape):
+
+    """Derivatives of the stacked state of a batch, see evaluate_batch."""
+
+    dy = derivatives(z.reshape(shape).T, t, p)
+
+    return np.asarray(dy, dtype = float).T.ravel()
+
+
+def integrate(
+    func,
+    y0,
+    t,
+    args = (),
+    solver = None,
+    jac = None,
+    dense_output = False
+    ):
+
+    """Integrates dy = func(y, t, *args) with the integrator set by solver.
+
+    Used by the :func:`evaluate` and :func:`evaluate_sensitivities`
+    functions, both scipy.integrate.odeint and scipy.integrate.solve_ivp
+    are called with the odeint conventions for func and jac.
+
+    Parameters:
+        func (function):
+            Computes the derivatives of y at t.
+        y0 (list):
+            Value of y at t[0].
+        t (list):
+            Time values at which y is evaluated, sorted in increasing
+            order.
+        args (tuple, optional):
+            Extra arguments passed to func and jac.
+        solver (dict, optional):
+            Integrator options, see the :func:`evaluate` function.
+        jac (function, optional):
+            Computes the d(func)/dy matrix at t, in the form
+            J = jac(y, t, *args).
+        dense_output (bool, optional):
+            If True, the solve_ivp methods also return their dense output
+            (scipy.integrate.OdeSolution) in the solve information, with
+            the key "sol".
+
+    Returns:
+        numpy.ndarray, dict:
+            y with shape (time, variables), and the solve information:
+            "nfev", "njev", "success" and "message".
+    """
+
+    solver = dict() if solver is None else dict(solver)
+    method = solver.pop("method", "odeint")
+    t = np.asarray(t, dtype = float)
+
+    if method == "odeint":
+
+        if "jac_sparsity" in solver:
+            raise ValueError(
+                "jac_sparsity is only supported by the solve_ivp methods," +
+                " use e.g. method = 'BDF'"
+                )
+        solver.pop("vectorized", None)
+
+        y, output = odeint(
+            func = func,
+            y0 = y0,
+            t = t,
+            args = args,
+            Dfun = jac,
+            full_output = True,
+            **solver
+            )
+
+        info = dict(
+            nfev = int(output["nfe"][-1]),
+            njev = int(output["nje"][-1]),
+            success = output["message"] == "Integration successful.",
+            message = output["message"]
+            )
+
+        return y, info
+
+    # solve_ivp methods: the arguments of func and jac are swapped
+    if jac is not None:
+        solver["jac"] = lambda t_i, y_i: jac(y_i, t_i, *args)
+
+    result = solve_ivp(
+        fun = lambda t_i, y_i: func(y_i, t_i, *args),
+        t_span = (t[0], t[-1]),
+        y0 = y0,
+        method = method,
+        t_eval = t,
+        dense_output = dense_output,
+        **solver
+        )
+
+    info = dict(
+        nfev = int(result.nfev),
+        njev = int(result.njev),
+        success = bool(result.success),
+        message = result.message
+        )
+    if dense_output:
+        info["sol"] = result.sol
+
+    # if the integration failed the values for the remaining times are set to
+    # nan, similarly to scipy.integrate.odeint a warning is issued
+    y = np.full((len(t), len(y0)), np.nan)
+    y[:result.y.shape[1]] = result.y.T
+    if not result.success:
+        warnings.warn(result.message, RuntimeWarning)
+
+    return y, info
+
+
+# information returned for the models solved in closed form
+_CLOSED_FORM_INFO = dict(
+    nfev = 0,
+    njev = 0,
+    success = True,
+    message = "Closed form solution."
+    )
+
+# information returned for the closed form solutions that failed
+_FAILED_CLOSED_FORM_INFO = dict(
+    nfev = 0,
+    njev = 0,
+    success = False,
+    message = "Non-finite rate matrix or initial concentrations."
+    )
+
+
+def _closed_form_info(c):
+
+    """Solve information of a closed form solution c of a LinearModel."""
+
+    if np.all(np.isfinite(c)):
+        return _CLOSED_FORM_INFO.copy()
+
+    return _FAILED_CLOSED_FORM_INFO.copy()
+
+
+class LinearModel:
+
+    """Derivatives function of a linear model dy/dt = K.y.
+
+    Objects of this class can be used as the derivatives function in
+    this module. In that case the :func:`evaluate` and
+    :func:`evaluate_sensitivities` functions compute the concentrations
+    (and their derivatives with respect to the parameters) in closed
+    form, from the eigendecomposition of the rate matrix K computed once
+    per set of parameters:
+
+        y(t) = V.exp(L.t).V^-1.y0
+
+    with L the eigenvalues and V the eigenvectors of K. If K is (nearly)
+    defective, i.e. V is ill-conditioned, the model is integrated
+    numerically instead.
+
+    Parameters:
+        rate_matrix (function):
+            A function in the form K = f(p) returning the rate matrix K
+            with shape (species, species), p being the dictionary of
+            parameters also used by derivatives functions.
+        rate_matrix_p (function, optional):
+            A function in the form dK = f(p) returning a dictionary of
+            parameter name (str): d(rate matrix)/d(parameter)
+            (numpy.ndarray). Parameters missing from this dictionary
+            are estimated by finite differences of rate_matrix.
+    """
+
+    def __init__(self, rate_matrix, rate_matrix_p = None):
+        """ Class constructor """
+
+        self.rate_matrix = rate_matrix
+        self.rate_matrix_p = rate_matrix_p
+
+
+    def __call__(self, y, t, p):
+
+        """Calculates the derivatives K.y, i.e. dy = f(y, t, p)."""
+
+        return self.rate_matrix(p) @ y
+
+
+    def jac(self, y, t, p):
+
+        """Calculates the d(derivatives)/d(concentration) matrix, i.e. K."""
+
+        return self.rate_matrix(p)
+
+
+    def jac_p(self, y, t, p):
+
+        """Calculates the d(derivatives)/d(parameter) vectors dK.y."""
+
+        return {name: dK @ y for name, dK in self._rate_matrix_p(p).items()}
+
+
+    def solve(self, c0, p, t, names = None, c0_names = None):
+
+        """Computes the concentrations in closed form.
+
+        Parameters:
+            c0 (list):
+                Concentrations at the initial time t[0].
+            p (dict):
+                Parameter name (str): value, used to compute the rate
+                matrix.
+            t (list):
+                Time values at which the concentrations are evaluated.
+            names (list, optional):
+                Names of the parameters for which the sensitivities are
+                calculated, either parameters in p or initial
+                concentrations parameters from c0_names. If None, the
+                sensitivities are not calculated.
+            c0_names (list, optional):
+                Names of the initial concentrations parameters, in the
+                order of c0.
+
+        Returns:
+            numpy.ndarray or tuple:
+                Concentrations with shape (time, species), or if names
+                is given the concentrations and the sensitivities with
+                shape (time, species, parameters), as returned by
+                :func:`evaluate` and :func:`evaluate_sensitivities`.
+                None if the rate matrix is too close to defective. If the
+                rate matrix or the initial concentrations are not finite
+                (e.g. for extreme parameters tried by a fit), the values
+                are nan, as for a failed integration.
+        """
+
+        K = np.asarray(self.rate_matrix(p), dtype = float)
+        c0 = np.asarray(c0, dtype = float)
+        tau = np.asarray(t, dtype = float) - np.asarray(t, dtype = float)[0]
+
+        # no eigendecomposition of non-finite values, the evaluation fails
+        if not (np.all(np.isfinite(K)) and np.all(np.isfinite(c0))):
+            warnings.warn(
+                "non-finite rate matrix or initial concentrations",
+                RuntimeWarning
+                )
+            c = np.full((len(tau), len(c0)), np.nan)
+            if names is None:
+                return c
+            return c, np.full((len(tau), len(c0), len(names)), np.nan)
+
+        # eigendecomposition of the rate matrix, fall back to the numerical
+        # integration if its eigenvectors are ill-conditioned
+        w, V = np.linalg.eig(K)
+        if np.linalg.cond(V) > 1/np.sqrt(np.finfo(float).eps):
+            return None
+        V_inv = np.linalg.inv(V)
+
+        # concentrations for all times: V.(exp(w.t)*b) with b = V^-1.c0
+        exp_wt = np.exp(np.outer(tau, w))
+        b = V_inv @ c0
+        c = ((exp_wt*b) @ V.T).real
+
+        # the values at the initial time are set exactly, round-off errors on
+        # null concentrations would otherwise give large normalized residuals
+        # (see calculate_residuals)
+        c[tau == 0] = c0
+
+        if names is None:
+            return c
+
+        s = np.zeros((len(tau), len(c0), len(names)))
+
+        # sensitivities to the initial concentrations: exp(K.t) columns
+        for j, name in enumerate(names):
+            if c0_names is not None and name in c0_names:
+                i = c0_names.index(name)
+                s[:,:,j] = ((exp_wt*V_inv[:,i]) @ V.T).real
+                s[tau == 0,:,j] = np.eye(len(c0))[i]
+
+        # sensitivities to the parameters of the rate matrix, from the
+        # derivative of exp(K.t) in the direction dK:
+        #   V.(phi(t)*(V^-1.dK.V)).V^-1
+        # with phi[i, j] = (exp(w_i.t) - exp(w_j.t))/(w_i - w_j), or t.exp(w_i.t)
+        # if w_i = w_j
+        p_names = [(j, name) for j, name in enumerate(names) if name in p]
+        if p_names:
+            dK = self._rate_matrix_p(p, [name for _, name in p_names])
+            dK_eig = np.stack([V_inv @ dK[name] @ V for _, name in p_names])
+            # u[t, k, i] = sum over j of phi[t, i, j]*dK_eig[k, i, j]*b[j],
+            # computed as a matrix product batched over i
+            u = _phi(w, tau).transpose(1, 0, 2) @ (dK_eig*b).transpose(1, 2, 0)
+            for k, (j, name) in enumerate(p_names):
+                s[:,:,j] = (u[:,:,k].T @ V.T).real
+
+        return c, s
+
+
+    def _rate_matrix_p(self, p, names = None):
+
+        """d(rate matrix)/d(parameter), estimated if not given."""
+
+        if names is None:
+            names = list(p)
+
+        dK = dict() if self.rate_matrix_p is None else self.rate_matrix_p(p)
+
+        # central finite differences for the parameters not in dK, exact for
+        # rate matrices linear in the parameters
+        for name in names:
+            if name not in dK:
+                h = _step(max(abs(p[name]), 1))
+                p_plus, p_minus = p.copy(), p.copy()
+                p_plus[name] += h
+                p_minus[name] -= h
+                dK[name] = (
+                    np.asarray(self.rate_matrix(p_plus), dtype = float) -
+                    np.asarray(self.rate_matrix(p_minus), dtype = float)
+                    )/(2*h)
+
+        return dK
+
+
+def _phi(w, t):
+
+    """Divided differences (exp(w_i.t) - exp(w_j.t))/(w_i - w_j) for all t.
+
+    Computed as exp(w_max.t)*expm1((w_min - w_max).t)/(w_min - w_max), w_max
+    being the eigenvalue with the largest real part, to avoid overflows and
+    losses of precision for close eigenvalues.
+    """
+
+    w_i, w_j = w[:,np.newaxis], w[np.newaxis,:]
+    w_max = np.where(w_i.real >= w_j.real, w_i, w_j)
+    d = np.where(w_i.real >= w_j.real, w_j - w_i, w_i - w_j)
+
+    t = t[:,np.newaxis,np.newaxis]
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        ratio = np.where(d != 0, np.expm1(d*t)/d, t)
+
+    return np.exp(w_max*t)*ratio
+
+
+class Observable:
+
+    """Observable quantity calculated from the model concentrations.
+
+    An observable, e.g. the charge passed, is a function of the
+    concentrations of all the species at each time value. It is
+    evaluated in a single vectorised call on the solution array with
+    shape (time, species), and its derivatives with respect to the
+    parameters (used by the Jacobian of the fit) are obtained from the
+    sensitivities of the concentrations with the chain rule.
+
+    The c_to_q functions of this module are converted to observables by
+    the :func:`as_observable` function, so that a plain function can
+    still be used. The concentrations are passed as a read-only array:
+    a function modifying its argument in place (e.g. c *= 1e-6) raises a
+    ValueError instead of corrupting the model evaluation.
+
+    Parameters:
+        func (function):
+            A function in the form obs = f(c) returning the observable
+            with shape (time,) from the concentrations c with shape
+            (time, species).
+        jac (function, optional):
+            A function in the form J = f(c) returning the
+            d(observable)/d(concentration) matrix with shape (time,
+            species). If not given, func is assumed to be linear (or
+            affine) in the concentrations, as expected for the charge
+            passed.
+
+    Attributes:
+        func|jac:
+            The stored parameters.
+    """
+
+    def __init__(self, func, jac = None):
+        """ Class constructor """
+
+        self.func = func
+        self.jac = jac
+
+
+    def __call__(self, c):
+
+        """Calculates the observable from the concentrations c."""
+
+        return np.asarray(self.func(_read_only(c)), dtype = float)
+
+
+    def sensitivities(self, c, s):
+
+        """Derivatives of the observable with respect to the parameters.
+
+        Parameters:
+            c (numpy.ndarray):
+                Concentrations with shape (time, species).
+            s (numpy.ndarray):
+                Sensitivities of the concentrations with shape (time,
+                species, parameters), see :func:`evaluate_sensitivities`.
+
+        Returns:
+            numpy.ndarray:
+                Sensitivities of the observable with shape (time,
+                parameters).
+        """
+
+        if self.jac is not None:
+            J = np.asarray(self.jac(_read_only(c)), dtype = float)
+            return np.einsum("ts,tsp->tp", J, s)
+
+        # func being linear, the sensitivities of all the parameters are
+        # converted in a single call, stacked along the time axis, and the
+        # offset func(0) is removed
+        n_t, n_s, n_p = s.shape
+        stacked = np.moveaxis(s, 2, 1).reshape(n_t*n_p, n_s)
+        ds = self(stacked) - self(np.zeros((1, n_s)))
+
+        return ds.reshape(n_t, n_p)
+
+
+class LinearObservable(Observable):
+
+    """Observable linear in the concentrations: obs = c.weights + offset.
+
+    E.g. the charge passed, weights being the charge passed per unit of
+    concentration of each species, or an absorbance, weights being the
+    extinction coefficients times the optical path. The observable and
+    its sensitivities are calculated by matrix products.
+
+    Parameters:
+        weights (list):
+            Weight of each species, with shape (species,).
+        offset (float, optional):
+            Value of the observable for zero concentrations.
+
+    Attributes:
+        weights|offset:
+            The stored parameters.
+    """
+
+    def __init__(self, weights, offset = 0.0):
+        """ Class constructor """
+
+        self.weights = np.asarray(weights, dtype = float)
+        self.offset = float(offset)
+        super().__init__(self._linear, self._jacobian)
+
+
+    def __call__(self, c):
+
+        """Calculates the observable from the concentrations c."""
+
+        return self._linear(np.asarray(c, dtype = float))
+
+
+    def sensitivities(self, c, s):
+
+        """Derivatives of the observable with respect to the parameters."""
+
+        return np.einsum("tsp,s->tp", s, self.weights)
+
+
+    def _linear(self, c):
+
+        return c @ self.weights + self.offset
 
 
-from scipy.integrate import odeint
-import pandas as pd
-import numpy as np
-import lmfit
+    def _jacobian(self, c):
 
+        return np.broadcast_to(self.weights, np.shape(c))
 
-def fit_dataset(
-    dataset,
-    derivatives,
-    parameters,
-    c0 = {},
-    c0_untracked = {},
-    c_to_q = None
-    ):
 
-    """Fit a dataset holding concentration vs t data and optionally charge vs t.
-    
-    The parameters **parameters**, **c0** and **c0_untracked** are dictionaries
-    in which each value is a dictionary of the parameters to use in order
-    to initialize objects of the lmfit.Parameter class. The parameters
-    that can be passed via this dictionary are in particular: value,
-    vary, min, max and expr. Details on the Parameter class can be found
-    here: https://lmfit.github.io/lmfit-py/parameters.html
+def as_observable(c_to_q):
+
+    """Converts a c_to_q function into an :class:`Observable`.
 
     Parameters:
-        dataset (chemical_kinetics.data.Dataset):
-            Object holding the different DataFrames containing the data
-            to be fitted.
-        derivatives (function):
-            A function in the form dy = f(y, t, p) used to compute
-            d(concentration)/dt at a time t for each species. Used by
-            scipy.integrate.odeint
-        parameters (dict):
-            Stores parameter names (str): parameters (dict) (e.g. value,
-            min, max, vary) to be passed to the corresponding
-            lmfit.Parameter. Represents all the parameters of the
-            kinetic model.
-        c0 (dict, optional):
-            Stores species name (str): parameters (dict) (e.g. value,
-            min, max, vary) to be passed to the corresponding
-            lmfit.Parameter. Represent the concentrations at initial
-            time for the species whose concentration evolution over time
-            is stored in dataset.df_c.
-        c0_untracked (collections.OrderedDict, optional):
-            Stores species name (str): parameters (dict) (e.g. value,
-            min, max, vary) to be passed to the corresponding
-            lmfit.Parameter. Represent concentrations at initial time
-            for the species whose concentrations evolution over time is
-            NOT stored in dataset.df_c. An ordered dictionary is
-            necessary in this case to be able to pass parameters properly
-            to the scipy.integrate.odeint solver.
-        c_to_q (function, optional):
-            Used to convert the concentrations over time evolution into
-            charge passed.
+        c_to_q (function):
+            Used to convert the concentrations into charge passed, see
+            the :func:`fit_dataset` function. Returned as is if it is
+            already an Observable object, or None.
+
+    Returns:
+        Observable:
+            The observable, None if c_to_q is None.
     """
 
-    # rename variables to simplify code
-    tracked_species = dataset.names
-    df_c = dataset.df_c
-    df_q = dataset.df_q
+    if c_to_q is None or isinstance(c_to_q, Observable):
+        return c_to_q
 
+    return Observable(c_to_q)
 
-    ############################################################################
-    # create the lmfit.Parameters object with all parameters from the
-    # **parameters**, **c0** and **c0_untracked** variables
-    ############################################################################
 
-    params = lmfit.Parameters()
+def _read_only(c):
 
-    # unpack parameters from **parameters**
-    for key, value in parameters.items():
-        # to avoid issues with having "c0_" in the key for these parameters an
-        # error is raised in that case, else the unpacking proceeds
-        if "c0_" in key:
-            raise ValueError(
-                f"parameters key: '{key}' is invalid," +
-                " keys in this dictionary should not contain the string 'c0_'"
-                )
-        else: params.add(key, **value)
+    """Read-only view of the array c."""
 
-    # unpack parameters from **c0**
-    for name in tracked_species:
-        key = fr"c0_{name}"
-        # default initial concentration value to be used if needed
-        default_val = df_c[name][0]
-        if name in c0:
-            # unpacking if parameters are given for this specie
-            params.add(key, **c0[name])
-            if "value" not in c0[name]:
-                # if the "value" parameter was not give it the default value
-                params[key].value = default_val
-        else:
-            # if no parameters were passed for this specie: initialize with the
-            # default value
-            params.add(key, value = default_val)
+    c = np.asarray(c, dtype = float).view()
+    c.flags.writeable = False
 
-    # unpack parameters from **c0_untracked**
-    for name, value in c0_untracked.items():
-        key = fr"c0_{name}"
-        params.add(key, **value)
+    return c
 
-    # store these parameters, used in the print_result function
-    dataset.init_params = params
 
+def merge_times(*t):
 
-    ############################################################################
-    # perform the fit
-    ############################################################################
+    """Merges time values into a single sorted grid of unique time values.
 
-    result = lmfit.minimize(
-        residuals,
-        params,
-        args = [
-            df_c,
-            derivatives,
-            tracked_species,
-            df_q,
-            c_to_q
-            ],
-        nan_policy='omit'
+    Used to solve the model a single time for data sampled at different
+    time values, e.g. concentrations and charge passed.
+
+    Parameters:
+        *t (list):
+            Time values of each dataset.
+
+    Returns:
+        numpy.ndarray, list:
+            The merged time values, and for each dataset an array of
+            indices such that merged[indices] gives back its time values.
+    """
+
+    lengths = [len(t_i) for t_i in t]
+
+    # sorted unique values and, for each value in the concatenated time
+    # values, its index in the unique values
+    t_merged, idx = np.unique(
+        np.concatenate([np.asarray(t_i, dtype = float) for t_i in t]),
+        return_inverse = True
         )
 
-    print(result.message)
+    # split the indices back into the individual datasets
+    idx = np.split(idx.ravel(), np.cumsum(lengths)[:-1])
 
+    return t_merged, idx
 
-    ############################################################################
-    # store the fit results in dataset
-    ############################################################################
 
-    # store the lmfit.MinimizerResult object
-    dataset.fit_result = result
-    
-    # build and store the DataFrame holding the evaluation from the best fit of
-    # the concentrations evolution over time
-    t_fit = np.linspace(df_c["t"].min(), df_c["t"].max(), 150)
-    c_fit = evaluate(derivatives, result.params, t_fit)
-    dataset.df_c_fit = pd.DataFrame({"t": t_fit})
-    for i, s in enumerate(tracked_species): dataset.df_c_fit[s] = c_fit[:,i]
-
-    # build and store the DataFrame holding the evaluation from the best fit of
-    # the charge passed over time best fit result
-    if df_q is not None and c_to_q is not None:
-        dataset.df_q_fit = pd.DataFrame({"t": t_fit})
-        dataset.df_q_fit["Q"] = c_to_q(c_fit)
+def evaluate_sensitivities(
+    derivatives,
+    params,
+    t,
+    names = None,
+    jac = None,
+    jac_p = None,
+    solver = None,
+    full_output = False
+    ):
 
+    """Evaluate the concentrations and their sensitivities over time.
 
-def evaluate(derivatives, params, t):
+    The sensitivities s[i, j] = d(concentration i)/d(parameter j) are
+    obtained by solving the forward sensitivity equations together with
+    the model in a single call to the integrator:
 
-    """Evaluate the concentration(s) evolution(s) over time.
+        ds/dt = J.s + dp
+
+    with J the d(derivatives)/d(concentration) matrix and dp the
+    d(derivatives)/d(parameter) matrix. The sensitivities are initialized
+    to 0 for the model parameters and to the identity for the initial
+    concentrations parameters ('c0_' in their key). The models reduced
+    with an approximation (e.g. reduction.QSSAModel, with an "approximate"
+    attribute set to True) are not supported.
 
     Parameters:
         derivatives (function):
             A function in the form dy = f(y, t, p) used to compute
             d(concentration)/dt at a time t for each species. Used by
-            scipy.integrate.odeint
+            scipy.integrate.odeint by default
         params (lmfit.parameter.Parameters):
             The parameters values used to compute the derivatives
             function, for details on this object class see:
             https://lmfit.github.io/lmfit-py/parameters.html
         t (list):
             Time values at which the concentrations should be evaluated.
+        names (list, optional):
+            Names of the parameters for which the sensitivities are
+            calculated, if None the varying parameters are used.
+        jac (function, optional):
+            A function in the form J = f(y, t, p) returning the
+            d(derivatives)/d(concentration) matrix. If not given it is
+            estimated by finite differences of the derivatives function.
+        jac_p (function, optional):
+            A function in the form dp = f(y, t, p) returning a
+            dictionary of parameter name (str): d(derivatives)/d(parameter)
+            (numpy.ndarray). Parameters missing from this dictionary are
+            estimated by finite differences of the derivatives function.
+        solver (dict, optional):
+            Integrator options, see the :func:`evaluate` function. The
+            Jacobian sparsity pattern is not used here.
+        full_output (bool, optional):
+            If True, also return the solve information, see the
+            :func:`evaluate` function.
+
+    Returns:
+        numpy.ndarray, numpy.ndarray:
+            Concentrations with shape (time, species) and sensitivities
+            with shape (time, species, parameters), and the solve
+            information if **full_output** is True.
     """
 
-    # convert the parameters corresponding to the species initial
-    # concentrations to a list of values; these parameters are recognized by
-    # the string 'c0_' in their key
-    c0 = [params[key].value for key in params if "c0_" in key]
+    # the sensitivity equations are those of the full model, which differ
+    # from an approximate reduced model (e.g. reduction.QSSAModel)
+    if getattr(derivatives, "approximate", False):
+        raise ValueError(
+            "the sensitivities of an approximate reduced model are not" +
+            " available, use sensitivities = False"
+            )
 
-    # convert the parameters corresponding to other parameters used by the
-    # derivatives function to a dictionary; these parameters have keys that
-    # does not contain the string 'c_0'
+    if names is None:
+        names = [key for key in params if params[key].vary]
+
+    # split the parameters between initial concentrations and parameters of
+    # the derivatives function, in the same way as in the evaluate function
+    c0_keys = [key for key in params if "c0_" in key]
+    c0 = np.array([params[key].value for key in c0_keys], dtype = float)
     p = {key: params[key].value for key in params if "c0_" not in key}
 
-    # use scipy.integrate.odeint to compute the concentrations for all times
-    c = odeint(
-        func = derivatives,
-        y0 = c0,
+    n = len(c0)
+    m = len(names)
+
+    # linear models are solved in closed form, see the evaluate function
+    if isinstance(derivatives, LinearModel):
+        solution = derivatives.solve(
+            c0,
+            p,
+            t,
+            names = names,
+            c0_names = c0_keys
+            )
+        if solution is not None:
+            if full_output:
+                return (*solution, _closed_form_info(solution[0]))
+            return solution
+        if jac is None:
+            jac = derivatives.jac
+        if jac_p is None:
+            jac_p = derivatives.jac_p
+
+    # initial sensitivities: identity for the initial concentrations, 0 for
+    # the parameters of the derivatives function; the sensitivities are
+    # stored parameter by parameter, i.e. with shape (parameters, species)
+    s0 = np.zeros((m, n))
+    for j, name in enumerate(names):
+        if name in c0_keys:
+            s0[j, c0_keys.index(name)] = 1
+
+    # the augmented system Jacobian is always given, so the sparsity pattern
+    # of the model Jacobian is not needed
+    solver = dict() if solver is None else dict(solver)
+    solver.pop("jac_sparsity", None)
+    solver.pop("vectorized", None)
+
+    # with odeint the sensitivities are solved with a looser relative
+    # tolerance than the concentrations (default: 1.49012e-8) since they are
+    # only used to build the Jacobian, and since their derivatives include the
+    # round-off errors of the finite differences
+    if solver.get("method", "odeint") == "odeint":
+        rtol = solver.get("rtol", 1.49012e-8)
+        solver["rtol"] = np.concatenate([
+            np.full(n, rtol),
+            np.full(n*m, max(rtol, 1e-6))
+            ])
+
+    z, info = integrate(
+        func = _sensitivity_derivatives,
+        y0 = np.concatenate([c0, s0.ravel()]),
         t = t,
-        args = (p,)
+        args = (derivatives, p, names, c0, jac, jac_p),
+        solver = solver,
+        jac = _sensitivity_jacobian
         )
 
-    return c
+    c = z[:,:n]
+    s = z[:,n:].reshape(-1, m, n).transpose(0, 2, 1)
+
+    return (c, s, info) if full_output else (c, s)
+
+
+def _sensitivity_derivatives(z, t, derivatives, p, names, c0, jac, jac_p):
+
+    """Derivatives of the model augmented with its sensitivity equations."""
+
+    n = len(c0)
+    y = z[:n]
+    s = z[n:].reshape(-1, n)
+
+    dy = np.asarray(derivatives(y, t, p), dtype = float)
+
+    # without any analytical derivative J.s + dp is estimated for each
+    # parameter at once by a central difference along the direction
+    # (s, 1), which requires two calls of the derivatives function per
+    # parameter; the step is chosen to keep both the concentrations and the
+    # parameter perturbations small
+    if jac is None and jac_p is None:
+        ds = np.empty_like(s)
+        for j, name in enumerate(names):
+            s_max = np.abs(s[j]).max()
+            h = _step(np.abs(y).max())/s_max if s_max != 0 else np.inf
+            if name in p:
+                h = min(h, _step(max(abs(p[name]), 1)))
+            p_plus, p_minus = p.copy(), p.copy()
+            if name in p:
+                p_plus[name] += h
+                p_minus[name] -= h
+            ds[j] = (
+                np.asarray(derivatives(y + h*s[j], t, p_plus), dtype = float) -
+                np.asarray(derivatives(y - h*s[j], t, p_minus), dtype = float)
+                )/(2*h)
+        return np.concatenate([dy, ds.ravel()])
+
+    if jac is None:
+        J = _jacobian_y(derivatives, y, t, p)
+    else:
+        J = np.asarray(jac(y, t, p), dtype = float)
+
+    ds = s @ J.T
+
+    dp = dict() if jac_p is None else jac_p(y, t, p)
+    for j, name in enumerate(names):
+        if name in dp:
+            ds[j] += dp[name]
+        elif name in p:
+            ds[j] += _jacobian_p(derivatives, y, t, p, name)
+
+    return np.concatenate([dy, ds.ravel()])
+
+
+def _sensitivity_jacobian(z, t, derivatives, p, names, c0, jac, jac_p):
+
+    """Jacobian of the augmented system, used by the integrator.
+
+    The second derivatives of the model are neglected, which only
+    affects the convergence of the solver iterations, not the solution.
+    """
+
+    y = z[:len(c0)]
+
+    if jac is None:
+        J = _jacobian_y(derivatives, y, t, p)
+    else:
+        J = np.asarray(jac(y, t, p), dtype = float)
+
+    # block diagonal matrix, J for the concentrations and for each parameter
+    # sensitivities
+    return np.kron(np.eye(len(names) + 1), J)
+
+
+def _step(scale):
+
+    """Central finite differences step for a variable of magnitude scale."""
+
+    eps = np.finfo(float).eps**(1/3)
+
+    return eps*scale if scale != 0 else eps
+
+
+def _jacobian_y(derivatives, y, t, p):
+
+    """Finite differences estimation of d(derivatives)/d(concentration)."""
+
+    # a single step scaled on the largest concentration is used, so that it
+    # stays meaningful for species with a zero concentration
+    h = _step(np.abs(y).max())
+
+    J = np.empty((len(y), len(y)))
+    for i in range(len(y)):
+        y_plus, y_minus = y.copy(), y.copy()
+        y_plus[i] += h
+        y_minus[i] -= h
+        J[:,i] = (
+            np.asarray(derivatives(y_plus, t, p), dtype = float) -
+            np.asarray(derivatives(y_minus, t, p), dtype = float)
+            )/(2*h)
+
+    return J
+
+
+def _jacobian_p(derivatives, y, t, p, name):
+
+    """Finite differences estimation of d(derivatives)/d(parameter)."""
+
+    # rate constants often converge to 0, the step is therefore not allowed to
+    # get smaller than for a parameter of magnitude 1
+    h = _step(max(abs(p[name]), 1))
+
+    p_plus, p_minus = p.copy(), p.copy()
+    p_plus[name] += h
+    p_minus[name] -= h
+
+    return (
+        np.asarray(derivatives(y, t, p_plus), dtype = float) -
+        np.asarray(derivatives(y, t, p_minus), dtype = float)
+        )/(2*h)
 
 
 def calculate_residuals(df, fit, names):
@@ -213,6 +2240,9 @@ def calculate_residuals(df, fit, names):
             Names of the columns in df that hold the data to be compared
             to the fit values. Necessary because in some cases not all
             of the data stored in df is fitted.
+
+    If df has a "weight" column (see data.decimate), the residuals are
+    multiplied by the square root of the weights.
     """
 
     res = list()
@@ -238,21 +2268,82 @@ def calculate_residuals(df, fit, names):
         idx_div0 = norm == 0
         partial_res[idx_div0] = 0
 
+        if "weight" in df:
+            partial_res *= np.sqrt(df["weight"])
+
         res.extend(partial_res)
 
     return res
 
 
+def calculate_jacobian(df, fit, dfit, names):
+
+    """Calculates the Jacobian of the residuals from calculate_residuals.
+
+    Parameters:
+        df (pandas.DataFrame):
+            Holds the data to be fitted. Either concentrations vs time
+            or charge passed vs time depending on the situation.
+        fit (numpy.ndarray):
+            Holds the fit evaluation.
+        dfit (numpy.ndarray):
+            Holds the derivatives of the fit evaluation with respect to
+            the varying parameters, the last axis being the parameters.
+        names:
+            Names of the columns in df that hold the data to be compared
+            to the fit values.
+
+    Returns:
+        numpy.ndarray:
+            Jacobian with shape (residuals, parameters), the rows
+            corresponding to missing (nan) data are removed, consistently
+            with the nan_policy used in lmfit.minimize.
+    """
+
+    jac = list()
+
+    # same reshaping as in the calculate_residuals function
+    if len(fit.shape) == 1:
+        fit = fit.reshape(-1,1)
+        dfit = dfit.reshape(dfit.shape[0], 1, -1)
+
+    for i, name in enumerate(names):
+
+        data = df[name].to_numpy(dtype = float)
+
+        # derivative of the normalized residuals (data - fit)/(data + fit)
+        # with respect to the fit, set to 0 where the residuals are set to 0
+        norm = data + fit[:,i]
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            scale = -2*data/norm**2
+        scale[norm == 0] = 0
+
+        if "weight" in df:
+            scale *= np.sqrt(df["weight"].to_numpy(dtype = float))
+
+        partial_jac = scale[:,np.newaxis]*dfit[:,i,:]
+
+        jac.append(partial_jac[np.isfinite(data)])
+
+    return np.concatenate(jac)
+
+
 def residuals(
     params,
     df_c,
     derivatives,
     tracked_species,
     df_q = None,
-    c_to_q = None
+    c_to_q = None,
+    time_grid = None,
+    solver = None,
+    jac = None
     ):
 
     """Calculates residuals for concentrations vs t and optionally charge vs t.
+
+    If the charge passed is fitted, the model is solved a single time on
+    the merged time values of df_c and df_q.
     
     Parameters:
         params (lmfit.parameter.Parameters):
@@ -264,52 +2355,154 @@ def residuals(
         derivatives (function):
             A function in the form dy = f(y, t, p) used to compute
             d(concentration)/dt at a time t for each species. Used by
-            scipy.integrate.odeint
+            scipy.integrate.odeint by default
         tracked_species (list):
             Column names in df_c corresponding to the fitted data (used
             to exclude e.g. the "t" column).
         df_q (pandas.DataFrame, optional):
             Holds the charge passed vs time data to be fitted.
-        c_to_q (function, optional):
+        c_to_q (function or Observable, optional):
             Used to convert the concentrations over time evolution into
-            charge passed.
+            charge passed, see the :func:`fit_dataset` function.
+        time_grid (tuple, optional):
+            Output of :func:`merge_times` for df_c["t"] and df_q["t"],
+            computed here if not given.
+        solver|jac (optional):
+            Passed to the :func:`evaluate` function.
     Returns:
         list:
             Residuals values.
     """
 
-    # get evaluation of the fitted concentrations vs time
+    # if the needed data and conversion function are not given, only fit the
+    # concentrations over time
+    if df_q is None or c_to_q is None:
+
+        # get evaluation of the fitted concentrations vs time
+        c = evaluate(
+            derivatives = derivatives,
+            params = params,
+            t = df_c["t"],
+            solver = solver,
+            jac = jac
+            )
+
+        # calculate residuals between data and fit for concentrations vs time
+        return calculate_residuals(df_c, c, tracked_species)
+
+    # else fit charge passed over time as well: get evaluation of the fitted
+    # concentrations on the merged time values of both datasets
+    if time_grid is None:
+        time_grid = merge_times(df_c["t"], df_q["t"])
+    t, (idx_c, idx_q) = time_grid
+
     c = evaluate(
         derivatives = derivatives,
         params = params,
-        t = df_c["t"]
+        t = t,
+        solver = solver,
+        jac = jac
         )
 
     # calculate residuals between data and fit for concentrations vs time
-    res = calculate_residuals(df_c, c, tracked_species)
-
-    # if the needed data and conversion function are given, fit charge passed
-    # over time
-    if df_q is not None and c_to_q is not None:
+    res = calculate_residuals(df_c, c[idx_c], tracked_species)
 
-        # get evaluation of the fitted concentrations vs time (time in this
-        # case is the time recorded in the charge passed vs time data)
-        c = evaluate(
-            derivatives = derivatives,
-            params = params,
-            t = df_q["t"]
-            )
+    # convert concentrations to charge passed
+    q = as_observable(c_to_q)(c[idx_q])
 
-        # convert concentrations to charge passed
-        q = c_to_q(c)
-        
-        # calculate residuals between data and fit for charge vs time and add
-        # these residuals to the res array
-        res.extend(calculate_residuals(df_q, q, "Q"))
+    # calculate residuals between data and fit for charge vs time and add these
+    # residuals to the res array
+    res.extend(calculate_residuals(df_q, q, "Q"))
 
     return res
 
 
+def jacobian(
+    params,
+    df_c,
+    derivatives,
+    tracked_species,
+    df_q = None,
+    c_to_q = None,
+    time_grid = None,
+    solver = None,
+    jac = None,
+    jac_p = None
+    ):
+
+    """Calculates the Jacobian of the residuals function.
+
+    The derivatives of the concentrations with respect to the varying
+    parameters are obtained from the :func:`evaluate_sensitivities`
+    function. Used as the Dfun argument of lmfit.minimize.
+
+    Parameters:
+        params (lmfit.parameter.Parameters):
+            The parameters values used to compute the derivatives
+            function, for details on this object class see:
+            https://lmfit.github.io/lmfit-py/parameters.html
+        df_c (pandas.DataFrame):
+            Holds the concentration vs time data to be fitted.
+        derivatives (function):
+            A function in the form dy = f(y, t, p) used to compute
+            d(concentration)/dt at a time t for each species. Used by
+            scipy.integrate.odeint by default
+        tracked_species (list):
+            Column names in df_c corresponding to the fitted data (used
+            to exclude e.g. the "t" column).
+        df_q (pandas.DataFrame, optional):
+            Holds the charge passed vs time data to be fitted.
+        c_to_q (function or Observable, optional):
+            Used to convert the concentrations over time evolution into
+            charge passed, see the :func:`fit_dataset` function.
+        time_grid (tuple, optional):
+            Output of :func:`merge_times` for df_c["t"] and df_q["t"],
+            computed here if not given.
+        solver|jac|jac_p (optional):
+            Passed to the :func:`evaluate_sensitivities` function.
+    Returns:
+        numpy.ndarray:
+            Jacobian with shape (residuals, varying parameters).
+    """
+
+    # same order as the variables handled by lmfit.minimize
+    names = [key for key in params if params[key].vary]
+
+    # as in the residuals function, solve the model once on the merged time
+    # values if the charge passed is fitted
+    fit_q = df_q is not None and c_to_q is not None
+    if not fit_q:
+        t, idx_c = df_c["t"], slice(None)
+    else:
+        if time_grid is None:
+            time_grid = merge_times(df_c["t"], df_q["t"])
+        t, (idx_c, idx_q) = time_grid
+
+    # get evaluation of the fitted concentrations vs time and their
+    # sensitivities
+    c, s = evaluate_sensitivities(
+        derivatives = derivatives,
+        params = params,
+        t = t,
+        names = names,
+        jac = jac,
+        jac_p = jac_p,
+        solver = solver
+        )
+
+    jac_c = calculate_jacobian(df_c, c[idx_c], s[idx_c], tracked_species)
+
+    if not fit_q:
+        return jac_c
+
+    # charge passed and its sensitivities, see the Observable class
+    c_to_q = as_observable(c_to_q)
+    q = c_to_q(c[idx_q])
+    dq = c_to_q.sensitivities(c[idx_q], s[idx_q])
+
+    return np.concatenate([jac_c, calculate_jacobian(df_q, q, dq, ["Q"])])
+
+
 def print_result(dataset):
 
     """ Pretty printing of the fit parameters stored in dataset.
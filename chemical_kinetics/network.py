@@ -0,0 +1,402 @@
+"""
+This module defines the :class:`Network` class that compiles a list of
+reactions into a kinetic model. The reactions are described by their
+reactants, products, rate constant name and optionally their orders, and
+are compiled into a stoichiometry matrix and a vectorised rate law.
+
+The methods :meth:`Network.derivatives`, :meth:`Network.jac` and
+:meth:`Network.jac_p` can be passed directly to the functions of the
+:mod:`fit` module, as the **derivatives**, **jac** and **jac_p**
+parameters respectively. Networks of first order reactions are linear,
+their methods :meth:`Network.rate_matrix` and :meth:`Network.rate_matrix_p`
+can then be used to build a :class:`fit.LinearModel`.
+"""
+
+
+import numpy as np
+
+
+class Network:
+
+    """Compiles a reaction network into a vectorised kinetic model.
+
+    Each reaction is either a dictionary with the keys "reactants",
+    "products", "k" and optionally "orders", or a tuple holding these
+    values in this order. The reactants and products are given as a list
+    of species names (a name can be repeated) or as a dictionary species
+    name (str): stoichiometric coefficient (float). The orders are given
+    as a dictionary species name (str): order (float), by default the
+    orders are the stoichiometric coefficients of the reactants (mass
+    action law). The rate of each reaction is then:
+
+        r = k * prod(c_i**order_i)
+
+    For example the reactions A -> B and 2 B -> C are described by:
+
+    >>> network = Network([
+    ...     (["A"], ["B"], "k1"),
+    ...     dict(reactants = {"B": 2}, products = ["C"], k = "k2")
+    ...     ])
+
+    Parameters:
+        reactions (list):
+            The reactions of the network, see above.
+        species (list, optional):
+            Species names, sets the order of the species in the
+            concentrations array. This order should be the same as the
+            order of the initial concentrations parameters used for the
+            fit, i.e. the tracked species followed by the untracked
+            species. If None, the species are ordered as they first
+            appear in the reactions.
+
+    Attributes:
+        species (list):
+            Species names, in the order of the concentrations array.
+        rate_constants (list):
+            Names of the rate constants, i.e. of the parameters needed
+            to compute the derivatives.
+        stoichiometry (numpy.ndarray):
+            Stoichiometry matrix with shape (species, reactions), the
+            net number of molecules of each species formed by each
+            reaction.
+        orders (numpy.ndarray):
+            Orders matrix with shape (reactions, species).
+        jac_sparsity (numpy.ndarray):
+            Sparsity pattern of the Jacobian with shape (species,
+            species), True where the derivative of a species (row) can
+            depend on the concentration of a species (column). Can be
+            passed to the integrators, see :func:`fit.evaluate`.
+    """
+
+    def __init__(self, reactions, species = None):
+        """ Class constructor """
+
+        reactions = [_parse_reaction(reaction) for reaction in reactions]
+
+        # initialize the species names in order of appearance if not given
+        if species is None:
+            species = list()
+            for reactants, products, k, orders in reactions:
+                for name in [*reactants, *products]:
+                    if name not in species: species.append(name)
+
+        self.species = list(species)
+
+        # unique rate constants names and, for each reaction, the index of its
+        # rate constant
+        self.rate_constants = list()
+        for reactants, products, k, orders in reactions:
+            if k not in self.rate_constants: self.rate_constants.append(k)
+        self._k_index = np.array(
+            [self.rate_constants.index(k) for _, _, k, _ in reactions],
+            dtype = int
+            )
+
+
+        ########################################################################
+        # build the stoichiometry and orders matrices
+        ########################################################################
+
+        index = {name: i for i, name in enumerate(self.species)}
+
+        self.stoichiometry = np.zeros((len(self.species), len(reactions)))
+        self.orders = np.zeros((len(reactions), len(self.species)))
+
+        for j, (reactants, products, k, orders) in enumerate(reactions):
+            for name in [*reactants, *products, *orders]:
+                if name not in index:
+                    raise ValueError(
+                        f"species '{name}' of reaction {j} is not in species"
+                        )
+            for name, coef in reactants.items():
+                self.stoichiometry[index[name], j] -= coef
+            for name, coef in products.items():
+                self.stoichiometry[index[name], j] += coef
+            for name, order in orders.items():
+                self.orders[j, index[name]] = order
+
+
+        ########################################################################
+        # compact representation of the orders used to compute the rates
+        ########################################################################
+
+        # each reaction only depends on a few species, the rate law is therefore
+        # computed from the (reactions, slots) arrays holding the index and
+        # order of each of these species; reactions with less species are
+        # padded with an order 0, which does not change their rates
+        slots = [np.flatnonzero(row) for row in self.orders]
+        n_slots = max([len(s) for s in slots] + [1])
+
+        self._slot_index = np.zeros((len(reactions), n_slots), dtype = int)
+        self._slot_order = np.zeros((len(reactions), n_slots))
+        for j, s in enumerate(slots):
+            self._slot_index[j,:len(s)] = s
+            self._slot_order[j,:len(s)] = self.orders[j,s]
+
+        # a species derivative depends on the concentrations of the species
+        # setting the rates of the reactions in which it is involved
+        self.jac_sparsity = (
+            (np.abs(self.stoichiometry) @ (self.orders != 0)) != 0
+            )
+
+        # networks of first order reactions only, the rates are then simply
+        # proportional to the reactants concentrations
+        self._first_order = n_slots == 1 and np.all(self._slot_order == 1)
+
+
+    def rates(self, y, p):
+
+        """Calculates the rate of each reaction.
+
+        Parameters:
+            y (numpy.ndarray):
+                Concentrations, axis 0 is species. Additional axes (e.g.
+                several sets of concentrations) are broadcast.
+            p (dict):
+                Parameter name (str): value, must hold all the rate
+                constants of the network. The values can be arrays
+                broadcast with the additional axes of y.
+
+        Returns:
+            numpy.ndarray:
+                Rates with shape (reactions, ...).
+        """
+
+        k = self._k(p, np.ndim(y))
+
+        if self._first_order:
+            return k*y[self._slot_index[:,0]]
+
+        return k*np.prod(self._powers(y), axis = 1)
+
+
+    def derivatives(self, y, t, p):
+
+        """Calculates the derivatives of the concentrations at t.
+
+        Has the same signature as the derivatives functions used in the
+        :mod:`fit` module, i.e. dy = f(y, t, p).
+
+        Parameters:
+            y (numpy.ndarray):
+                Concentrations, axis 0 is species. Additional axes (e.g.
+                several sets of concentrations) are broadcast.
+            t (float):
+                Time value where the derivatives are calculated, not used
+                since the rate laws do not depend explicitly on time.
+            p (dict):
+                Parameter name (str): value, must hold all the rate
+                constants of the network.
+
+        Returns:
+            numpy.ndarray:
+                Derivatives with the same shape as y.
+        """
+
+        return self.stoichiometry @ self.rates(np.asarray(y, dtype = float), p)
+
+
+    def jac(self, y, t, p):
+
+        """Calculates the d(derivatives)/d(concentration) matrix at t.
+
+        Parameters:
+            y (numpy.ndarray):
+                Concentrations with shape (species,).
+            t (float):
+                Time value, not used.
+            p (dict):
+                Parameter name (str): value, must hold all the rate
+                constants of the network.
+
+        Returns:
+            numpy.ndarray:
+                Matrix J with shape (species, species), J[i, j] being the
+                derivative of the species i derivative with respect to
+                the concentration of species j.
+        """
+
+        y = np.asarray(y, dtype = float)
+        k = self._k(p, 1)
+
+        powers = self._powers(y)
+        order = self._slot_order
+
+        # derivative of each rate with respect to the concentration of the
+        # species in each slot: k*order*c**(order - 1)*(product over the
+        # other slots); padded slots have an order 0 and a null derivative
+        d_rates = np.empty_like(powers)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            d_powers = np.where(
+                order != 0,
+                order*y[self._slot_index]**(order - 1),
+                0
+                )
+        for s in range(powers.shape[1]):
+            others = np.prod(np.delete(powers, s, axis = 1), axis = 1)
+            d_rates[:,s] = k*d_powers[:,s]*others
+
+        # scatter in a (reactions, species) matrix
+        d_rates_dy = np.zeros((len(k), len(self.species)))
+        rows = np.repeat(np.arange(len(k)), powers.shape[1])
+        np.add.at(
+            d_rates_dy,
+            (rows, self._slot_index.ravel()),
+            d_rates.ravel()
+            )
+
+        return self.stoichiometry @ d_rates_dy
+
+
+    def jac_p(self, y, t, p):
+
+        """Calculates the d(derivatives)/d(rate constant) vectors at t.
+
+        Parameters:
+            y (numpy.ndarray):
+                Concentrations with shape (species,).
+            t (float):
+                Time value, not used.
+            p (dict):
+                Parameter name (str): value, must hold all the rate
+                constants of the network.
+
+        Returns:
+            dict:
+                Rate constant name (str): derivatives (numpy.ndarray)
+                with shape (species,).
+        """
+
+        y = np.asarray(y, dtype = float)
+
+        # the rates being proportional to their rate constant, their
+        # derivatives are the products of the concentrations powers
+        products = np.prod(self._powers(y), axis = 1)
+
+        # sum the contributions of the reactions sharing the same rate constant
+        d_rates_dk = np.zeros((len(products), len(self.rate_constants)))
+        d_rates_dk[np.arange(len(products)), self._k_index] = products
+
+        dp = self.stoichiometry @ d_rates_dk
+
+        return {name: dp[:,i] for i, name in enumerate(self.rate_constants)}
+
+
+    def rate_matrix(self, p):
+
+        """Calculates the rate matrix K of a first order network.
+
+        For networks of first order reactions the derivatives are linear
+        in the concentrations: dy/dt = K.y.
+
+        Parameters:
+            p (dict):
+                Parameter name (str): value, must hold all the rate
+                constants of the network.
+
+        Returns:
+            numpy.ndarray:
+                Rate matrix with shape (species, species).
+        """
+
+        if not self._first_order:
+            raise ValueError(
+                "the rate matrix is only defined for networks of first" +
+                " order reactions"
+                )
+
+        return (self.stoichiometry*self._k(p, 1)) @ self.orders
+
+
+    def rate_matrix_p(self, p):
+
+        """Calculates the d(rate matrix)/d(rate constant) matrices.
+
+        Parameters:
+            p (dict):
+                Parameter name (str): value, must hold all the rate
+                constants of the network.
+
+        Returns:
+            dict:
+                Rate constant name (str): derivative of the rate matrix
+                (numpy.ndarray) with shape (species, species).
+        """
+
+        if not self._first_order:
+            raise ValueError(
+                "the rate matrix is only defined for networks of first" +
+                " order reactions"
+                )
+
+        return {
+            name: (self.stoichiometry*(self._k_index == i)) @ self.orders
+            for i, name in enumerate(self.rate_constants)
+            }
+
+
+    def _k(self, p, ndim):
+
+        """Rate constant of each reaction, shaped to broadcast with y.
+
+        The rate constants are either floats or arrays (e.g. one value
+        per set of concentrations, see fit.evaluate_batch).
+        """
+
+        values = list(map(p.__getitem__, self.rate_constants))
+
+        if np.ndim(values[0]) == 0:
+            k = np.fromiter(values, dtype = float, count = len(values))
+            return k[self._k_index].reshape((-1,) + (1,)*(ndim - 1))
+
+        k = np.asarray(values, dtype = float)[self._k_index]
+
+        return k.reshape(k.shape + (1,)*(ndim - k.ndim))
+
+
+    def _powers(self, y):
+
+        """Concentrations to the power of their orders, for each slot."""
+
+        shape = self._slot_order.shape + (1,)*(np.ndim(y) - 1)
+
+        return y[self._slot_index]**self._slot_order.reshape(shape)
+
+
+def _parse_reaction(reaction):
+
+    """Converts a reaction to a (reactants, products, k, orders) tuple.
+
+    The reactants, products and orders are returned as dictionaries.
+    """
+
+    if isinstance(reaction, dict):
+        reactants = reaction["reactants"]
+        products = reaction["products"]
+        k = reaction["k"]
+        orders = reaction.get("orders")
+    else:
+        reactants, products, k, *orders = reaction
+        orders = orders[0] if orders else None
+
+    reactants = _coefficients(reactants)
+    products = _coefficients(products)
+
+    # mass action law by default
+    if orders is None: orders = reactants
+
+    return reactants, products, k, dict(orders)
+
+
+def _coefficients(species):
+
+    """Converts a list of species names to a dictionary of coefficients."""
+
+    if isinstance(species, dict):
+        return dict(species)
+
+    coefficients = dict()
+    for name in species:
+        coefficients[name] = coefficients.get(name, 0) + 1
+
+    return coefficients
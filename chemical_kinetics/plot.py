@@ -5,12 +5,26 @@ species concentration evolution over time and the function :func:`plot_q` plots
 passed evolution over time. If no fit was performed on the dataset
 object these functions only plot the raw data. If a fit was performed it
 also plot the fit estimation.
+
+The same plots can be drawn on any matplotlib Axes with the functions
+:func:`draw_c` and :func:`draw_q`. To render many datasets without a
+display, e.g. a quality control report of a batch of fits on a compute
+node, the :func:`render_report` function draws them off-screen with the
+Agg backend, reusing a single figure (see the :class:`Renderer` class)
+in each process of a pool, and writes them to .png, .svg or .pdf files.
 """
 
 
+import concurrent.futures
+import html
+import os
+import matplotlib.backends.backend_agg
+import matplotlib.figure
 import matplotlib.pyplot as plt
 import numpy as np
 
+from . import data
+
 
 def plot_c(dataset, names = None):
     """Plots the species concentrations evolution over time and its fit.
@@ -28,6 +42,41 @@ def plot_c(dataset, names = None):
             plotted, if None all concentrations are plotted.
     """
 
+    plt.figure()
+    draw_c(plt.gca(), dataset, names)
+    plt.show()
+
+
+def plot_q(dataset):
+    """Plots the charge passed over time and its fit.
+    
+    Plots the fit results only if the data has been fitted once, i.e.
+    chemical_kinetics.fit.fit_dataset function was run once on the
+    dataset. Else it only plots the raw data.
+
+    Parameters:
+        dataset (chemical_kinetics.data.Dataset):
+            Object holding the DataFrame containing the data and the fit
+            results.
+    """
+
+    plt.figure()
+    draw_q(plt.gca(), dataset)
+    plt.show()
+
+
+def draw_c(ax, dataset, names = None):
+    """Draws the species concentrations evolution over time and its fit on ax.
+
+    See the :func:`plot_c` function.
+
+    Parameters:
+        ax (matplotlib.axes.Axes):
+            The axes to draw on.
+        dataset|names:
+            See the :func:`plot_c` function.
+    """
+
     # make names hold all the species names if names is None
     if names is None: names = dataset.names
 
@@ -37,7 +86,6 @@ def plot_c(dataset, names = None):
     df_fit = dataset.df_c_fit
 
     # plot data
-    plt.figure()
     # variable **colors** used to store the raw data plot color in order to use
     # the same color for the fit result
     colors = dict()
@@ -51,14 +99,14 @@ def plot_c(dataset, names = None):
         # of the raw data (i.e. only one data file was loaded when creating
         # **dataset**); if no standard deviation were generated use plot to plot
         # the data, else use error-bar to plot the data
-        if np.all(np.isnan(df_std[name])):
-            p = plt.plot(
+        if df_std is None or np.all(np.isnan(df_std[name])):
+            p = ax.plot(
                 df["t"],
                 df[name],
                 **style
                 )
         else:
-            p = plt.errorbar(
+            p = ax.errorbar(
                 df["t"],
                 df[name],
                 yerr = df_std[name],
@@ -68,33 +116,35 @@ def plot_c(dataset, names = None):
         colors[name] = p[0].get_color()
 
     # set labels and legend
-    plt.xlabel(dataset.t_label)
-    plt.ylabel(dataset.c_label)
-    plt.legend()
+    ax.set_xlabel(dataset.t_label)
+    ax.set_ylabel(dataset.c_label)
+    ax.legend()
 
     # if **dataset** contains fit result data, plot it
     if df_fit is not None:
         for name in names:
-            plt.plot(
+            ax.plot(
                 df_fit["t"],
                 df_fit[name],
                 color = colors[name]
                 )
 
-    plt.show()
 
+def draw_q(ax, dataset, max_points = None):
+    """Draws the charge passed over time and its fit on ax.
 
-def plot_q(dataset):
-    """Plots the charge passed over time and its fit.
-    
-    Plots the fit results only if the data has been fitted once, i.e.
-    chemical_kinetics.fit.fit_dataset function was run once on the
-    dataset. Else it only plots the raw data.
+    See the :func:`plot_q` function.
 
     Parameters:
+        ax (matplotlib.axes.Axes):
+            The axes to draw on.
         dataset (chemical_kinetics.data.Dataset):
-            Object holding the DataFrame containing the data and the fit
-            results.
+            See the :func:`plot_q` function.
+        max_points (int, optional):
+            If the charge passed data have more points, they are reduced
+            to about this number of points before drawing, see the
+            data.decimate function. Dense traces are then drawn much
+            faster, with no visible difference.
     """
 
     # rename variables to simplify code
@@ -102,27 +152,259 @@ def plot_q(dataset):
     df_std = dataset.df_q_std
     df_fit = dataset.df_q_fit
 
-    plt.figure()
-    
+    if max_points is not None and len(df) > max_points:
+        df, df_std = data.decimate(df, df_std, max_points, weights = False)
+
     # use a filled area to simplify the raw data standard deviation
     # visualization
-    plt.fill_between(
-        df["t"],
-        df["Q"] - df_std["Q"],
-        df["Q"] + df_std["Q"],
-        color = "C0", alpha = 0.3, lw = 0
-        )
+    if df_std is not None:
+        ax.fill_between(
+            df["t"],
+            df["Q"] - df_std["Q"],
+            df["Q"] + df_std["Q"],
+            color = "C0", alpha = 0.3, lw = 0
+            )
 
     # plot the raw data
-    plt.plot(df["t"], df["Q"], label = "data")
+    ax.plot(df["t"], df["Q"], label = "data")
 
     # if **dataset** contains fit result data, plot it
     if df_fit is not None:
-        plt.plot(df_fit["t"], df_fit["Q"], "--", label = "fit")
+        ax.plot(df_fit["t"], df_fit["Q"], "--", label = "fit")
 
     # set labels and legend
-    plt.xlabel(dataset.t_label)
-    plt.ylabel(dataset.q_label)
-    plt.legend()
+    ax.set_xlabel(dataset.t_label)
+    ax.set_ylabel(dataset.q_label)
+    ax.legend()
+
+
+class Renderer:
+
+    """Draws datasets off-screen on a reused figure.
+
+    The figure is drawn by the Agg backend without pyplot, so that no
+    display is needed and no figure is kept open. It has two axes, the
+    concentrations (see :func:`draw_c`) and the charge passed (see
+    :func:`draw_q`, hidden for the datasets without charge passed data),
+    cleared and drawn again for each dataset.
+
+    Parameters:
+        figsize (tuple, optional):
+            Size of the figure in inches.
+        dpi (int, optional):
+            Resolution of the raster files.
+        max_points (int, optional):
+            See the :func:`draw_q` function.
+
+    Attributes:
+        figure (matplotlib.figure.Figure):
+            The figure.
+        ax_c|ax_q (matplotlib.axes.Axes):
+            The concentrations and charge passed axes.
+        max_points (int):
+            The stored parameter.
+    """
+
+    def __init__(self, figsize = (10, 4), dpi = 100, max_points = 2000):
+        """ Class constructor """
+
+        # fixed margins, a layout engine would place the axes again at each
+        # rendering, doubling its time
+        self.figure = matplotlib.figure.Figure(figsize = figsize, dpi = dpi)
+        matplotlib.backends.backend_agg.FigureCanvasAgg(self.figure)
+        self.ax_c, self.ax_q = self.figure.subplots(1, 2)
+        self.figure.subplots_adjust(
+            left = 0.08, right = 0.98, bottom = 0.13, top = 0.9, wspace = 0.25
+            )
+        self.max_points = max_points
+
+
+    def draw(self, dataset, title = None):
+
+        """Draws dataset on the figure, replacing the previous one."""
+
+        self.ax_c.clear()
+        self.ax_q.clear()
+
+        draw_c(self.ax_c, dataset)
+        has_q = dataset.df_q is not None
+        self.ax_q.set_visible(has_q)
+        if has_q:
+            draw_q(self.ax_q, dataset, self.max_points)
+
+        self.figure.suptitle("" if title is None else title)
+
+
+    def render(self, dataset, paths, title = None):
+
+        """Draws dataset and writes it to each path, e.g. .png and .pdf files."""
+
+        self.draw(dataset, title)
+        for path in paths:
+            self.figure.savefig(path)
+
+
+def render_report(
+    datasets,
+    directory,
+    names = None,
+    formats = ("png",),
+    processes = None,
+    figsize = (10, 4),
+    dpi = 100,
+    max_points = 2000
+    ):
+
+    """Renders the plots of many datasets to files, e.g. for quality control.
+
+    Each dataset is drawn by a :class:`Renderer`, one per process, and
+    written to <directory>/<name>.<format> for each format. An
+    index.html file showing all the plots is also written.
+
+    Parameters:
+        datasets (list):
+            The datasets (data.Dataset objects) or the paths of datasets
+            saved by the data.Dataset.save method, which are then loaded
+            by the processes.
+        directory (str):
+            Output directory, created if needed.
+        names (list, optional):
+            Name of each dataset, used for its files and title. By
+            default the paths of the saved datasets relative to their
+            common directory (without extension, "/" replaced by "_"),
+            or the index of the dataset.
+        formats (list, optional):
+            File formats, e.g. "png", "svg" or "pdf".
+        processes (int, optional):
+            Number of processes rendering the plots, if None or 1 they
+            are rendered in the current process.
+        figsize|dpi|max_points (optional):
+            See the :class:`Renderer` class.
+
+    Returns:
+        list:
+            For each dataset the list of the paths of its files.
+    """
+
+    if isinstance(formats, str):
+        formats = [formats]
+    if names is None:
+        names = _report_names(datasets)
+
+    os.makedirs(directory, exist_ok = True)
+    jobs = list()
+    for dataset, name in zip(datasets, names):
+        # only the frames to draw are sent to the processes, not e.g. the
+        # model functions of the fit curves
+        if not isinstance(dataset, str):
+            dataset = _plot_frames(dataset)
+        paths = [os.path.join(directory, f"{name}.{fmt}") for fmt in formats]
+        jobs.append((dataset, paths, name))
+
+    options = dict(figsize = figsize, dpi = dpi, max_points = max_points)
+
+    if processes is not None and processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+            processes,
+            initializer = _init_worker,
+            initargs = (options,)
+            ) as executor:
+            chunksize = max(1, len(jobs)//(4*processes))
+            list(executor.map(_worker_render, *zip(*jobs), chunksize = chunksize))
+    else:
+        renderer = Renderer(**options)
+        for job in jobs:
+            _render(renderer, *job)
+
+    _write_index(directory, names, formats)
+
+    return [paths for _, paths, _ in jobs]
+
+
+def _render(renderer, dataset, paths, title):
+
+    """Renders a dataset, loaded first if it is the path of a saved dataset."""
+
+    if isinstance(dataset, str):
+        dataset = data.load_dataset(dataset)
+
+    renderer.render(dataset, paths, title)
+
+
+def _plot_frames(dataset):
+
+    """Copy of dataset holding only the frames and labels to draw."""
+
+    copy = data.Dataset(
+        t_label = dataset.t_label,
+        c_label = dataset.c_label,
+        q_label = dataset.q_label
+        )
+    copy.names = dataset.names
+    for name in ("df_c", "df_c_std", "df_c_fit", "df_q", "df_q_std", "df_q_fit"):
+        setattr(copy, name, getattr(dataset, name))
+
+    return copy
+
+
+def _report_names(datasets):
+
+    """Default names of the datasets of a report."""
+
+    paths = [dataset for dataset in datasets if isinstance(dataset, str)]
+    if len(paths) != len(datasets) or not paths:
+        return [str(i) for i in range(len(datasets))]
+
+    if len(paths) == 1:
+        return [os.path.splitext(os.path.basename(paths[0]))[0]]
+
+    root = os.path.commonpath([os.path.abspath(path) for path in paths])
+
+    return [
+        os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0]
+        .replace(os.sep, "_")
+        for path in paths
+        ]
+
+
+def _write_index(directory, names, formats):
+
+    """Writes the index.html page of a report."""
+
+    image = next((fmt for fmt in formats if fmt in ("png", "svg")), None)
+
+    lines = ["<!DOCTYPE html>", "<html><body>"]
+    for name in names:
+        lines.append(f"<h3>{html.escape(name)}</h3>")
+        if image is not None:
+            lines.append(f'<img src="{html.escape(f"{name}.{image}")}">')
+        links = [
+            f'<a href="{html.escape(f"{name}.{fmt}")}">{fmt}</a>'
+            for fmt in formats if fmt != image
+            ]
+        if links:
+            lines.append(" ".join(links))
+    lines.append("</body></html>")
+
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+# renderer used by the processes of the pool created in this module, created
+# once when the processes are initialized
+_worker_renderer = None
+
+
+def _init_worker(options):
+
+    """Initializer of the processes used by render_report."""
+
+    global _worker_renderer
+    _worker_renderer = Renderer(**options)
+
+
+def _worker_render(dataset, paths, title):
+
+    """Renders a dataset in a worker process."""
 
-    plt.show()
\ No newline at end of file
+    _render(_worker_renderer, dataset, paths, title)
@@ -0,0 +1,375 @@
+"""
+This module defines the :class:`FitProblem` class, into which the
+:func:`fit.fit_dataset` function and the other fit functions compile the
+data to be fitted: the residuals and their Jacobian are then calculated
+from the model evaluations with numpy operations only, the data and the
+parameters layout being fixed.
+"""
+
+
+import time
+import numpy as np
+
+from .fit import _evaluate, as_observable, evaluate_sensitivities, merge_times
+
+
+# information returned for the evaluations reused by a FitProblem, see its
+# seed method
+_EXTENDED_INFO = dict(
+    nfev = 0,
+    njev = 0,
+    success = True,
+    message = "Previous evaluation reused."
+    )
+
+
+class FitProblem:
+
+    """Compiled residuals and Jacobian functions of the fit of a dataset.
+
+    The data to be fitted are compiled once into contiguous arrays: the
+    fitted values, without the missing (nan) data, are stored in the
+    order of the residuals calculated by the :func:`fit.residuals` function
+    (concentrations species by species, then charge passed), along with
+    the index of the corresponding values in the model evaluation. The
+    parameters are read in a fixed order, the initial concentrations
+    ('c0_' in their key) being the model state in the order of params.
+
+    The residuals and Jacobian are then calculated with numpy operations
+    only, they have the same values as with the :func:`fit.residuals` and
+    :func:`fit.jacobian` functions, without the missing data. As in these
+    functions, the residuals of the charge passed data are multiplied by
+    the square root of their weights if df_q has a "weight" column (see
+    data.decimate).
+
+    Parameters:
+        params (lmfit.parameter.Parameters):
+            The parameters of the fit, sets the order in which they are
+            read. The parameters passed to the methods must have the
+            same keys.
+        df_c|derivatives|tracked_species|df_q|c_to_q:
+            See the :func:`fit.residuals` function.
+        solver|jac|jac_p (optional):
+            See the :func:`fit.fit_dataset` function.
+
+    Attributes:
+        t (numpy.ndarray):
+            Time values on which the model is solved, the merged time
+            values of df_c and df_q if the charge passed is fitted.
+        data (numpy.ndarray):
+            Fitted data values, in the order of the residuals.
+        keys (list):
+            Parameters keys, in the order in which they are read.
+        derivatives|tracked_species|c_to_q|solver|jac|jac_p:
+            Stored parameters, e.g. to compile the same problem for
+            other data.
+        profile (profiling.FitProfile):
+            If not None, records each residuals and Jacobian calculation,
+            see the :func:`fit.fit_dataset` function.
+        solution (tuple):
+            Parameters values (numpy.ndarray, in the order of keys) and
+            model evaluation on t of the last residuals calculation, None
+            before the first calculation.
+    """
+
+    def __init__(
+        self,
+        params,
+        df_c,
+        derivatives,
+        tracked_species,
+        df_q = None,
+        c_to_q = None,
+        solver = None,
+        jac = None,
+        jac_p = None
+        ):
+        """ Class constructor """
+
+        self.derivatives = derivatives
+        self.tracked_species = list(tracked_species)
+        self.c_to_q = as_observable(c_to_q) if df_q is not None else None
+        self.solver = solver
+        self.jac = jac
+        self.jac_p = jac_p
+        self.profile = None
+        self.solution = None
+        self._seed = None
+
+
+        ########################################################################
+        # parameters layout
+        ########################################################################
+
+        self.keys = list(params)
+        self._c0_index = np.array(
+            [i for i, key in enumerate(self.keys) if "c0_" in key],
+            dtype = int
+            )
+        self._p_index = np.array(
+            [i for i, key in enumerate(self.keys) if "c0_" not in key],
+            dtype = int
+            )
+        self._p_keys = [self.keys[i] for i in self._p_index]
+
+        # index of each tracked species in the model state
+        c0_keys = [self.keys[i] for i in self._c0_index]
+        missing = [
+            name for name in self.tracked_species
+            if f"c0_{name}" not in c0_keys
+            ]
+        if missing:
+            raise ValueError(f"no initial concentration parameter for {missing}")
+        columns = np.array(
+            [c0_keys.index(f"c0_{name}") for name in self.tracked_species],
+            dtype = int
+            )
+
+
+        ########################################################################
+        # time values and data arrays
+        ########################################################################
+
+        if self.c_to_q is not None:
+            self.t, (idx_c, idx_q) = merge_times(df_c["t"], df_q["t"])
+        else:
+            self.t, (idx_c,) = merge_times(df_c["t"])
+            idx_q = None
+
+        # concentrations, species by species; the index of each value in the
+        # flattened model evaluation with shape (time, species)
+        data_c = df_c[self.tracked_species].to_numpy(dtype = float).T.ravel()
+        flat_c = (
+            idx_c[np.newaxis,:]*len(c0_keys) + columns[:,np.newaxis]
+            ).ravel()
+
+        mask_c = np.isfinite(data_c)
+        self._flat_c = flat_c[mask_c]
+        self._n_c = int(mask_c.sum())
+
+        # scale of the residuals from the weights of the data, None if they all
+        # have the same weight
+        self._scale = None
+
+        if idx_q is not None:
+            data_q = df_q["Q"].to_numpy(dtype = float)
+            self._mask_q = np.isfinite(data_q)
+            self._idx_q = idx_q
+            self.data = np.concatenate([data_c[mask_c], data_q[self._mask_q]])
+            if "weight" in df_q:
+                weight_q = df_q["weight"].to_numpy(dtype = float)
+                self._scale = np.ones_like(self.data)
+                self._scale[self._n_c:] = np.sqrt(weight_q[self._mask_q])
+        else:
+            self.data = data_c[mask_c]
+
+        # preallocated buffers for the fit values and the normalization
+        self._fit = np.empty_like(self.data)
+        self._norm = np.empty_like(self.data)
+
+
+    def values(self, params):
+
+        """Splits the parameters values in initial concentrations and dict p."""
+
+        return self._split(self._vector(params))
+
+
+    def _vector(self, params):
+
+        """Parameters values in the order of keys."""
+
+        return np.fromiter(
+            (params[key].value for key in self.keys),
+            dtype = float,
+            count = len(self.keys)
+            )
+
+
+    def _split(self, values):
+
+        """Splits the parameters values in initial concentrations and dict p."""
+
+        c0 = values[self._c0_index]
+        p = dict(zip(self._p_keys, values[self._p_index].tolist()))
+
+        return c0, p
+
+
+    def seed(self, t, values, c):
+
+        """Provides a model evaluation to extend instead of solving the model.
+
+        When the residuals are calculated for the parameters values
+        **values**, and t is the beginning of the time values of the
+        problem, the model is only integrated from t[-1] over the
+        remaining time values, starting from the concentrations c[-1].
+        See the :func:`fit.refit_dataset` function.
+
+        Parameters:
+            t (numpy.ndarray):
+                Time values of the evaluation.
+            values (numpy.ndarray):
+                Parameters values of the evaluation, in the order of keys.
+            c (numpy.ndarray):
+                Model evaluation with shape (time, species).
+        """
+
+        t = np.asarray(t, dtype = float)
+
+        if len(t) <= len(self.t) and np.array_equal(self.t[:len(t)], t):
+            self._seed = (np.array(values, dtype = float), np.asarray(c))
+        else:
+            self._seed = None
+
+
+    def _extend(self, values):
+
+        """Extends the seed evaluation if it has the same parameters values.
+
+        The values are compared with a relative tolerance, since lmfit
+        converts the values of bounded parameters back and forth, which
+        can change their last digits.
+        """
+
+        seed_values, c_seed = self._seed
+        if not np.all(np.abs(values - seed_values) <= 1e-10*np.abs(seed_values)):
+            return None
+
+        n = len(c_seed)
+        if n == len(self.t):
+            return c_seed, _EXTENDED_INFO.copy()
+
+        c0, p = self._split(values)
+        c_new, info = _evaluate(
+            self.derivatives, c_seed[-1], p, self.t[n - 1:], self.solver, self.jac
+            )
+        c = np.concatenate([c_seed, c_new[1:]])
+
+        # the extended evaluation is kept for later calculations with the same
+        # parameters values
+        self._seed = (seed_values, c)
+
+        return c, info
+
+
+    def residuals(self, params):
+
+        """Calculates the residuals, see the fit.residuals function.
+
+        Parameters:
+            params (lmfit.parameter.Parameters):
+                The parameters values.
+
+        Returns:
+            numpy.ndarray:
+                Residuals values.
+        """
+
+        profile = self.profile
+        if profile is not None: mark = profile.mark()
+
+        values = self._vector(params)
+
+        extended = self._extend(values) if self._seed is not None else None
+        if extended is not None:
+            c, info = extended
+        else:
+            c0, p = self._split(values)
+            c, info = _evaluate(
+                self.derivatives, c0, p, self.t, self.solver, self.jac
+                )
+
+        # kept e.g. to warm start a later fit, see fit.refit_dataset
+        self.solution = (values, c)
+
+        if profile is not None: solved = time.perf_counter()
+
+        fit, norm = self._normalization(c)
+
+        # normalized residuals, set to 0 when both the data and the fit are 0
+        # as in the fit.calculate_residuals function
+        res = np.subtract(self.data, fit)
+        nonzero = norm != 0
+        np.divide(res, norm, out = res, where = nonzero)
+        res[~nonzero] = 0
+
+        if self._scale is not None:
+            res *= self._scale
+
+        if profile is not None:
+            profile.record("residuals", mark, solved, info, res, params, self.keys)
+
+        return res
+
+
+    def jacobian(self, params):
+
+        """Calculates the Jacobian of the residuals, see fit.jacobian.
+
+        Parameters:
+            params (lmfit.parameter.Parameters):
+                The parameters values.
+
+        Returns:
+            numpy.ndarray:
+                Jacobian with shape (residuals, varying parameters).
+        """
+
+        profile = self.profile
+        if profile is not None: mark = profile.mark()
+
+        names = [key for key in self.keys if params[key].vary]
+
+        c, s, info = evaluate_sensitivities(
+            derivatives = self.derivatives,
+            params = params,
+            t = self.t,
+            names = names,
+            jac = self.jac,
+            jac_p = self.jac_p,
+            solver = self.solver,
+            full_output = True
+            )
+
+        if profile is not None: solved = time.perf_counter()
+
+        # sensitivities of the fit values
+        dfit = np.empty((len(self.data), len(names)))
+        dfit[:self._n_c] = s.reshape(-1, len(names))[self._flat_c]
+
+        # charge passed sensitivities, see the fit.Observable class
+        if self.c_to_q is not None:
+            dq = self.c_to_q.sensitivities(c[self._idx_q], s[self._idx_q])
+            dfit[self._n_c:] = dq[self._mask_q]
+
+        # derivative of the normalized residuals (data - fit)/(data + fit)
+        # with respect to the fit, set to 0 where the residuals are set to 0
+        fit, norm = self._normalization(c)
+        nonzero = norm != 0
+        scale = np.zeros_like(norm)
+        np.divide(-2*self.data, norm**2, out = scale, where = nonzero)
+
+        if self._scale is not None:
+            scale *= self._scale
+
+        jacobian = scale[:,np.newaxis]*dfit
+
+        if profile is not None:
+            profile.record("jacobian", mark, solved, info)
+
+        return jacobian
+
+
+    def _normalization(self, c):
+
+        """Fills the fit values from the evaluation c and the normalization."""
+
+        fit = self._fit
+        np.take(c, self._flat_c, out = fit[:self._n_c])
+
+        if self.c_to_q is not None:
+            q = self.c_to_q(c[self._idx_q])
+            fit[self._n_c:] = q[self._mask_q]
+
+        return fit, np.add(self.data, fit, out = self._norm)
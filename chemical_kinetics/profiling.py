@@ -0,0 +1,371 @@
+"""
+This module defines the :class:`FitProfile` of a fit, the record of the
+calls and time of the derivatives function, of the integrator, of the
+residuals and Jacobian assembly and of the convergence of the fit,
+recorded by the :func:`fit.fit_dataset` function if its **profile**
+parameter is True.
+"""
+
+
+import functools
+import time
+import pandas as pd
+import numpy as np
+
+from .fit import LinearModel
+
+
+class FitProfile:
+
+    """Record of the cost of the residuals and Jacobian calculations of a fit.
+
+    Each calculation by a :class:`problem.FitProblem` is recorded as an
+    event holding its wall time split between the integrator and the
+    assembly of the residuals or Jacobian from the model evaluation, the
+    number of calls and time of the derivatives function (RHS) and of the
+    model Jacobian during the integration, and for the residuals the cost
+    (sum of the squared residuals, i.e. the chi-square) and the
+    parameters values. The integrator time excludes the time spent in the
+    derivatives function and model Jacobian, i.e. it is the overhead of
+    the integrator itself.
+
+    Recording an event only takes a few counter updates and time
+    measurements, the tables are built afterwards by the :attr:`history`,
+    :attr:`iterations` and :meth:`summary` members.
+
+    Attributes:
+        rhs_calls|jac_calls (int):
+            Total number of calls of the derivatives function and of the
+            model Jacobian.
+        rhs_time|jac_time (float):
+            Total time spent in these functions, in seconds.
+        elapsed (float):
+            Wall time between the creation of the profile and the call
+            of its stop method, in seconds.
+    """
+
+    def __init__(self):
+        """ Class constructor """
+
+        # [calls, time] of the derivatives function and of the model Jacobian,
+        # updated by the wrappers of these functions
+        self._rhs = [0, 0.0]
+        self._jac = [0, 0.0]
+
+        # (kind, start, solve time, assembly time, RHS calls, RHS time, Jacobian
+        # calls, Jacobian time, integrator nfev, cost, parameters values)
+        self._events = list()
+
+        self._start = time.perf_counter()
+        self.elapsed = None
+
+
+    def __repr__(self):
+
+        return (
+            f"FitProfile(events = {len(self._events)}," +
+            f" rhs_calls = {self.rhs_calls}, jac_calls = {self.jac_calls})"
+            )
+
+
+    @property
+    def rhs_calls(self):
+        return self._rhs[0]
+
+    @property
+    def rhs_time(self):
+        return self._rhs[1]
+
+    @property
+    def jac_calls(self):
+        return self._jac[0]
+
+    @property
+    def jac_time(self):
+        return self._jac[1]
+
+
+    def wrap_rhs(self, derivatives):
+
+        """Wraps the derivatives function to count and time its calls.
+
+        Linear models solved in closed form are not wrapped, since they
+        are recognized by their class, see the :func:`fit.evaluate`
+        function. For reduced models (see the reduction module), the
+        derivatives function and Jacobian of the reduced system are
+        counted and timed instead, the model Jacobian being then timed
+        as part of them.
+        """
+
+        if isinstance(derivatives, LinearModel):
+            return derivatives
+
+        if hasattr(derivatives, "reduce"):
+            return _TimedReduction(derivatives, self)
+
+        return _timed(derivatives, self._rhs)
+
+
+    def wrap_jac(self, jac):
+
+        """Wraps the model Jacobian to count and time its calls."""
+
+        return None if jac is None else _timed(jac, self._jac)
+
+
+    def mark(self):
+
+        """Returns the time and counters at the start of an event."""
+
+        return time.perf_counter(), *self._rhs, *self._jac
+
+
+    def record(self, kind, mark, solved, info, res = None, params = None, keys = None):
+
+        """Records an event.
+
+        Parameters:
+            kind (str):
+                "residuals" or "jacobian".
+            mark (tuple):
+                Value returned by the mark method at the start of the
+                event.
+            solved (float):
+                time.perf_counter value at the end of the integration.
+            info (dict):
+                Solve information returned by the integrator.
+            res (numpy.ndarray, optional):
+                Residuals values.
+            params (lmfit.parameter.Parameters, optional):
+                Parameters values of the residuals.
+            keys (list, optional):
+                Keys of the recorded parameters values.
+        """
+
+        end = time.perf_counter()
+        start, rhs_calls, rhs_time, jac_calls, jac_time = mark
+
+        if res is not None:
+            cost = float(np.dot(res, res))
+            values = [params[key].value for key in keys]
+        else:
+            cost = np.nan
+            values = None
+
+        self._events.append((
+            kind,
+            start - self._start,
+            solved - start,
+            end - solved,
+            self._rhs[0] - rhs_calls,
+            self._rhs[1] - rhs_time,
+            self._jac[0] - jac_calls,
+            self._jac[1] - jac_time,
+            info["nfev"],
+            cost,
+            values
+            ))
+
+
+    def stop(self):
+
+        """Sets the elapsed time of the fit."""
+
+        self.elapsed = time.perf_counter() - self._start
+
+
+    @property
+    def history(self):
+
+        """DataFrame of the recorded events.
+
+        The columns are: "kind" ("residuals" or "jacobian"), "start"
+        (time since the creation of the profile), "time" (wall time of
+        the event), "integrator" (time of the integration, excluding the
+        derivatives function and model Jacobian), "assembly" (time of the
+        residuals or Jacobian calculation from the model evaluation),
+        "rhs_calls", "rhs_time", "jac_calls", "jac_time", "nfev" (calls of
+        the derivatives function reported by the integrator, 0 for models
+        solved in closed form), "cost" (nan for the Jacobian) and
+        "step_norm" (Euclidean norm of the change of the parameters
+        values since the previous residuals calculation).
+        """
+
+        columns = [
+            "kind", "start", "solve", "assembly", "rhs_calls", "rhs_time",
+            "jac_calls", "jac_time", "nfev", "cost"
+            ]
+        df = pd.DataFrame(
+            [event[:-1] for event in self._events],
+            columns = columns
+            )
+
+        df.insert(2, "time", df["solve"] + df["assembly"])
+        df.insert(3, "integrator", df["solve"] - df["rhs_time"] - df["jac_time"])
+        df = df.drop(columns = "solve")
+
+        # norm of the steps between successive residuals calculations
+        step_norm = np.full(len(df), np.nan)
+        previous = None
+        for i, event in enumerate(self._events):
+            values = event[-1]
+            if values is None: continue
+            values = np.asarray(values, dtype = float)
+            if previous is not None:
+                step_norm[i] = np.linalg.norm(values - previous)
+            previous = values
+        df["step_norm"] = step_norm
+
+        return df
+
+
+    @property
+    def iterations(self):
+
+        """DataFrame of the convergence of the fit.
+
+        The iterations are the residuals calculations that decreased the
+        cost below its previous minimum, i.e. the accepted steps of the
+        minimizer, the rejected trial steps being discarded. The finite
+        differences steps, which change a single parameter value of the
+        previous iteration, are discarded as well when several parameters
+        vary. The columns are: "event" (index in :attr:`history`),
+        "start", "cost", "step_norm" (norm of the change of the
+        parameters values since the previous iteration) and "rhs_calls"
+        (calls of the derivatives function since the previous iteration).
+        """
+
+        values = [
+            np.asarray(event[-1], dtype = float)
+            for event in self._events if event[-1] is not None
+            ]
+        n_varying = int(np.sum(np.ptp(values, axis = 0) != 0)) if values else 0
+
+        rows = list()
+        best = np.inf
+        previous = None
+        rhs_calls = 0
+
+        for i, event in enumerate(self._events):
+            rhs_calls += event[4]
+            cost = event[9]
+            if event[-1] is None or not cost < best:
+                continue
+            values = np.asarray(event[-1], dtype = float)
+            if previous is None:
+                step_norm = np.nan
+            else:
+                step = values - previous
+                changed = np.count_nonzero(step)
+                if changed == 0 or (changed == 1 and n_varying > 1):
+                    continue
+                step_norm = np.linalg.norm(step)
+            rows.append((i, event[1], cost, step_norm, rhs_calls))
+            best = cost
+            previous = values
+            rhs_calls = 0
+
+        return pd.DataFrame(
+            rows,
+            columns = ["event", "start", "cost", "step_norm", "rhs_calls"]
+            )
+
+
+    def summary(self):
+
+        """Returns the totals of the profile.
+
+        Returns:
+            dict:
+                "elapsed" (wall time of the fit), "residuals" and
+                "jacobian" (dictionaries of the "calls", "time",
+                "integrator" and "assembly" totals of these calculations),
+                "rhs" and "jac" (dictionaries of the "calls" and "time" of
+                the derivatives function and model Jacobian), "minimizer"
+                (elapsed time outside of the recorded calculations),
+                "iterations" and "cost" (final minimum cost).
+        """
+
+        history = self.history
+        iterations = self.iterations
+
+        totals = dict()
+        for kind in ("residuals", "jacobian"):
+            events = history[history["kind"] == kind]
+            totals[kind] = dict(
+                calls = len(events),
+                time = float(events["time"].sum()),
+                integrator = float(events["integrator"].sum()),
+                assembly = float(events["assembly"].sum())
+                )
+
+        elapsed = self.elapsed
+        if elapsed is None:
+            elapsed = time.perf_counter() - self._start
+
+        return dict(
+            elapsed = elapsed,
+            **totals,
+            rhs = dict(calls = self.rhs_calls, time = self.rhs_time),
+            jac = dict(calls = self.jac_calls, time = self.jac_time),
+            minimizer = elapsed - float(history["time"].sum()),
+            iterations = len(iterations),
+            cost = float(iterations["cost"].iloc[-1]) if len(iterations) else np.nan
+            )
+
+
+class _TimedReduction:
+
+    """Reduced model whose reduced system is timed, see FitProfile.wrap_rhs."""
+
+    def __init__(self, model, profile):
+        """ Class constructor """
+
+        self.model = model
+        self.profile = profile
+        self._call = _timed(model, profile._rhs)
+
+
+    def __call__(self, *args):
+
+        return self._call(*args)
+
+
+    def __getattr__(self, name):
+
+        return getattr(self.model, name)
+
+
+    def reduce(self, c0, p, jac = None):
+
+        # the model Jacobian wrapped by the profile is not timed twice
+        if getattr(jac, "_stats", None) is self.profile._jac:
+            jac = jac.__wrapped__
+
+        func, z0, reduced_jac, expand = self.model.reduce(c0, p, jac)
+
+        func = _timed(func, self.profile._rhs)
+        if reduced_jac is not None:
+            reduced_jac = _timed(reduced_jac, self.profile._jac)
+
+        return func, z0, reduced_jac, expand
+
+
+def _timed(func, stats):
+
+    """Wraps func to add its number of calls and time to stats [calls, time]."""
+
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        start = perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats[0] += 1
+            stats[1] += perf_counter() - start
+
+    wrapper._stats = stats
+
+    return wrapper
@@ -0,0 +1,659 @@
+"""
+This module defines reductions of the kinetic models used by the :mod:`fit`
+module, which integrate a smaller system of equations than the full
+model while still providing the concentrations of all the species to the
+fit functions (residuals, c_to_q, ...).
+
+Linear conservation laws, e.g. the mass balance of the species derived
+from a same reactant, make some of the model equations redundant: for
+each law L.c = constant one of the concentrations is a linear
+combination of the others. The :func:`conservation_laws` function detects
+these laws, either from the stoichiometry matrix of the model (e.g.
+:attr:`network.Network.stoichiometry`) or by probing the derivatives
+function, and the :class:`ConservedModel` class integrates the
+independent species only. For example with a reaction network:
+
+>>> laws = reduction.conservation_laws(network.stoichiometry)
+>>> model = reduction.ConservedModel(network.derivatives, laws)
+>>> fit.fit_dataset(dataset, model, parameters, c0, c0_untracked)
+
+Short-lived intermediates (e.g. surface species) make a model stiff: the
+integrator steps are set by their fast rate constants even though their
+concentrations quickly follow the other species. The :func:`fast_species`
+function flags these species from their lifetimes along a solution of
+the model, and the :class:`QSSAModel` class applies the quasi-steady-state
+approximation to them: their derivatives are set to 0 and their
+concentrations are solved from the other concentrations, so that only the
+slow species are integrated. The :func:`validate` function compares the
+reduced model to the full model, e.g. at the best fit parameters:
+
+>>> fast, lifetimes = reduction.fast_species(
+...     network.derivatives, c0, p, t, exclude = range(len(dataset.names))
+...     )
+>>> model = reduction.QSSAModel(network.derivatives, fast, jac = network.jac)
+>>> fit.fit_dataset(dataset, model, parameters, c0, c0_untracked)
+>>> c, c_full, error = reduction.validate(
+...     model, dataset.fit_result.params, t, jac = network.jac
+...     )
+
+The reduced models can be used as the derivatives function of any
+function of the :mod:`fit` module. They are called with the full model
+signature dy = f(y, t, p), and their reduce method provides the reduced
+system integrated by :func:`fit.evaluate`, see the :class:`ConservedModel`
+class.
+"""
+
+
+import numpy as np
+import scipy.linalg
+
+from . import fit
+
+
+def conservation_laws(
+    stoichiometry = None,
+    derivatives = None,
+    p = None,
+    n_species = None,
+    n_probes = None,
+    scale = 1.0,
+    seed = 0,
+    tol = 1e-9
+    ):
+
+    """Detects the linear conservation laws of a model.
+
+    A conservation law is a vector L such that L.dy/dt = 0 for all the
+    concentrations y, i.e. L.c is constant over time. The laws are the
+    left null space of the stoichiometry matrix N of the model (L.N = 0),
+    or if N is not known, of a matrix of derivatives dy/dt calculated
+    for n_probes random concentrations (these derivatives being linear
+    combinations of the columns of N). For each probe the parameters
+    values are also multiplied by random factors between 0.1 and 10, so
+    that the laws holding only for particular parameters values (e.g.
+    equal rate constants) are not detected.
+
+    The laws are returned in reduced row echelon form, with the columns
+    taken from the last species to the first: each law has a pivot
+    species, which does not appear in the other laws, and the pivots are
+    the last possible species. Since the untracked species come last in
+    the fit parameters, the tracked species are then kept in the reduced
+    system when possible, see :class:`ConservedModel`.
+
+    Parameters:
+        stoichiometry (numpy.ndarray, optional):
+            Stoichiometry matrix with shape (species, reactions).
+        derivatives (function, optional):
+            A function in the form dy = f(y, t, p), probed if
+            stoichiometry is not given.
+        p (dict, optional):
+            Parameter name (str): typical value used to probe derivatives,
+            the rate constants should be nonzero.
+        n_species (int, optional):
+            Number of species, needed to probe derivatives.
+        n_probes (int, optional):
+            Number of random concentrations probed, n_species + 5 by
+            default.
+        scale (float, optional):
+            The random concentrations are uniform between 0 and scale.
+        seed (int, optional):
+            Seed of the random concentrations.
+        tol (float, optional):
+            Relative tolerance on the singular values of the matrix and
+            on the coefficients of the laws (set to 0 below tol).
+
+    Returns:
+        numpy.ndarray:
+            Conservation laws with shape (laws, species).
+    """
+
+    if stoichiometry is not None:
+        matrix = np.asarray(stoichiometry, dtype = float)
+
+    elif derivatives is not None:
+        if n_species is None or p is None:
+            raise ValueError("n_species and p are needed to probe derivatives")
+        if n_probes is None:
+            n_probes = n_species + 5
+        rng = np.random.default_rng(seed)
+        probes = list()
+        for y in rng.uniform(0, scale, (n_probes, n_species)):
+            p_probe = {
+                key: value*10**rng.uniform(-1, 1) for key, value in p.items()
+                }
+            probes.append(np.asarray(derivatives(y, 0.0, p_probe), dtype = float))
+        matrix = np.column_stack(probes)
+
+    else:
+        raise ValueError("either stoichiometry or derivatives must be given")
+
+    # scale the columns so that fast and slow reactions (or probes) have the
+    # same weight in the singular values
+    norms = np.linalg.norm(matrix, axis = 0)
+    matrix = matrix[:,norms > 0]/norms[norms > 0]
+
+    if matrix.shape[1] == 0:
+        basis = np.eye(matrix.shape[0])
+    else:
+        basis = scipy.linalg.null_space(matrix.T, rcond = tol).T
+
+    # reduced row echelon form, pivots taken from the last species
+    laws = _rref(basis[:,::-1], tol)[:,::-1]
+
+    return laws
+
+
+def _rref(matrix, tol = 1e-9):
+
+    """Reduced row echelon form of a matrix, with partial pivoting."""
+
+    a = np.array(matrix, dtype = float)
+    n_rows, n_columns = a.shape
+
+    row = 0
+    for column in range(n_columns):
+        if row == n_rows:
+            break
+        pivot = row + np.argmax(np.abs(a[row:,column]))
+        if abs(a[pivot,column]) <= tol:
+            continue
+        a[[row, pivot]] = a[[pivot, row]]
+        a[row] /= a[row,column]
+        others = np.arange(n_rows) != row
+        a[others] -= np.outer(a[others,column], a[row])
+        row += 1
+
+    a = a[:row]
+    a[np.abs(a) <= tol] = 0
+
+    return a
+
+
+class ConservedModel:
+
+    """Model reduced with linear conservation laws.
+
+    For each conservation law L.c = T (see :func:`conservation_laws`),
+    the concentration of the pivot species of the law (its coefficient
+    is 1 and it does not appear in the other laws) is calculated from
+    the other concentrations:
+
+        c_pivot = T - sum(L_j*c_j for the other species j)
+
+    the totals T being calculated from the initial concentrations. Only
+    the equations of the other (independent) species are integrated, and
+    the concentrations of all the species are then rebuilt. The model
+    Jacobian, if given to the fit functions, is reduced accordingly.
+
+    The object is called like the derivatives function of the full model,
+    e.g. by the sensitivity equations (see :func:`fit.evaluate_sensitivities`)
+    and by :func:`fit.evaluate_batch`, which solve the full model.
+
+    Parameters:
+        derivatives (function):
+            A function in the form dy = f(y, t, p), the full model.
+        laws (numpy.ndarray):
+            Conservation laws with shape (laws, species), in reduced row
+            echelon form as returned by :func:`conservation_laws`.
+
+    Attributes:
+        derivatives (function):
+            The full model.
+        laws (numpy.ndarray):
+            The conservation laws.
+        pivots (numpy.ndarray):
+            Index of the species calculated from the laws.
+        independent (numpy.ndarray):
+            Index of the integrated species.
+    """
+
+    def __init__(self, derivatives, laws):
+        """ Class constructor """
+
+        self.derivatives = derivatives
+        self.laws = np.atleast_2d(np.asarray(laws, dtype = float))
+
+        n_species = self.laws.shape[1]
+
+        # the pivot of each law is its species with a coefficient of 1 that
+        # does not appear in the other laws
+        pivots = list()
+        for i, law in enumerate(self.laws):
+            others = np.delete(self.laws, i, axis = 0)
+            candidates = np.flatnonzero(
+                (law == 1) & np.all(others == 0, axis = 0)
+                )
+            if len(candidates) == 0:
+                raise ValueError(
+                    "the conservation laws are not in reduced row echelon" +
+                    " form, see the conservation_laws function"
+                    )
+            pivots.append(candidates[-1])
+
+        self.pivots = np.array(pivots, dtype = int)
+        self.independent = np.setdiff1d(np.arange(n_species), self.pivots)
+
+        # pivots concentrations: T - A.c[independent]
+        self._A = self.laws[:,self.independent]
+
+
+    def __call__(self, y, t, p):
+
+        return self.derivatives(y, t, p)
+
+
+    def reduce(self, c0, p, jac = None):
+
+        """Builds the reduced system for the initial concentrations c0.
+
+        Parameters:
+            c0 (list):
+                Initial concentrations of all the species.
+            p (dict):
+                Parameter name (str): value.
+            jac (function, optional):
+                Jacobian of the full model, in the form J = f(y, t, p).
+
+        Returns:
+            tuple:
+                The reduced derivatives function dz = f(z, t, p), the
+                initial value of z, the reduced Jacobian (None if jac is
+                None) and a function c = expand(z, t) rebuilding the
+                concentrations of all the species from the values of z
+                with shape (time, independent species).
+        """
+
+        c0 = np.asarray(c0, dtype = float)
+        totals = self.laws @ c0
+        z0 = c0[self.independent]
+
+        # concentrations of all the species y = B.z + b
+        B = np.zeros((len(c0), len(z0)))
+        B[self.independent, np.arange(len(z0))] = 1
+        B[self.pivots] = -self._A
+        b = np.zeros(len(c0))
+        b[self.pivots] = totals
+
+        def full(z):
+            return B @ z + b
+
+        def derivatives(z, t, p):
+            dy = np.asarray(self.derivatives(full(z), t, p), dtype = float)
+            return dy[self.independent]
+
+        if jac is not None:
+            def reduced_jac(z, t, p):
+                J = np.asarray(jac(full(z), t, p), dtype = float)
+                J = J[self.independent]
+                return J[:,self.independent] - J[:,self.pivots] @ self._A
+        else:
+            reduced_jac = None
+
+        def expand(z, t):
+            return np.asarray(z, dtype = float) @ B.T + b
+
+        return derivatives, z0, reduced_jac, expand
+
+
+def timescales(derivatives, y, t, p, jac = None):
+
+    """Lifetimes of the species and timescales of the model at a state y.
+
+    The lifetime of a species is the inverse of its first order
+    consumption rate -J[i, i], J being the d(derivatives)/d(concentration)
+    matrix (inf if the species is not consumed). The timescales of the
+    model are the inverses of the absolute real parts of the eigenvalues
+    of J.
+
+    Parameters:
+        derivatives (function):
+            A function in the form dy = f(y, t, p).
+        y (numpy.ndarray):
+            Concentrations of all the species.
+        t (float):
+            Time value.
+        p (dict):
+            Parameter name (str): value.
+        jac (function, optional):
+            A function in the form J = f(y, t, p), if not given J is
+            estimated by finite differences.
+
+    Returns:
+        numpy.ndarray, numpy.ndarray:
+            Lifetimes of the species, and timescales of the model sorted
+            in increasing order (inf for the null eigenvalues, e.g. of
+            the conservation laws).
+    """
+
+    y = np.asarray(y, dtype = float)
+    J = _jacobian(derivatives, jac, y, t, p)
+
+    rates = -np.diag(J)
+    lifetimes = np.full(len(y), np.inf)
+    lifetimes[rates > 0] = 1/rates[rates > 0]
+
+    real = np.abs(np.linalg.eigvals(J).real)
+    scales = np.full(len(real), np.inf)
+    scales[real > 0] = 1/real[real > 0]
+
+    return lifetimes, np.sort(scales)
+
+
+def fast_species(
+    derivatives,
+    c0,
+    p,
+    t,
+    jac = None,
+    ratio = 100,
+    exclude = (),
+    solver = None,
+    n_states = 20
+    ):
+
+    """Flags the species whose lifetime is short compared to the time range.
+
+    The full model is solved on t, and the lifetimes of the species (see
+    :func:`timescales`) are calculated at n_states states of the
+    solution. A species is fast if its lifetime stays below (t[-1] -
+    t[0])/ratio at all these states, it is then a candidate for the
+    quasi-steady-state approximation (see :class:`QSSAModel`). Species
+    that are measured should be excluded, their fast variations being
+    part of the data.
+
+    Parameters:
+        derivatives (function):
+            A function in the form dy = f(y, t, p).
+        c0 (list):
+            Initial concentrations of all the species.
+        p (dict):
+            Parameter name (str): value, e.g. initial guesses of the fit.
+        t (list):
+            Time values of the data.
+        jac (function, optional):
+            A function in the form J = f(y, t, p).
+        ratio (float, optional):
+            Minimum ratio between the time range and the lifetimes.
+        exclude (list, optional):
+            Index of the species that cannot be flagged, e.g. the
+            tracked species range(len(dataset.names)).
+        solver (dict, optional):
+            Integrator options, see the :func:`fit.evaluate` function.
+        n_states (int, optional):
+            Number of states at which the lifetimes are calculated.
+
+    Returns:
+        numpy.ndarray, numpy.ndarray:
+            Index of the fast species, and the longest lifetime of each
+            species over the states.
+    """
+
+    t = np.asarray(t, dtype = float)
+    c, _ = fit.integrate(derivatives, c0, t, (p,), solver, jac)
+
+    index = np.unique(np.linspace(0, len(t) - 1, n_states).astype(int))
+    lifetimes = np.max(
+        [timescales(derivatives, c[i], t[i], p, jac)[0] for i in index
+         if np.all(np.isfinite(c[i]))],
+        axis = 0
+        )
+
+    fast = np.flatnonzero(lifetimes < (t[-1] - t[0])/ratio)
+    fast = np.setdiff1d(fast, np.asarray(exclude, dtype = int))
+
+    return fast, lifetimes
+
+
+class QSSAModel:
+
+    """Model reduced with the quasi-steady-state approximation.
+
+    The derivatives of the fast species (see :func:`fast_species`) are
+    set to 0, their concentrations being solved from the concentrations
+    of the other (slow) species by Newton iterations. Only the slow
+    species are integrated, the fast timescales are then removed from
+    the integrated system, which is much less stiff. The concentrations
+    of the fast species are rebuilt at the requested time values.
+
+    The reduced derivatives only depend on their arguments, not on the
+    previous calls (the integrators call them at trial values, in any
+    order): the iterations always start from the initial concentrations
+    of the fast species, with the inverse Jacobian at the initial
+    concentrations, which is only recalculated if the iterations
+    converge slowly with it.
+
+    The initial concentrations of the fast species are replaced by their
+    quasi-steady-state values: the amount of these species at the initial
+    time should be negligible. The model Jacobian, given to the fit
+    functions or else to the class constructor, is used for the Newton
+    iterations and to build the Jacobian of the reduced system.
+
+    The object is called like the derivatives function of the full model,
+    e.g. by :func:`fit.evaluate_batch`, which solves the full model. The
+    approximation changing the solution, the object cannot be used with
+    the sensitivity equations (:func:`fit.evaluate_sensitivities`, fits
+    with sensitivities = True), which would be those of the full model.
+    The reduced model can be compared to the full model with the
+    :func:`validate` function.
+
+    Parameters:
+        derivatives (function):
+            A function in the form dy = f(y, t, p), the full model.
+        fast (list):
+            Index of the fast species.
+        jac (function, optional):
+            A function in the form J = f(y, t, p), the Jacobian of the
+            full model, else estimated by finite differences.
+        tol (float, optional):
+            Relative tolerance of the Newton iterations.
+        max_iter (int, optional):
+            Maximum number of Newton iterations.
+
+    Attributes:
+        derivatives|jac|tol|max_iter:
+            The stored parameters.
+        fast (numpy.ndarray):
+            Index of the fast species.
+        approximate (bool):
+            True, the reduced model does not have the same solution as
+            the full model, see :func:`fit.evaluate_sensitivities`.
+    """
+
+    approximate = True
+
+    def __init__(self, derivatives, fast, jac = None, tol = 1e-10, max_iter = 20):
+        """ Class constructor """
+
+        self.derivatives = derivatives
+        self.fast = np.asarray(fast, dtype = int)
+        self.jac = jac
+        self.tol = tol
+        self.max_iter = max_iter
+
+
+    def __call__(self, y, t, p):
+
+        return self.derivatives(y, t, p)
+
+
+    def steady_state(self, y, t, p, J_inv = None, jac = None):
+
+        """Solves the concentrations of the fast species.
+
+        Parameters:
+            y (numpy.ndarray):
+                Concentrations of all the species, the values of the
+                fast species are the starting point of the iterations.
+            t (float):
+                Time value.
+            p (dict):
+                Parameter name (str): value.
+            J_inv (numpy.ndarray, optional):
+                Inverse of the Jacobian of the fast species derivatives
+                with respect to their concentrations, e.g. returned by a
+                previous call. It is recalculated if not given, or if the
+                iterations converge slowly with it.
+            jac (function, optional):
+                Jacobian of the full model, by default the one given to
+                the class constructor.
+
+        Returns:
+            numpy.ndarray, numpy.ndarray, numpy.ndarray:
+                y with the quasi-steady-state concentrations of the fast
+                species, the derivatives at the last iteration, and the
+                inverse Jacobian used.
+        """
+
+        y = np.array(y, dtype = float)
+        fast = self.fast
+        if jac is None:
+            jac = self.jac
+
+        # chord iterations: the Jacobian is kept between the iterations, the
+        # fast species being often linear in their own concentrations, the
+        # iterations then converge in one step
+        fresh = J_inv is None
+        if fresh: J_inv = self._inverse_jacobian(y, t, p, jac)
+
+        for i in range(self.max_iter):
+            dy = np.asarray(self.derivatives(y, t, p), dtype = float)
+            step = -J_inv @ dy[fast]
+            y[fast] += step
+            if np.all(np.abs(step) <= self.tol*(np.abs(y[fast]) + self.tol)):
+                break
+            if i == 2 and not fresh:
+                J_inv = self._inverse_jacobian(y, t, p, jac)
+                fresh = True
+
+        return y, dy, J_inv
+
+
+    def _inverse_jacobian(self, y, t, p, jac = None):
+
+        """Inverse of the Jacobian of the fast species derivatives."""
+
+        J = _jacobian(self.derivatives, jac, y, t, p, self.fast)
+
+        return np.linalg.inv(J[np.ix_(self.fast, self.fast)])
+
+
+    def reduce(self, c0, p, jac = None):
+
+        """Builds the reduced system for the initial concentrations c0.
+
+        See the :meth:`ConservedModel.reduce` method. The Jacobian of the
+        full model is jac, or if None the Jacobian given to the class
+        constructor.
+        """
+
+        if jac is None:
+            jac = self.jac
+
+        c0 = np.asarray(c0, dtype = float)
+        fast = self.fast
+        slow = np.setdiff1d(np.arange(len(c0)), fast)
+
+        # the iterations of all the calls start from the initial concentrations
+        # of the fast species with the same chord matrix, calculated at the
+        # initial concentrations; it only sets the direction of the
+        # iterations, not the converged values. If it is singular the
+        # Jacobian is calculated at each call instead
+        try:
+            J_inv = self._inverse_jacobian(c0, 0.0, p, jac)
+        except np.linalg.LinAlgError:
+            J_inv = None
+
+        def full(z, t, p):
+            y = c0.copy()
+            y[slow] = z
+            y, dy, _ = self.steady_state(y, t, p, J_inv, jac)
+            return y, dy
+
+        def derivatives(z, t, p):
+            return full(z, t, p)[1][slow]
+
+        # Jacobian of the slow species with the fast species following them:
+        # J_ss - J_sf.J_ff^-1.J_fs
+        if jac is not None:
+            def reduced_jac(z, t, p):
+                J = np.asarray(jac(full(z, t, p)[0], t, p), dtype = float)
+                J_ff = J[np.ix_(fast, fast)]
+                J_fs = J[np.ix_(fast, slow)]
+                return (
+                    J[np.ix_(slow, slow)] -
+                    J[np.ix_(slow, fast)] @ np.linalg.solve(J_ff, J_fs)
+                    )
+        else:
+            reduced_jac = None
+
+        def expand(z, t):
+            c = np.full((len(z), len(c0)), np.nan)
+            for i, (z_i, t_i) in enumerate(zip(z, t)):
+                if np.all(np.isfinite(z_i)):
+                    c[i] = full(z_i, t_i, p)[0]
+            return c
+
+        return derivatives, c0[slow], reduced_jac, expand
+
+
+def validate(model, params, t, solver = None, jac = None):
+
+    """Compares a reduced model to the full model.
+
+    Both models are solved once, e.g. at the best fit parameters, to
+    check that the reduction does not change the fit.
+
+    Parameters:
+        model (ConservedModel or QSSAModel):
+            The reduced model.
+        params (lmfit.parameter.Parameters):
+            The parameters values.
+        t (list):
+            Time values at which the models are compared.
+        solver|jac (optional):
+            See the :func:`fit.evaluate` function, used for both models.
+
+    Returns:
+        numpy.ndarray, numpy.ndarray, numpy.ndarray:
+            Concentrations from the reduced and full models with shape
+            (time, species), and for each species the largest deviation
+            between them relative to the largest concentration of the
+            full model.
+    """
+
+    c = fit.evaluate(model, params, t, solver, jac)
+    c_full = fit.evaluate(model.derivatives, params, t, solver, jac)
+
+    scale = np.abs(c_full).max(axis = 0)
+    scale[scale == 0] = 1
+    error = np.abs(c - c_full).max(axis = 0)/scale
+
+    return c, c_full, error
+
+
+def _jacobian(derivatives, jac, y, t, p, columns = None):
+
+    """d(derivatives)/d(concentration) matrix, from jac or finite differences.
+
+    If columns is given and jac is None, only these columns are estimated
+    (the other ones are not set).
+    """
+
+    if jac is not None:
+        return np.asarray(jac(y, t, p), dtype = float)
+
+    if columns is None:
+        return fit._jacobian_y(derivatives, y, t, p)
+
+    h = fit._step(np.abs(y).max())
+    J = np.zeros((len(y), len(y)))
+    for i in columns:
+        y_plus, y_minus = y.copy(), y.copy()
+        y_plus[i] += h
+        y_minus[i] -= h
+        J[:,i] = (
+            np.asarray(derivatives(y_plus, t, p), dtype = float) -
+            np.asarray(derivatives(y_minus, t, p), dtype = float)
+            )/(2*h)
+
+    return J
@@ -0,0 +1,957 @@
+"""
+This module defines functions used to estimate the uncertainties of the
+parameters fitted with the :func:`fit.fit_dataset` function, the
+covariance based standard deviations reported by :func:`fit.print_result`
+being often undefined or unreliable for poorly conditioned models.
+
+The :func:`bootstrap` function refits the dataset many times, either to
+synthetic data built by resampling the residuals of the fit, or to the
+average of runs resampled among the files loaded in the dataset. The
+:func:`sample_emcee` function samples the posterior distribution of the
+parameters with the emcee package (optional dependency, see
+https://emcee.readthedocs.io).
+
+Both functions can run on a pool of processes and write the samples to a
+.npy file as they are computed, so that long runs do not hold all the
+samples in memory; the samples are then returned as a structured array
+memory-mapped to this file, which can be opened again with the
+:func:`load_samples` function. The confidence intervals of the parameters
+are calculated from the samples, one column at a time, by the
+:func:`confidence_intervals` function.
+
+The :func:`profile_likelihood` function fixes each parameter on a grid
+of values around its fitted value and fits the other parameters again,
+the increase of the chi-square along the grid showing whether the
+parameter can be identified from the data. The profiles run on a pool of
+processes, and give likelihood based confidence intervals.
+"""
+
+
+import concurrent.futures
+import functools
+import warnings
+import scipy.stats
+import numpy as np
+import pandas as pd
+
+from . import data, fit
+from .problem import FitProblem
+
+
+def bootstrap(
+    dataset,
+    derivatives,
+    c_to_q = None,
+    n_samples = 100,
+    method = "residuals",
+    processes = None,
+    seed = None,
+    path = None,
+    sensitivities = False,
+    jac = None,
+    jac_p = None,
+    solver = None
+    ):
+
+    """Estimates the distribution of the fitted parameters by bootstrap.
+
+    The dataset must have been fitted beforehand with the
+    :func:`fit.fit_dataset` function, each bootstrap fit starts from the
+    fitted parameters and uses the same bounds and constraints.
+
+    With the "residuals" method the synthetic data are the fit
+    evaluation perturbed by residuals drawn with replacement among the
+    residuals of the fit of the same column, the residuals being
+    normalized as in :func:`fit.calculate_residuals`. With the
+    "replicates" method the data are the average of runs drawn with
+    replacement among the runs loaded in the dataset (dataset.replicates_c
+    and dataset.replicates_q, the run i of both being drawn together when
+    they have the same number of runs), the charge passed data being
+    reduced as in the dataset, see the data.Dataset.decimate_q method.
+
+    A bootstrap fit that raises an error (e.g. a model that cannot be
+    evaluated for a resampled dataset) does not stop the other fits: its
+    row is left as nan with a warning, and the number of failed fits is
+    printed.
+
+    Parameters:
+        dataset (chemical_kinetics.data.Dataset):
+            The fitted dataset.
+        derivatives|c_to_q (function):
+            See the :func:`fit.fit_dataset` function. Must be defined in
+            a module or in the main script when processes is used, so
+            that they can be passed to the processes.
+        n_samples (int, optional):
+            Number of bootstrap fits.
+        method (str, optional):
+            Either "residuals" or "replicates", see above.
+        processes (int, optional):
+            Number of processes used to run the fits, if None or 1 they
+            run one after the other in the current process.
+        seed (int, optional):
+            Seed of the resampling, for reproducible samples.
+        path (str, optional):
+            Path of the .npy file where the samples are written as they
+            are computed, if None the samples are only kept in memory.
+        sensitivities|jac|jac_p|solver (optional):
+            See the :func:`fit.fit_dataset` function.
+
+    Returns:
+        pandas.DataFrame|numpy.memmap:
+            For each bootstrap fit (rows) the values of the varying
+            parameters, the chi-square ("chisqr") and whether the fit
+            succeeded ("success", 1 or 0, nan for the fits that raised an
+            error). If path is given, the samples are returned as the
+            structured array memory-mapped to the file, with a field per
+            column.
+    """
+
+    if dataset.fit_result is None:
+        raise ValueError("the dataset must be fitted before the bootstrap")
+
+    params = dataset.fit_result.params
+    names = [key for key in params if params[key].vary]
+
+
+    ############################################################################
+    # data needed to build the resampled datasets
+    ############################################################################
+
+    if method == "residuals":
+        df_c_fit, df_q_fit = _evaluate_data(
+            dataset, derivatives, params, c_to_q, solver, jac
+            )
+        source = dict(
+            df_c = dataset.df_c,
+            df_c_fit = df_c_fit,
+            df_q = dataset.df_q if df_q_fit is not None else None,
+            df_q_fit = df_q_fit
+            )
+    elif method == "replicates":
+        if dataset.replicates_c is None or len(dataset.replicates_c) < 2:
+            raise ValueError(
+                "the replicates bootstrap needs a dataset loaded from at" +
+                " least two files"
+                )
+        source = dict(
+            runs_c = dataset.replicates_c,
+            runs_q = dataset.replicates_q if c_to_q is not None else None
+            )
+    else:
+        raise ValueError(f"unknown bootstrap method: '{method}'")
+
+    problem = dict(
+        method = method,
+        source = source,
+        params = params,
+        problem = fit._compile_problem(
+            dataset, derivatives, params, c_to_q, solver, jac, jac_p
+            ),
+        sensitivities = sensitivities,
+        q_decimation = dataset.q_decimation
+        )
+
+
+    ############################################################################
+    # run the fits, writing the samples as they are computed
+    ############################################################################
+
+    samples = _open_samples(path, names + ["chisqr", "success"], n_samples)
+    seeds = np.random.SeedSequence(seed).spawn(n_samples)
+
+    # the fits that raised an error return their message instead of a row,
+    # their row is left as nan
+    failed = list()
+
+    if processes is not None and processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+            processes,
+            initializer = _init_worker,
+            initargs = (problem,)
+            ) as executor:
+            futures = [
+                executor.submit(_worker_bootstrap, i, seeds[i])
+                for i in range(n_samples)
+                ]
+            for future in concurrent.futures.as_completed(futures):
+                i, row = future.result()
+                if isinstance(row, str):
+                    failed.append((i, row))
+                else:
+                    samples[i] = row
+    else:
+        for i in range(n_samples):
+            _, row = _bootstrap_sample(problem, i, seeds[i])
+            if isinstance(row, str):
+                failed.append((i, row))
+            else:
+                samples[i] = row
+
+    for i, message in sorted(failed):
+        warnings.warn(f"bootstrap fit {i} failed: {message}", RuntimeWarning)
+    print(f"{n_samples} bootstrap fits ({len(failed)} failed)")
+
+    return _close_samples(samples)
+
+
+def _evaluate_data(dataset, derivatives, params, c_to_q, solver, jac):
+
+    """Evaluates the model on the time values of the data of dataset."""
+
+    df_c = dataset.df_c
+    df_q = dataset.df_q
+
+    if df_q is not None and c_to_q is not None:
+        t, (idx_c, idx_q) = fit.merge_times(df_c["t"], df_q["t"])
+    else:
+        t, (idx_c,) = fit.merge_times(df_c["t"])
+        idx_q = None
+
+    c = fit.evaluate(derivatives, params, t, solver, jac)
+
+    df_c_fit = pd.DataFrame({"t": df_c["t"]})
+    for i, name in enumerate(dataset.names):
+        df_c_fit[name] = c[idx_c,i]
+
+    if idx_q is None:
+        return df_c_fit, None
+
+    df_q_fit = pd.DataFrame({"t": df_q["t"]})
+    df_q_fit["Q"] = fit.as_observable(c_to_q)(c[idx_q])
+
+    return df_c_fit, df_q_fit
+
+
+def _resample_residuals(df, df_fit, names, rng):
+
+    """Builds synthetic data from the fit and its resampled residuals."""
+
+    df_sample = df.copy()
+
+    for name in names:
+
+        d = df[name].to_numpy(dtype = float)
+        f = df_fit[name].to_numpy(dtype = float)
+
+        # normalized residuals, set to 0 when both the data and the fit are 0
+        # as in the fit.calculate_residuals function
+        norm = d + f
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            r = np.where(norm == 0, 0, (d - f)/norm)
+
+        finite = np.isfinite(r)
+        r_sample = rng.choice(r[finite], size = finite.sum())
+
+        # invert the normalization: d = f*(1 + r)/(1 - r)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            d_sample = f[finite]*(1 + r_sample)/(1 - r_sample)
+        d_sample[~np.isfinite(d_sample)] = np.nan
+
+        # missing data stay missing
+        values = np.full(len(d), np.nan)
+        values[finite] = d_sample
+        df_sample[name] = values
+
+    return df_sample
+
+
+def _bootstrap_sample(problem, i, seed):
+
+    """Runs the bootstrap fit number i, see the bootstrap function.
+
+    Returns i and the row of the sample, or the message of the error if
+    the resampling or the fit raises one, so that a single failed fit
+    does not stop the other ones.
+    """
+
+    try:
+        return i, _bootstrap_row(problem, seed)
+    except Exception as error:
+        return i, f"{type(error).__name__}: {error}"
+
+
+def _bootstrap_row(problem, seed):
+
+    """Resamples the data and fits them, returns the row of the sample."""
+
+    rng = np.random.default_rng(seed)
+    source = problem["source"]
+    fit_problem = problem["problem"]
+    names = fit_problem.tracked_species
+    df_q = None
+
+    # build the resampled dataset
+    if problem["method"] == "residuals":
+        df_c = _resample_residuals(
+            source["df_c"], source["df_c_fit"], names, rng
+            )
+        if source["df_q"] is not None:
+            df_q = _resample_residuals(
+                source["df_q"], source["df_q_fit"], ["Q"], rng
+                )
+    else:
+        runs_c, runs_q = source["runs_c"], source["runs_q"]
+        idx = rng.integers(len(runs_c), size = len(runs_c))
+        df_c, _ = runs_c.frames(idx)
+        if runs_q is not None:
+            # runs are drawn together when each has its charge passed file
+            if len(runs_q) != len(runs_c):
+                idx = rng.integers(len(runs_q), size = len(runs_q))
+            df_q, df_q_std = runs_q.frames(idx)
+            # same reduction of the charge passed data as for the fit
+            if problem["q_decimation"] is not None:
+                df_q, _ = data.decimate(
+                    df_q, df_q_std, **problem["q_decimation"]
+                    )
+
+    # same problem as the fit of the dataset, for the resampled data
+    fit_problem = FitProblem(
+        problem["params"],
+        df_c,
+        fit_problem.derivatives,
+        names,
+        df_q = df_q,
+        c_to_q = fit_problem.c_to_q,
+        solver = fit_problem.solver,
+        jac = fit_problem.jac,
+        jac_p = fit_problem.jac_p
+        )
+
+    result = fit._minimize(
+        fit_problem,
+        problem["params"],
+        problem["sensitivities"]
+        )
+
+    row = tuple(
+        [result.params[key].value for key in result.var_names] +
+        [result.chisqr, float(result.success)]
+        )
+
+    return row
+
+
+def sample_emcee(
+    dataset,
+    derivatives,
+    c_to_q = None,
+    steps = 1000,
+    nwalkers = None,
+    burn = 0,
+    thin = 1,
+    processes = None,
+    seed = None,
+    path = None,
+    jac = None,
+    solver = None
+    ):
+
+    """Samples the posterior distribution of the parameters with emcee.
+
+    The dataset must have been fitted beforehand with the
+    :func:`fit.fit_dataset` function, the walkers start in a small ball
+    around the fitted parameters. The priors are uniform within the
+    parameters bounds, and the residuals of :func:`fit.residuals` are
+    assumed to be normally distributed with an unknown standard
+    deviation exp(lnsigma), sampled as an additional parameter (as with
+    the is_weighted = False option of lmfit.Minimizer.emcee).
+
+    The positions of the walkers are written at each step, so that the
+    whole chain is never held in memory by the sampler.
+
+    Parameters:
+        dataset (chemical_kinetics.data.Dataset):
+            The fitted dataset.
+        derivatives|c_to_q (function):
+            See the :func:`bootstrap` function.
+        steps (int, optional):
+            Number of steps of each walker.
+        nwalkers (int, optional):
+            Number of walkers, by default 4 times the number of sampled
+            parameters.
+        burn (int, optional):
+            Number of initial steps discarded.
+        thin (int, optional):
+            Only every thin steps are kept.
+        processes|seed|path (optional):
+            See the :func:`bootstrap` function.
+        jac|solver (optional):
+            Passed to the :func:`fit.evaluate` function.
+
+    Returns:
+        pandas.DataFrame|numpy.memmap:
+            For each kept step and walker (rows, ordered by step then by
+            walker) the values of the varying parameters, of "lnsigma"
+            and the log-posterior probability ("log_prob"). If path is
+            given, see the :func:`bootstrap` function.
+    """
+
+    try:
+        import emcee
+    except ImportError:
+        raise ImportError(
+            "the emcee package is needed to sample the posterior" +
+            " distribution, see https://emcee.readthedocs.io"
+            )
+
+    if dataset.fit_result is None:
+        raise ValueError("the dataset must be fitted before the sampling")
+
+    result = dataset.fit_result
+    params = result.params
+    names = [key for key in params if params[key].vary]
+
+
+    ############################################################################
+    # initial positions of the walkers
+    ############################################################################
+
+    bounds = np.array([[params[key].min, params[key].max] for key in names])
+    bounds = np.vstack([bounds, [-np.inf, np.inf]])
+
+    # the standard deviation of the residuals is initialized from the fit
+    theta = np.array([params[key].value for key in names])
+    theta = np.append(theta, np.log(np.sqrt(result.chisqr/result.ndata)))
+    ndim = len(theta)
+
+    if nwalkers is None:
+        nwalkers = 4*ndim
+
+    # small ball around the fitted values, reflected at the bounds; the
+    # parameters fitted to 0 (typically at their bound) get an absolute spread
+    rng = np.random.default_rng(seed)
+    spread = 1e-4*np.where(theta != 0, np.abs(theta), 1)
+    pos = theta + spread*rng.standard_normal((nwalkers, ndim))
+    pos = np.where(pos < bounds[:,0], 2*bounds[:,0] - pos, pos)
+    pos = np.where(pos > bounds[:,1], 2*bounds[:,1] - pos, pos)
+
+    problem = dict(
+        params = params,
+        names = names,
+        bounds = bounds,
+        problem = fit._compile_problem(
+            dataset, derivatives, params, c_to_q, solver, jac
+            ),
+        ndata = result.ndata
+        )
+
+
+    ############################################################################
+    # run the sampler, writing the kept steps as they are computed
+    ############################################################################
+
+    kept = range(burn, steps, thin)
+    samples = _open_samples(
+        path, names + ["lnsigma", "log_prob"], len(kept)*nwalkers
+        )
+
+    executor = None
+    if processes is not None and processes > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            processes,
+            initializer = _init_worker,
+            initargs = (problem,)
+            )
+        log_prob = _worker_log_prob
+    else:
+        log_prob = functools.partial(_log_prob, problem)
+
+    try:
+        sampler = emcee.EnsembleSampler(
+            nwalkers, ndim, log_prob, pool = executor
+            )
+        if seed is not None:
+            sampler.random_state = np.random.RandomState(seed).get_state()
+
+        # the sampler does not store the chain (store = False), the acceptance
+        # fraction is therefore counted here from the walkers moves
+        accepted = np.zeros(nwalkers)
+        previous = pos
+        row = 0
+        for step, state in enumerate(
+            sampler.sample(pos, iterations = steps, store = False)
+            ):
+            accepted += np.any(state.coords != previous, axis = 1)
+            previous = state.coords
+            if step in kept:
+                for coords, lp in zip(state.coords, state.log_prob):
+                    samples[row] = tuple(coords) + (lp,)
+                    row += 1
+    finally:
+        if executor is not None: executor.shutdown()
+
+    print(f"mean acceptance fraction: {np.mean(accepted)/steps:.3f}")
+
+    return _close_samples(samples)
+
+
+def _log_prob(problem, theta):
+
+    """Log-posterior probability of theta, see the sample_emcee function."""
+
+    bounds = problem["bounds"]
+    if np.any(theta < bounds[:,0]) or np.any(theta > bounds[:,1]):
+        return -np.inf
+
+    params = problem["params"].copy()
+    for key, value in zip(problem["names"], theta):
+        params[key].value = value
+    params.update_constraints()
+
+    res = problem["problem"].residuals(params)
+    res = res[np.isfinite(res)]
+
+    # a failed integration returns nan values, which must not be mistaken
+    # for missing data
+    if len(res) != problem["ndata"]:
+        return -np.inf
+
+    lnsigma = theta[-1]
+
+    return -0.5*np.sum(
+        res**2/np.exp(2*lnsigma) + np.log(2*np.pi) + 2*lnsigma
+        )
+
+
+def profile_likelihood(
+    dataset,
+    derivatives,
+    c_to_q = None,
+    names = None,
+    n_points = 10,
+    spread = 10,
+    values = None,
+    level = 0.95,
+    stop = True,
+    processes = None,
+    sensitivities = False,
+    jac = None,
+    jac_p = None,
+    solver = None
+    ):
+
+    """Calculates the profile likelihood of the fitted parameters.
+
+    For each profiled parameter, the parameter is fixed at values on a
+    grid on both sides of its fitted value and all the other varying
+    parameters are fitted again. Each fit starts from the result of the
+    previous value of the grid on the same side (starting from the fit
+    of the dataset), so that it only takes a few iterations. The profiled
+    parameters and both sides of their grid run in parallel on a pool of
+    **processes**.
+
+    The profile of a parameter is the increase of the chi-square along
+    the grid, relative to the reduced chi-square of the fit of the
+    dataset: delta = (chisqr - chisqr_min)/redchi_min. The likelihood
+    based confidence interval at the given **level** is the range of
+    values whose delta is below the chi-square distribution quantile
+    with one degree of freedom (3.84 at 95%), interpolated between the
+    values of the grid. Contrary to the standard deviations of
+    :func:`fit.print_result`, the interval can be asymmetric, and a
+    bound that is not reached within the grid (e.g. for a parameter
+    that cannot be identified from the data) is infinite.
+
+    The dataset must have been fitted beforehand with the
+    :func:`fit.fit_dataset` function, the profiles and the intervals are
+    stored in dataset.profiles and dataset.profile_intervals.
+
+    Parameters:
+        dataset (chemical_kinetics.data.Dataset):
+            The fitted dataset.
+        derivatives|c_to_q (function):
+            See the :func:`bootstrap` function.
+        names (list, optional):
+            Keys of the profiled parameters, by default all the varying
+            parameters.
+        n_points (int, optional):
+            Number of values of the grid on each side of the fitted
+            value.
+        spread (float, optional):
+            The grid spans the fitted value divided and multiplied by
+            spread, or +/- spread if the fitted value is 0, clipped to
+            the parameter bounds. The values are log-spaced, or if the
+            parameter has a standard error, their distances to the
+            fitted value are log-spaced from half the standard error
+            based half-width of the interval.
+        values (dict, optional):
+            Parameter key (str): grid values (list), replacing the
+            default grid of these parameters.
+        level (float, optional):
+            Confidence level of the intervals.
+        stop (bool, optional):
+            If True, each side of the grid stops at the first value
+            beyond the confidence interval, which is enough to locate
+            its bound.
+        processes (int, optional):
+            Number of processes used to run the profiles, if None or 1
+            they run one after the other in the current process.
+        sensitivities|jac|jac_p|solver (optional):
+            See the :func:`fit.fit_dataset` function.
+
+    Returns:
+        pandas.DataFrame, dict:
+            For each profiled parameter (rows) its fitted value
+            ("value") and the bounds of the interval ("low" and "high"),
+            and for each profiled parameter key (str) its profile
+            (pandas.DataFrame): for each grid value (rows, sorted by
+            value) the value of the profiled parameter, the chi-square
+            ("chisqr"), "delta", whether the fit succeeded ("success")
+            and the values of the other varying parameters.
+    """
+
+    if dataset.fit_result is None:
+        raise ValueError("the dataset must be fitted before the profiles")
+
+    result = dataset.fit_result
+    params = result.params
+    varying = [key for key in params if params[key].vary]
+
+    if names is None:
+        names = varying
+    unknown = [name for name in names if name not in varying]
+    if unknown:
+        raise ValueError(f"only varying parameters can be profiled: {unknown}")
+
+    values = {} if values is None else values
+    threshold = scipy.stats.chi2.ppf(level, 1)
+
+    problem = dict(
+        params = params,
+        problem = fit._compile_problem(
+            dataset, derivatives, params, c_to_q, solver, jac, jac_p
+            ),
+        sensitivities = sensitivities,
+        chisqr = result.chisqr,
+        redchi = result.redchi,
+        threshold = threshold if stop else np.inf
+        )
+
+
+    ############################################################################
+    # run the fits, each side of the grid of each parameter being a job
+    ############################################################################
+
+    jobs = list()
+    for name in names:
+        if name in values:
+            grid = np.unique(np.asarray(values[name], dtype = float))
+            value = params[name].value
+            jobs.append((name, grid[grid < value][::-1]))
+            jobs.append((name, grid[grid > value]))
+        else:
+            jobs.extend((name, side) for side in _profile_grid(
+                params[name], n_points, spread, threshold
+                ))
+
+    rows = {name: list() for name in names}
+
+    if processes is not None and processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+            processes,
+            initializer = _init_worker,
+            initargs = (problem,)
+            ) as executor:
+            futures = [
+                executor.submit(_worker_profile, name, grid)
+                for name, grid in jobs
+                ]
+            for future in concurrent.futures.as_completed(futures):
+                name, branch = future.result()
+                rows[name].extend(branch)
+    else:
+        for name, grid in jobs:
+            rows[name].extend(_profile_branch(problem, name, grid)[1])
+
+
+    ############################################################################
+    # profiles and intervals
+    ############################################################################
+
+    others = {key: params[key].value for key in varying}
+
+    profiles = dict()
+    intervals = list()
+    for name in names:
+
+        # the fit of the dataset is the minimum of each profile
+        best = dict(chisqr = result.chisqr, delta = 0.0, success = 1.0, **others)
+        profile = pd.DataFrame(rows[name] + [best])
+        profile = profile[[name, "chisqr", "delta", "success"] + [
+            key for key in varying if key != name
+            ]]
+        profile = profile.sort_values(name, ignore_index = True)
+        profiles[name] = profile
+
+        value = params[name].value
+        low, high = _profile_bounds(profile, params[name], threshold)
+        intervals.append(dict(name = name, value = value, low = low, high = high))
+
+    intervals = pd.DataFrame(intervals).set_index("name")
+    intervals.index.name = None
+
+    dataset.profiles = profiles
+    dataset.profile_intervals = intervals
+
+    return intervals, profiles
+
+
+def _profile_grid(param, n_points, spread, threshold):
+
+    """Grid values below and above the fitted value of param, from it."""
+
+    value = param.value
+    steps = np.arange(1, n_points + 1)/n_points
+
+    if value == 0:
+        below = -spread*steps
+        above = spread*steps
+    else:
+        below = value*spread**(-steps)
+        above = value*spread**steps
+        if value < 0:
+            below, above = above, below
+
+    # if the parameter has a standard error, the distances to the fitted
+    # value are spaced geometrically from half the standard error based
+    # half-width of the interval (up to at least spread times this value),
+    # so that the grid resolves the profile of the well identified
+    # parameters as well as its far ends
+    first = None
+    if param.stderr is not None and np.isfinite(param.stderr):
+        first = 0.5*np.sqrt(threshold)*param.stderr
+
+    sides = list()
+    for side in (below, above):
+        if first is not None and first > 0:
+            last = max(abs(side[-1] - value), spread*first)
+            side = value + np.sign(side[-1] - value)*np.geomspace(
+                first, last, n_points
+                )
+
+        # values beyond the bounds are replaced by a single value at the bound
+        clipped = np.clip(side, param.min, param.max)
+        sides.append(clipped[:np.argmax(clipped == clipped[-1]) + 1])
+    below, above = sides
+
+    return below[below < value], above[above > value]
+
+
+def _profile_branch(problem, name, grid):
+
+    """Fits the parameters other than name for the values of grid in order.
+
+    See the :func:`profile_likelihood` function.
+    """
+
+    params = problem["params"].copy()
+    params[name].vary = False
+
+    rows = list()
+    for value in grid:
+
+        params[name].value = value
+        result = fit._minimize(
+            problem["problem"], params, problem["sensitivities"]
+            )
+        delta = (result.chisqr - problem["chisqr"])/problem["redchi"]
+
+        row = {key: result.params[key].value for key in result.var_names}
+        row.update({
+            name: value,
+            "chisqr": result.chisqr,
+            "delta": delta,
+            "success": float(result.success)
+            })
+        rows.append(row)
+
+        # the next value starts from this fit, unless it failed
+        if result.success and np.isfinite(result.chisqr):
+            params = result.params.copy()
+
+        if delta > problem["threshold"]:
+            break
+
+    return name, rows
+
+
+def _profile_bounds(profile, param, threshold):
+
+    """Bounds of the confidence interval from the profile of param."""
+
+    x = profile[param.name].to_numpy()
+    i = int(np.searchsorted(x, param.value))
+
+    # the square root of delta is linear in the parameter for a quadratic
+    # profile, it is interpolated between the first value beyond the
+    # threshold on each side of the fitted value and the previous value
+    root = np.sqrt(np.maximum(profile["delta"].to_numpy(), 0))
+    threshold = np.sqrt(threshold)
+
+    # if the threshold is not reached, the bound is the parameter bound if
+    # the grid reached it, else it is infinite
+    bounds = list()
+    for side, step in ((range(i - 1, -1, -1), 1), (range(i + 1, len(x)), -1)):
+        limit = param.min if step == 1 else param.max
+        end = x[side[-1]] if side else param.value
+        bound = limit if end == limit else (-np.inf if step == 1 else np.inf)
+        for j in side:
+            if root[j] > threshold:
+                k = j + step
+                bound = x[k] + (x[j] - x[k])*(threshold - root[k])/(
+                    root[j] - root[k]
+                    )
+                break
+        bounds.append(float(bound))
+
+    return tuple(bounds)
+
+
+def confidence_intervals(samples, level = 0.95):
+
+    """Calculates the confidence intervals of the parameters from samples.
+
+    For the samples of the :func:`bootstrap` function only the
+    successful fits are used, the samples with a missing value are
+    dropped. The samples are read one column at a time, so that samples
+    memory-mapped to a file are never loaded in memory as a whole.
+
+    Parameters:
+        samples (pandas.DataFrame|numpy.ndarray):
+            Output of the :func:`bootstrap`, :func:`sample_emcee` or
+            :func:`load_samples` functions.
+        level (float, optional):
+            Confidence level of the intervals.
+
+    Returns:
+        pandas.DataFrame:
+            For each parameter (rows) the median, standard deviation
+            ("std") and bounds ("low" and "high") of the interval.
+    """
+
+    if isinstance(samples, pd.DataFrame):
+        columns = list(samples.columns)
+    else:
+        columns = list(samples.dtype.names)
+
+    names = [
+        name for name in columns
+        if name not in ("chisqr", "success", "lnsigma", "log_prob")
+        ]
+
+    # samples kept, from a single pass over the columns
+    keep = np.ones(len(samples), dtype = bool)
+    if "success" in columns:
+        keep &= np.asarray(samples["success"]) == 1
+    for name in names:
+        keep &= ~np.isnan(np.asarray(samples[name], dtype = float))
+
+    rows = dict()
+    for name in names:
+        values = np.asarray(samples[name], dtype = float)[keep]
+        if len(values) == 0:
+            rows[name] = dict(median = np.nan, std = np.nan, low = np.nan, high = np.nan)
+            continue
+        low, median, high = np.quantile(
+            values, [(1 - level)/2, 0.5, (1 + level)/2]
+            )
+        rows[name] = dict(
+            median = median,
+            std = np.std(values, ddof = 1) if len(values) > 1 else np.nan,
+            low = low,
+            high = high
+            )
+
+    return pd.DataFrame.from_dict(
+        rows, orient = "index", columns = ["median", "std", "low", "high"]
+        )
+
+
+def load_samples(path):
+
+    """Opens the samples written by :func:`bootstrap` or :func:`sample_emcee`.
+
+    The file is memory-mapped read-only, the samples are only read from
+    disk when accessed.
+
+    Parameters:
+        path (str):
+            Path of the .npy file.
+
+    Returns:
+        numpy.memmap:
+            The samples as a structured array with a field per column,
+            see the corresponding function. pandas.DataFrame(samples)
+            loads them in memory as a DataFrame.
+    """
+
+    return np.load(path, mmap_mode = "r")
+
+
+def _open_samples(path, columns, n):
+
+    """Creates the structured array holding n samples, in memory or on disk."""
+
+    dtype = [(name, float) for name in columns]
+
+    if path is None:
+        samples = np.empty(n, dtype = dtype)
+    else:
+        samples = np.lib.format.open_memmap(
+            path, mode = "w+", dtype = dtype, shape = (n,)
+            )
+
+    # samples that are not computed (e.g. after an error) are left as nan
+    for name in columns:
+        samples[name] = np.nan
+
+    return samples
+
+
+def _close_samples(samples):
+
+    """Flushes the samples written to disk, returns the samples.
+
+    The samples held in memory are returned as a DataFrame, the samples
+    written to disk stay memory-mapped.
+    """
+
+    if isinstance(samples, np.memmap):
+        samples.flush()
+        return samples
+
+    return pd.DataFrame(samples)
+
+
+# problem used by the processes of the pools created in this module, it is
+# set once when the processes are initialized so that only the index of the
+# sample or the parameters values are sent to the processes
+_worker_problem = None
+
+
+def _init_worker(problem):
+
+    """Initializer of the processes used by bootstrap and sample_emcee."""
+
+    global _worker_problem
+    _worker_problem = problem
+
+
+def _worker_bootstrap(i, seed):
+
+    """Bootstrap fit number i, computed in a worker process."""
+
+    return _bootstrap_sample(_worker_problem, i, seed)
+
+
+def _worker_profile(name, grid):
+
+    """Side of the profile of name, computed in a worker process."""
+
+    return _profile_branch(_worker_problem, name, grid)
+
+
+def _worker_log_prob(theta):
+
+    """Log-posterior probability of theta, computed in a worker process."""
+
+    return _log_prob(_worker_problem, theta)
@@ -2,6 +2,8 @@
 
 import numpy as np
 from scipy import constants
+from chemical_kinetics.network import Network
+from chemical_kinetics.fit import LinearModel, LinearObservable
 
 
 measured_species = ["HMF", "DFF", "HMFCA", "FFCA", "FDCA"]
@@ -9,20 +11,13 @@ all_species = measured_species.copy()
 all_species.extend(["H_" + s for s in measured_species])
 all_species.extend(["Hx_" + s for s in measured_species])
 
-def c_to_q(c):
-
-    c_e = list()
-    for i, s in enumerate(all_species):
-        c_e.append(2*(i%5 + int(i/5))*c[:,i])
-
-    c_e = np.sum(c_e, axis = 0) # uM
-    c_e *= 1e-6 # M
-
-    V = 100e-3 # L
-
-    q = c_e*V*constants.N_A*constants.e # number of charge in coulombs
-
-    return q
+# charge passed per unit of concentration of each species: number of charges
+# passed to make one molecule, converted from uM to M, solution volume 100 mL
+V = 100e-3 # L
+electrons = [2*(i%5 + int(i/5)) for i in range(len(all_species))]
+c_to_q = LinearObservable(
+    np.array(electrons)*1e-6*V*constants.N_A*constants.e # C/uM
+    )
 
 def derivatives(y, t, p):
 
@@ -54,4 +49,26 @@ def derivatives(y, t, p):
     
     dy = [dc[name] for name in all_species]
 
-    return dy
\ No newline at end of file
+    return dy
+
+# same model described as a reaction network, network.derivatives can be used
+# in place of the derivatives function, with network.jac and network.jac_p
+reactions = [
+    (["HMF"], ["DFF"], "k11"),
+    (["HMF"], ["HMFCA"], "k12"),
+    (["DFF"], ["FFCA"], "k21"),
+    (["HMFCA"], ["FFCA"], "k22"),
+    (["FFCA"], ["FDCA"], "k3"),
+    (["HMF"], ["H_HMF"], "kH1"),
+    (["DFF"], ["H_DFF"], "kH21"),
+    (["HMFCA"], ["H_HMFCA"], "kH22"),
+    (["FFCA"], ["H_FFCA"], "kH3"),
+    (["FDCA"], ["H_FDCA"], "kH4"),
+    ]
+reactions.extend([(["H_" + s], ["Hx_" + s], "kHx") for s in measured_species])
+
+network = Network(reactions, all_species)
+
+# all the reactions being first order the model is linear, linear_model can be
+# used in place of the derivatives function to solve it in closed form
+linear_model = LinearModel(network.rate_matrix, network.rate_matrix_p)
@@ -13,6 +13,9 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/flboudoire/chemical-kinetics",
     packages=setuptools.find_packages(),
+    entry_points={
+        "console_scripts": ["chemical-kinetics=chemical_kinetics.batch:main"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,101 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+from chemical_kinetics import batch
+
+
+WO3_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "examples", "HMF_oxidation_WO3"
+    )
+
+# fit settings of the example, appended to a copy of its model module
+PARAMETERS = """
+derivatives = linear_model
+parameters = {k: dict(value = 0.05, min = 0) for k in network.rate_constants}
+c0 = {name: dict(vary = False) for name in measured_species}
+c0_untracked = {name: dict(value = 0, vary = False) for name in all_species[5:]}
+"""
+
+# a model whose integration hangs, the fit never checks its timeout
+HANGING = """
+import time
+
+def derivatives(y, t, p):
+    time.sleep(60)
+    return [-p["k"]*y[0], p["k"]*y[0]]
+
+parameters = {"k": dict(value = 0.1, min = 0)}
+"""
+
+
+@pytest.fixture
+def example(tmp_path):
+    shutil.copytree(os.path.join(WO3_DIR, "data"), tmp_path / "data")
+    model = tmp_path / "model.py"
+    with open(model, "w") as f:
+        f.write(open(os.path.join(WO3_DIR, "model.py")).read() + PARAMETERS)
+    return tmp_path, str(model)
+
+
+def run_main(monkeypatch, capsys, *args):
+    monkeypatch.setattr(sys, "argv", ["chemical-kinetics", *args])
+    batch.main()
+    return capsys.readouterr().out
+
+
+def test_cli_skip_unchanged(example, monkeypatch, capsys):
+    folder, model = example
+    output = str(folder / "fits")
+    runs = str(folder / "data" / "run*")
+    args = (model, runs, "-o", output, "-j", "2", "--decimate-q", "50", "--skip-unchanged")
+
+    out = run_main(monkeypatch, capsys, *args)
+
+    assert "3 runs: 3 fitted" in out
+    # the messages of the fits are only reported once, by fit_runs
+    assert out.count("Fit succeeded.") == 3
+    results = pd.read_csv(os.path.join(output, "results.csv"), index_col = "run")
+    assert list(results.index) == ["run1", "run2", "run3"]
+    assert results["success"].all()
+    for run in results.index:
+        assert os.path.isfile(os.path.join(output, "runs", run, "dataset.npz"))
+    assert sorted(os.listdir(output)) == ["manifest.json", "results.csv", "runs"]
+
+    # only the run whose data changed is fitted again
+    file = folder / "data" / "run2" / "Reaction Monitoring.csv"
+    df = pd.read_csv(file)
+    df.iloc[:-1].to_csv(file, index = False)
+
+    out = run_main(monkeypatch, capsys, *args)
+
+    assert "3 runs: 1 fitted, 2 unchanged (skipped)" in out
+    results = pd.read_csv(os.path.join(output, "results.csv"), index_col = "run")
+    assert list(results["refitted"]) == [False, True, False]
+    assert list(results["status"]) == ["fitted"]*3
+
+
+def test_fit_runs_timeout(example):
+    folder, model = example
+    runs = [str(folder / "data" / "run1")]
+
+    # the fit is aborted at its first check of the time limit
+    results = batch.fit_runs(model, runs, str(folder / "soft"), timeout = 0)
+
+    assert results.loc["run1", "status"] == "timeout"
+    assert not os.path.exists(folder / "soft" / "runs" / "run1" / "dataset.npz")
+
+    # the process of a fit that does not reach the check is killed
+    hanging = folder / "hanging.py"
+    hanging.write_text(HANGING)
+    results = batch.fit_runs(
+        str(hanging), runs, str(folder / "hard"), timeout = 0.5, hard_timeout = 1
+        )
+
+    assert results.loc["run1", "status"] == "killed"
+    assert results.loc["run1", "message"] == "killed after 1 s"
+    assert results.loc["run1", "elapsed"] < 10
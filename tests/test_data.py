@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chemical_kinetics import data, fit
+
+
+@pytest.fixture
+def trace():
+    t = np.linspace(0, 100, 10001)
+    df = pd.DataFrame({"t": t, "Q": 1 - np.exp(-t/10)})
+    df_std = pd.DataFrame({"t": t, "Q": 0.01 + 0.01*(t > 50)})
+    return df, df_std
+
+
+@pytest.mark.parametrize("method", ["uniform", "adaptive"])
+def test_decimate_unweighted_by_default(trace, method):
+    df, df_std = trace
+    reduced, reduced_std = data.decimate(df, df_std, 100, method)
+
+    assert "weight" not in reduced
+    assert len(reduced) <= 100
+    assert np.all(np.diff(reduced["t"]) > 0)
+    np.testing.assert_allclose(reduced["Q"], 1 - np.exp(-reduced["t"]/10), atol = 1e-3)
+    np.testing.assert_array_equal(reduced_std["t"], reduced["t"])
+
+
+def test_decimate_weights_keep_total_weight(trace):
+    df, df_std = trace
+    reduced, _ = data.decimate(df, df_std, 100, "uniform", weights = True)
+
+    assert reduced["weight"].sum() == len(df)
+
+
+def test_decimate_std_root_mean_square(trace):
+    df, df_std = trace
+    # a single bin: the std is the root mean square of the points std, not
+    # divided by the square root of their number
+    _, reduced_std = data.decimate(df, df_std, 1, "uniform")
+
+    expected = np.sqrt(np.mean(df_std["Q"]**2))
+    np.testing.assert_allclose(reduced_std["Q"], [expected])
+
+
+def test_read_cache(tmp_path):
+    file = tmp_path / "run.csv"
+    cache_dir = tmp_path / "cache"
+    pd.DataFrame({"t": [0, 1, 2.], "Q": [0, 1, 4.]}).to_csv(file, index = False)
+
+    columns, values = data.read(str(file), cache = True, cache_dir = str(cache_dir))
+    assert columns == ["t", "Q"]
+    np.testing.assert_array_equal(values, [[0, 0], [1, 1], [2, 4]])
+    assert isinstance(values.base, np.memmap) or isinstance(values, np.memmap)
+    # only the .npy and .json files, no temporary file left
+    assert sorted(path.suffix for path in cache_dir.iterdir()) == [".json", ".npy"]
+
+    # the cache is rebuilt when the file changes
+    pd.DataFrame({"t": [0, 1, 2.], "Q": [0, 2, 16.]}).to_csv(file, index = False)
+    _, values = data.read(str(file), cache = True, cache_dir = str(cache_dir))
+    np.testing.assert_array_equal(values[:,1], [0, 2, 16])
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_load_q_cached_run_lazy(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, "CACHE_DIR", str(tmp_path / "cache"))
+    file = str(tmp_path / "run.csv")
+    t = np.arange(0, 100.)
+    pd.DataFrame({"t": t, "Q": t**2}).to_csv(file, index = False)
+
+    dataset = data.Dataset()
+    dataset.load_q([file], cache = True)
+    dataset.load_q([file], cache = True)
+
+    # the run stays memory-mapped, no moment is calculated by load_q
+    run = dataset.replicates_q.runs[0]
+    assert isinstance(run.base, np.memmap) or isinstance(run, np.memmap)
+    assert dataset.replicates_q._mean is None
+    assert dataset._df_q is None
+
+    # a single run is used as is, without copying the array
+    assert np.shares_memory(dataset.df_q["Q"].to_numpy(), run)
+    np.testing.assert_array_equal(dataset.df_q["Q"], t**2)
+    assert dataset.df_q_std["Q"].isna().all()
+
+    # the frames can still be replaced
+    dataset.df_q = None
+    assert dataset.df_q is None
+
+
+def test_replicates_offset_time_grids(tmp_path):
+    files = [str(tmp_path / "run1.csv"), str(tmp_path / "run2.csv")]
+    t1 = np.arange(0, 11.)
+    t2 = t1 + 0.5
+    pd.DataFrame({"t": t1, "Q": t1}).to_csv(files[0], index = False)
+    # same columns in another order
+    pd.DataFrame({"Q": t2 + 1, "t": t2}).to_csv(files[1], index = False)
+
+    replicates = data.Replicates(files)
+
+    # the second run is interpolated on the time values of the first one,
+    # and missing before its first time value
+    assert replicates.interpolated
+    np.testing.assert_array_equal(replicates.t, t1)
+    assert replicates.values.shape == (2, 11, 1)
+    np.testing.assert_array_equal(replicates.mask[:,0,0], [True, False])
+    np.testing.assert_allclose(replicates.runs[1][1:,0], t1[1:] + 1)
+
+    df, df_std = replicates.frames()
+    np.testing.assert_allclose(df["Q"], np.r_[0, t1[1:] + 0.5])
+    assert np.isnan(df_std["Q"][0])
+    np.testing.assert_allclose(df_std["Q"][1:], np.sqrt(0.5))
+    # same moments as pandas over the (runs, time) values
+    values = pd.DataFrame(replicates.values[:,:,0].T)
+    np.testing.assert_allclose(df["Q"], values.mean(axis = 1))
+    np.testing.assert_allclose(df_std["Q"], values.std(axis = 1))
+
+    # a run repeated in the resampled runs is weighted accordingly
+    df, _ = replicates.frames([0, 0, 1])
+    np.testing.assert_allclose(df["Q"][1:], t1[1:] + 1/3)
+
+
+def decay(y, t, p):
+    return np.array([-p["k"]*y[0], p["k"]*y[0]])
+
+
+def c_to_q(c):
+    return 2*c[:,1]
+
+
+def test_save_load_round_trip(tmp_path):
+    t = np.linspace(0, 10, 21)
+    rng = np.random.default_rng(0)
+    noise = 1 + 0.02*rng.standard_normal(len(t))
+    file_c, file_q = str(tmp_path / "c.csv"), str(tmp_path / "q.csv")
+    pd.DataFrame({"t": t, "A": np.exp(-0.5*t)*noise, "B": 1 - np.exp(-0.5*t)}).to_csv(
+        file_c, index = False
+        )
+    pd.DataFrame({"t": t, "Q": 2*(1 - np.exp(-0.5*t))}).to_csv(file_q, index = False)
+    dataset = data.Dataset([file_c], [file_q])
+    result = fit.fit_dataset(
+        dataset, decay, {"k": dict(value = 0.1, min = 0)}, c_to_q = c_to_q
+        )
+    path = str(tmp_path / "fit.npz")
+
+    # the fit curves are only solved when needed, saving builds the fit
+    # DataFrames from them
+    assert dataset._df_c_fit is None
+    dataset.save(path)
+    assert dataset._df_c_fit is not None and dataset._df_q_fit is not None
+
+    loaded = data.load_dataset(path)
+
+    assert loaded.fit_curves is None
+    loaded_result = loaded.fit_result
+    assert loaded_result.var_names == result.var_names
+    assert loaded_result.chisqr == result.chisqr
+    for key in result.params:
+        param = loaded_result.params[key]
+        assert param.value == result.params[key].value
+        assert param.vary == result.params[key].vary
+        assert param.stderr == pytest.approx(result.params[key].stderr)
+    for key in result.var_names:
+        assert loaded_result.params[key].correl == pytest.approx(result.params[key].correl)
+    np.testing.assert_allclose(loaded_result.covar, result.covar)
+    for name in ("df_c", "df_c_std", "df_c_fit", "df_q", "df_q_fit"):
+        pd.testing.assert_frame_equal(getattr(loaded, name), getattr(dataset, name))
+
+    # the fit curves are restored from the model, keeping the saved DataFrames
+    loaded = data.load_dataset(path, decay, c_to_q)
+
+    pd.testing.assert_frame_equal(loaded.df_c_fit, dataset.df_c_fit)
+    t_new = np.linspace(0, 10, 7)
+    np.testing.assert_allclose(
+        loaded.fit_curves(t_new), dataset.fit_curves(t_new), rtol = 1e-6
+        )
+    np.testing.assert_allclose(
+        loaded.fit_curves.charge(t_new), dataset.fit_curves.charge(t_new), rtol = 1e-6
+        )
@@ -0,0 +1,570 @@
+import importlib.util
+import os
+
+import lmfit
+import numpy as np
+import pandas as pd
+import pytest
+
+from chemical_kinetics import data, fit
+from chemical_kinetics.cache import disable_cache, enable_cache
+from chemical_kinetics.curves import FitCurves
+from chemical_kinetics.problem import FitProblem
+
+
+def decay(y, t, p):
+    return np.array([-p["k"]*y[0], p["k"]*y[0]])
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    t = np.linspace(0, 10, 21)
+    file = tmp_path / "c.csv"
+    pd.DataFrame({"t": t, "A": np.exp(-0.5*t), "B": 1 - np.exp(-0.5*t)}).to_csv(
+        file, index = False
+        )
+    return data.Dataset([str(file)])
+
+
+@pytest.fixture
+def dataset_q(tmp_path):
+    t = np.linspace(0, 10, 21)
+    t_q = np.linspace(0, 10, 101)
+    file_c = tmp_path / "c.csv"
+    file_q = tmp_path / "q.csv"
+    pd.DataFrame({"t": t, "A": np.exp(-0.5*t), "B": 1 - np.exp(-0.5*t)}).to_csv(
+        file_c, index = False
+        )
+    pd.DataFrame({"t": t_q, "Q": 2*(1 - np.exp(-0.5*t_q))}).to_csv(
+        file_q, index = False
+        )
+    return data.Dataset([str(file_c)], [str(file_q)])
+
+
+def c_to_q(c):
+    return 2*c[:,1]
+
+
+@pytest.fixture
+def cache():
+    cache = enable_cache()
+    yield cache
+    disable_cache()
+
+
+def test_cache_reuses_evaluations(cache):
+    params = lmfit.Parameters()
+    params.add("c0_A", value = 1)
+    params.add("c0_B", value = 0)
+    params.add("k", value = 0.5)
+    t = np.linspace(0, 10, 11)
+
+    c = fit.evaluate(decay, params, t)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # a subset of the time values of the stored evaluation
+    np.testing.assert_array_equal(fit.evaluate(decay, params, t[:6]), c[:6])
+    assert cache.hits == 1
+
+    # other parameters values
+    params["k"].value = 0.4
+    fit.evaluate(decay, params, t)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # the dense output of a solve_ivp method answers other time values
+    solver = dict(method = "RK45", rtol = 1e-8, atol = 1e-10)
+    fit.evaluate(decay, params, t, solver)
+    t_dense = np.linspace(0, 10, 101)
+    c = fit.evaluate(decay, params, t_dense, solver)
+    assert cache.hits == 2
+    np.testing.assert_allclose(c[:,0], np.exp(-0.4*t_dense), rtol = 1e-6)
+
+
+def test_fit_curves_reuse_cached_dense_output(cache):
+    params = lmfit.Parameters()
+    params.add("c0_A", value = 1)
+    params.add("c0_B", value = 0)
+    params.add("k", value = 0.5)
+    solver = dict(method = "RK45", rtol = 1e-8, atol = 1e-10)
+    t = np.linspace(0, 10, 11)
+
+    fit.evaluate(decay, params, t, solver)
+    curves = FitCurves(decay, params, ["A", "B"], (0, 10), solver = solver)
+    c = curves(np.linspace(0, 10, 101))
+
+    assert cache.hits == 1
+    np.testing.assert_allclose(c[:,0], np.exp(-0.5*np.linspace(0, 10, 101)), rtol = 1e-6)
+
+
+def test_fit_curves_reuse_cached_odeint_evaluation(dataset, cache, monkeypatch):
+    result = fit.fit_dataset(dataset, decay, {"k": dict(value = 0.1, min = 0)})
+    t = dataset.df_c["t"].to_numpy()
+    expected = fit.evaluate(decay, result.params, t)
+
+    # the curves are not solved again at the time values of the fit
+    solves = []
+    integrate = fit.integrate
+    def counting_integrate(*args, **kws):
+        solves.append(kws["solver"]["method"])
+        return integrate(*args, **kws)
+    monkeypatch.setattr("chemical_kinetics.curves.integrate", counting_integrate)
+    hits = cache.hits
+
+    np.testing.assert_array_equal(dataset.fit_curves(t[::2]), expected[::2])
+    assert cache.hits == hits + 1
+    assert solves == []
+
+    # they are solved with LSODA at other time values
+    t_other = np.linspace(0, 10, 7) + 0.1
+    t_other[-1] = 10
+    np.testing.assert_allclose(
+        dataset.fit_curves(t_other)[:,0], np.exp(-0.5*t_other), rtol = 1e-3
+        )
+    assert solves == ["LSODA"]
+
+
+def decay_jac(y, t, p):
+    return np.array([[-p["k"], 0], [p["k"], 0]])
+
+
+@pytest.mark.parametrize("method", ["Radau", "BDF", "LSODA"])
+def test_solve_ivp_matches_odeint(method):
+    params = lmfit.Parameters()
+    params.add("c0_A", value = 1)
+    params.add("c0_B", value = 0)
+    params.add("k", value = 0.5)
+    t = np.linspace(0, 10, 21)
+    tolerances = dict(rtol = 1e-10, atol = 1e-12)
+
+    c_odeint = fit.evaluate(decay, params, t, tolerances)
+    c = fit.evaluate(decay, params, t, dict(method = method, **tolerances))
+    c_jac = fit.evaluate(
+        decay, params, t, dict(method = method, **tolerances), jac = decay_jac
+        )
+
+    np.testing.assert_allclose(c_odeint[:,0], np.exp(-0.5*t), rtol = 1e-7)
+    np.testing.assert_allclose(c, c_odeint, rtol = 1e-6, atol = 1e-9)
+    np.testing.assert_allclose(c_jac, c_odeint, rtol = 1e-6, atol = 1e-9)
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_evaluate_batch_matches_evaluate(vectorized):
+    params = lmfit.Parameters()
+    params.add("c0_A", value = 1)
+    params.add("c0_B", value = 0)
+    params.add("k", value = 0.5)
+    param_matrix = pd.DataFrame({
+        "c0_A": [1, 2, 0.5, 1, 3],
+        "k": [0.5, 0.1, 2, 1e-3, 0.7]
+        })
+    t = np.linspace(0, 10, 11)
+    solver = dict(rtol = 1e-10, atol = 1e-12)
+
+    c = fit.evaluate_batch(
+        decay, param_matrix, t, params, solver = solver,
+        vectorized = vectorized, batch_size = 2
+        )
+
+    assert c.shape == (5, len(t), 2)
+    for i, row in param_matrix.iterrows():
+        set_params = params.copy()
+        for key, value in row.items():
+            set_params[key].value = value
+        np.testing.assert_allclose(
+            c[i], fit.evaluate(decay, set_params, t, solver), rtol = 1e-6, atol = 1e-9
+            )
+
+
+def test_fit_dataset(dataset):
+    result = fit.fit_dataset(dataset, decay, {"k": dict(value = 0.1, min = 0)})
+
+    assert dataset.fit_result is result
+    assert result.params["k"].value == pytest.approx(0.5, rel = 1e-4)
+    np.testing.assert_allclose(dataset.df_c_fit["A"], np.exp(-0.5*dataset.df_c_fit["t"]), atol = 1e-4)
+
+
+def test_merge_times():
+    t_c = [0, 2, 4.5]
+    t_q = [0, 1, 2, 3, 4, 5]
+
+    t, (idx_c, idx_q) = fit.merge_times(t_c, t_q)
+
+    np.testing.assert_array_equal(t, [0, 1, 2, 3, 4, 4.5, 5])
+    np.testing.assert_array_equal(t[idx_c], t_c)
+    np.testing.assert_array_equal(t[idx_q], t_q)
+
+
+def test_residuals_solve_model_once(dataset_q, monkeypatch):
+    params = fit.make_parameters(dataset_q, {"k": dict(value = 0.3)})
+    df_c, df_q = dataset_q.df_c, dataset_q.df_q
+
+    calls = []
+    integrate = fit.integrate
+    def counting_integrate(*args, **kws):
+        calls.append(kws["t"])
+        return integrate(*args, **kws)
+    monkeypatch.setattr(fit, "integrate", counting_integrate)
+
+    res = fit.residuals(params, df_c, decay, dataset_q.names, df_q, c_to_q)
+
+    assert len(calls) == 1
+    assert len(calls[0]) == len(np.union1d(df_c["t"], df_q["t"]))
+
+    # same residuals as with separate solves on the time values of each data
+    c = fit.evaluate(decay, params, df_c["t"])
+    q = c_to_q(fit.evaluate(decay, params, df_q["t"]))
+    expected = (
+        fit.calculate_residuals(df_c, c, dataset_q.names) +
+        fit.calculate_residuals(df_q, q, "Q")
+        )
+    np.testing.assert_allclose(res, expected, atol = 1e-7)
+
+
+def test_jacobian_matches_finite_differences(dataset_q):
+    params = fit.make_parameters(
+        dataset_q, {"k": dict(value = 0.3)}, {"A": dict(value = 0.9)}
+        )
+    args = (dataset_q.df_c, decay, dataset_q.names, dataset_q.df_q, c_to_q)
+
+    J = fit.jacobian(params, *args)
+
+    names = [key for key in params if params[key].vary]
+    J_fd = np.empty_like(J)
+    for j, name in enumerate(names):
+        h = 1e-5*max(abs(params[name].value), 1)
+        plus, minus = params.copy(), params.copy()
+        plus[name].value += h
+        minus[name].value -= h
+        J_fd[:,j] = (
+            np.array(fit.residuals(plus, *args)) -
+            np.array(fit.residuals(minus, *args))
+            )/(2*h)
+
+    assert J.shape == (2*len(dataset_q.df_c) + len(dataset_q.df_q), len(names))
+    np.testing.assert_allclose(J, J_fd, rtol = 1e-4, atol = 1e-6*np.abs(J_fd).max())
+
+
+def test_linear_observable_matches_callable(dataset_q):
+    params = fit.make_parameters(
+        dataset_q, {"k": dict(value = 0.3)}, {"A": dict(value = 0.9)}
+        )
+    observable = fit.LinearObservable([0, 2])
+    args = (dataset_q.df_c, decay, dataset_q.names, dataset_q.df_q)
+
+    np.testing.assert_allclose(
+        fit.residuals(params, *args, observable), fit.residuals(params, *args, c_to_q)
+        )
+    np.testing.assert_allclose(
+        fit.jacobian(params, *args, observable), fit.jacobian(params, *args, c_to_q),
+        rtol = 1e-10, atol = 1e-12
+        )
+
+    t = np.linspace(0, 10, 7)
+    curves = [
+        FitCurves(decay, params, dataset_q.names, (0, 10), c_to_q = f)
+        for f in (observable, c_to_q)
+        ]
+    np.testing.assert_allclose(curves[0].charge(t), curves[1].charge(t))
+
+
+def test_fit_dataset_sensitivities(dataset_q):
+    result = fit.fit_dataset(
+        dataset_q, decay, {"k": dict(value = 0.1, min = 0)},
+        c_to_q = c_to_q, sensitivities = True
+        )
+
+    assert result.params["k"].value == pytest.approx(0.5, rel = 1e-4)
+
+
+@pytest.mark.parametrize("sensitivities", [False, True])
+def test_fit_profile_counts(dataset, monkeypatch, sensitivities):
+    calls = {"residuals": 0, "jacobian": 0}
+    for kind in calls:
+        method = getattr(FitProblem, kind)
+        def counting(self, params, kind = kind, method = method):
+            calls[kind] += 1
+            return method(self, params)
+        monkeypatch.setattr(FitProblem, kind, counting)
+
+    result = fit.fit_dataset(
+        dataset, decay, {"k": dict(value = 0.1, min = 0)},
+        sensitivities = sensitivities, profile = True
+        )
+
+    profile = result.profile
+    history = profile.history
+    summary = profile.summary()
+    assert summary["residuals"]["calls"] == calls["residuals"] >= result.nfev
+    assert summary["jacobian"]["calls"] == calls["jacobian"]
+    assert (calls["jacobian"] > 0) == sensitivities
+    assert history["rhs_calls"].sum() == profile.rhs_calls > 0
+    if not sensitivities:
+        # every call of the derivatives function is made by the integrator
+        assert profile.rhs_calls == history["nfev"].sum()
+    assert summary["cost"] == pytest.approx(result.chisqr)
+    assert profile.elapsed >= history["time"].sum()
+
+
+def test_fit_profile_reduced_model(dataset):
+    from chemical_kinetics.reduction import ConservedModel
+
+    def decay_jac(y, t, p):
+        return np.array([[-p["k"], 0], [p["k"], 0]])
+
+    model = ConservedModel(decay, [[1, 1]])
+    result = fit.fit_dataset(
+        dataset, model, {"k": dict(value = 0.1, min = 0)},
+        solver = dict(method = "BDF"), jac = decay_jac, profile = True
+        )
+
+    # the calls of the reduced system are counted
+    profile = result.profile
+    assert result.params["k"].value == pytest.approx(0.5, rel = 1e-3)
+    assert profile.rhs_calls == profile.history["nfev"].sum() > 0
+    assert profile.jac_calls > 0
+
+
+def decay_dataset(folder, c0):
+    t = np.linspace(0, 10, 21)
+    file = folder / f"c{c0}.csv"
+    pd.DataFrame({"t": t, "A": c0*np.exp(-0.5*t), "B": c0*(1 - np.exp(-0.5*t))}).to_csv(
+        file, index = False
+        )
+    return data.Dataset([str(file)])
+
+
+def test_fit_datasets_shared_and_local_parameters(tmp_path):
+    datasets = [decay_dataset(tmp_path, 1), decay_dataset(tmp_path, 2)]
+    c0 = {"A": dict(value = 1.5, min = 0)}
+
+    result = fit.fit_datasets(datasets, decay, {"k": dict(value = 0.1, min = 0)}, c0)
+
+    assert "k" in result.params and "k_d0" not in result.params
+    assert result.params["k"].value == pytest.approx(0.5, rel = 1e-4)
+    assert result.params["c0_A_d0"].value == pytest.approx(1, rel = 1e-4)
+    assert result.params["c0_A_d1"].value == pytest.approx(2, rel = 1e-4)
+    assert all(dataset.fit_result is result for dataset in datasets)
+    np.testing.assert_allclose(
+        datasets[1].df_c_fit["A"], 2*np.exp(-0.5*datasets[1].df_c_fit["t"]), atol = 1e-4
+        )
+
+    # the global residuals are the residuals of each dataset for its own
+    # parameters, stacked
+    expected = list()
+    for i, dataset in enumerate(datasets):
+        params = fit.make_parameters(dataset, {"k": dict(value = 0.1)}, c0)
+        for key in params:
+            name = key if key == "k" else f"{key}_d{i}"
+            params[key].value = result.params[name].value
+        expected.extend(fit.residuals(params, dataset.df_c, decay, dataset.names))
+    np.testing.assert_allclose(result.residual, expected, atol = 1e-8)
+
+
+def test_refit_dataset_warm_start(tmp_path):
+    t = np.linspace(0, 10, 21)
+    df = pd.DataFrame({"t": t, "A": np.exp(-0.5*t), "B": 1 - np.exp(-0.5*t)})
+    file = tmp_path / "c.csv"
+    df[t <= 5].to_csv(file, index = False)
+    dataset = data.Dataset([str(file)])
+    parameters = {"k": dict(value = 0.1, min = 0)}
+
+    previous = fit.fit_dataset(dataset, decay, parameters)
+    dataset.append(c = df[t > 5])
+    result = fit.refit_dataset(dataset, decay)
+
+    assert dataset.fit_result is result
+    assert len(dataset.df_c) == len(t)
+    assert result.init_values == {
+        key: previous.params[key].value for key in previous.var_names
+        }
+    assert result.params["k"].value == pytest.approx(0.5, rel = 1e-4)
+
+    # a cold fit of the same data from the initial guesses takes more
+    # evaluations
+    full = data.Dataset([str(file)])
+    full.append(c = df[t > 5])
+    cold = fit.fit_dataset(full, decay, parameters)
+    assert result.nfev < cold.nfev
+
+
+def test_fit_dataset_timeout(dataset):
+    result = fit.fit_dataset(
+        dataset, decay, {"k": dict(value = 0.1, min = 0)}, timeout = 0
+        )
+
+    assert result.aborted and result.timed_out
+    assert dataset.fit_result is result
+    assert dataset.fit_curves is None
+    assert dataset.df_c_fit is None
+
+
+def test_fit_dataset_max_nfev_keeps_curves(dataset, monkeypatch):
+    minimize = fit._minimize
+    def limited(*args, **kws):
+        return minimize(*args, max_nfev = 3, **kws)
+    monkeypatch.setattr(fit, "_minimize", limited)
+
+    result = fit.fit_dataset(
+        dataset, decay, {"k": dict(value = 0.1, min = 0)}, timeout = 60
+        )
+
+    # aborted by lmfit, not at the time limit
+    assert result.aborted and not result.timed_out
+    assert dataset.fit_curves is not None
+    assert len(dataset.df_c_fit) > 0
+
+
+def failing_decay(y, t, p):
+    if p["k"] > 5:
+        raise ValueError("rate constant out of range")
+    return decay(y, t, p)
+
+
+def test_multistart_drops_failed_starts(dataset):
+    parameters = {"k": dict(value = 0.1, min = 0, max = 10)}
+
+    with pytest.warns(RuntimeWarning, match = "failed: ValueError"):
+        best, minima = fit.fit_dataset_multistart(
+            dataset, failing_decay, parameters, n_starts = 8, seed = 0
+            )
+
+    assert best.params["k"].value == pytest.approx(0.5, rel = 1e-4)
+    assert dataset.fit_result is best
+    assert minima["count"].sum() < 8
+
+
+def test_multistart_without_completed_fit(dataset):
+    parameters = {"k": dict(value = 0.1, min = 0, max = 10)}
+
+    with pytest.raises(RuntimeError, match = "no fit completed"):
+        fit.fit_dataset_multistart(
+            dataset, decay, parameters, n_starts = 4, seed = 0, timeout = 0
+            )
+
+
+def fit_result(values, chisqr, init_values = None, aborted = False):
+    params = lmfit.Parameters()
+    for key, value in values.items():
+        params.add(key, value = value)
+    result = lmfit.minimizer.MinimizerResult(
+        params = params,
+        var_names = list(values),
+        init_values = init_values or dict(values),
+        success = True,
+        aborted = aborted
+        )
+    if not aborted:
+        result.chisqr = chisqr
+    return result
+
+
+def test_group_minima_parameter_at_bound():
+    # the same minimum with a parameter converging to its bound at 0, and
+    # a distinct minimum
+    results = [
+        fit_result({"k1": 1.0, "k2": 2e-9}, 10.0, {"k1": 0.5, "k2": 0.05}),
+        fit_result({"k1": 1.0, "k2": 1e-11}, 10.0, {"k1": 2.0, "k2": 0.01}),
+        fit_result({"k1": 3.0, "k2": 0.02}, 12.0, {"k1": 4.0, "k2": 0.03}),
+        fit_result({"k1": 5.0, "k2": 0.01}, 0, aborted = True)
+        ]
+
+    minima = fit.group_minima(results)
+
+    assert [len(minimum) for minimum in minima] == [2, 1]
+    assert minima[0][0].chisqr == 10.0
+    assert minima[1][0].params["k1"].value == 3.0
+
+
+def test_group_minima_only_aborted():
+    with pytest.raises(ValueError, match = "aborted"):
+        fit.group_minima([fit_result({"k": 1.0}, 0, aborted = True)])
+
+
+
+################################################################################
+# HMF oxidation on WO3 example
+################################################################################
+
+WO3_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "examples", "HMF_oxidation_WO3"
+    )
+
+
+@pytest.fixture(scope = "module")
+def wo3():
+    spec = importlib.util.spec_from_file_location(
+        "wo3_model", os.path.join(WO3_DIR, "model.py")
+        )
+    model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(model)
+
+    folders = [os.path.join(WO3_DIR, "data", f"run{i}") for i in range(1, 4)]
+    dataset = data.Dataset(
+        [os.path.join(folder, "Reaction Monitoring.csv") for folder in folders],
+        [os.path.join(folder, "Charge Passed.csv") for folder in folders]
+        )
+
+    rng = np.random.default_rng(0)
+    params = fit.make_parameters(
+        dataset,
+        {k: dict(value = rng.uniform(0.001, 0.05), min = 0) for k in model.network.rate_constants},
+        {name: dict(vary = False) for name in model.measured_species},
+        {name: dict(value = 0, vary = False) for name in model.all_species[5:]}
+        )
+
+    return model, dataset, params
+
+
+def test_linear_model_matches_odeint(wo3):
+    model, dataset, params = wo3
+    t = np.linspace(0, dataset.df_c["t"].max(), 50)
+
+    c = fit.evaluate(model.linear_model, params, t)
+    c_odeint = fit.evaluate(
+        model.derivatives, params, t, dict(rtol = 1e-10, atol = 1e-10)
+        )
+
+    np.testing.assert_allclose(c, c_odeint, rtol = 1e-6, atol = 1e-6*np.abs(c).max())
+
+
+@pytest.mark.parametrize("linear", [True, False])
+def test_fit_problem_jacobian_matches_finite_differences(wo3, linear):
+    model, dataset, params = wo3
+    if linear:
+        derivatives, jac, jac_p = model.linear_model, None, None
+    else:
+        derivatives, jac, jac_p = model.derivatives, model.network.jac, model.network.jac_p
+    problem = FitProblem(
+        params, dataset.df_c, derivatives, dataset.names,
+        df_q = dataset.df_q, c_to_q = model.c_to_q,
+        solver = dict(rtol = 1e-10, atol = 1e-12), jac = jac, jac_p = jac_p
+        )
+
+    J = problem.jacobian(params)
+
+    names = [key for key in params if params[key].vary]
+    J_fd = np.empty_like(J)
+    for j, name in enumerate(names):
+        # the closed form solution of the linear model has round-off errors
+        # of about 1e-10, amplified by smaller steps
+        h = 1e-4*params[name].value
+        plus, minus = params.copy(), params.copy()
+        plus[name].value += h
+        minus[name].value -= h
+        J_fd[:,j] = (problem.residuals(plus) - problem.residuals(minus))/(2*h)
+
+    np.testing.assert_allclose(J, J_fd, rtol = 1e-4, atol = 1e-6*np.abs(J_fd).max())
+
+
+def test_linear_model_non_finite_rate_matrix(wo3):
+    model, dataset, params = wo3
+    p = {key: params[key].value for key in params if "c0_" not in key}
+    p["k11"] = np.inf
+    c0 = [params[key].value for key in params if "c0_" in key]
+
+    with pytest.warns(RuntimeWarning, match = "non-finite"):
+        c, info = fit._evaluate(model.linear_model, c0, p, np.linspace(0, 10, 5))
+
+    assert np.all(np.isnan(c))
+    assert not info["success"]
@@ -0,0 +1,124 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+from chemical_kinetics.network import Network
+
+
+WO3_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "examples", "HMF_oxidation_WO3"
+    )
+
+
+@pytest.fixture(scope = "module")
+def model():
+    spec = importlib.util.spec_from_file_location(
+        "wo3_model", os.path.join(WO3_DIR, "model.py")
+        )
+    model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(model)
+    return model
+
+
+# A -> B, 2 B -> C with an order 1.5 in B, A + C -> D
+@pytest.fixture
+def network():
+    return Network([
+        (["A"], ["B"], "k1"),
+        dict(reactants = {"B": 2}, products = ["C"], k = "k2", orders = {"B": 1.5}),
+        (["A", "C"], ["D"], "k3")
+        ])
+
+
+@pytest.fixture
+def p():
+    return {"k1": 0.7, "k2": 1.3, "k3": 0.4}
+
+
+def test_stoichiometry(network):
+    assert network.species == ["A", "B", "C", "D"]
+    assert network.rate_constants == ["k1", "k2", "k3"]
+    np.testing.assert_array_equal(network.stoichiometry, [
+        [-1, 0, -1],
+        [1, -2, 0],
+        [0, 1, -1],
+        [0, 0, 1]
+        ])
+    np.testing.assert_array_equal(network.orders, [
+        [1, 0, 0, 0],
+        [0, 1.5, 0, 0],
+        [1, 0, 1, 0]
+        ])
+    np.testing.assert_array_equal(network.jac_sparsity, [
+        [True, False, True, False],
+        [True, True, False, False],
+        [True, True, True, False],
+        [True, False, True, False]
+        ])
+
+
+def test_derivatives(network, p):
+    y = np.array([0.5, 0.8, 0.3, 0.1])
+
+    r = [p["k1"]*y[0], p["k2"]*y[1]**1.5, p["k3"]*y[0]*y[2]]
+    expected = [-r[0] - r[2], r[0] - 2*r[1], r[1] - r[2], r[2]]
+
+    np.testing.assert_allclose(network.derivatives(y, 0, p), expected)
+
+    # several sets of concentrations and rate constants at once
+    Y = np.stack([y, 2*y], axis = 1)
+    P = {key: np.array([value, 3*value]) for key, value in p.items()}
+    dy = network.derivatives(Y, 0, P)
+    np.testing.assert_allclose(dy[:,0], expected)
+    np.testing.assert_allclose(
+        dy[:,1], network.derivatives(2*y, 0, {k: 3*v for k, v in p.items()})
+        )
+
+
+def test_jacobians_match_finite_differences(network, p):
+    y = np.array([0.5, 0.8, 0.3, 0.1])
+    h = 1e-6
+
+    J_fd = np.empty((4, 4))
+    for i in range(4):
+        dy = np.zeros(4)
+        dy[i] = h
+        J_fd[:,i] = (
+            network.derivatives(y + dy, 0, p) - network.derivatives(y - dy, 0, p)
+            )/(2*h)
+    np.testing.assert_allclose(network.jac(y, 0, p), J_fd, atol = 1e-8)
+
+    dp = network.jac_p(y, 0, p)
+    assert list(dp) == network.rate_constants
+    for name in p:
+        plus, minus = p.copy(), p.copy()
+        plus[name] += h
+        minus[name] -= h
+        np.testing.assert_allclose(
+            dp[name],
+            (network.derivatives(y, 0, plus) - network.derivatives(y, 0, minus))/(2*h),
+            atol = 1e-8
+            )
+
+
+def test_unknown_species():
+    with pytest.raises(ValueError, match = "'B' of reaction 0"):
+        Network([(["A"], ["B"], "k1")], species = ["A"])
+
+
+def test_example_network_matches_derivatives(model):
+    rng = np.random.default_rng(0)
+    y = rng.uniform(0, 10, len(model.all_species))
+    p = {k: rng.uniform(0.001, 0.05) for k in model.network.rate_constants}
+
+    np.testing.assert_allclose(
+        model.network.derivatives(y, 0, p), model.derivatives(y, 0, p),
+        rtol = 1e-12, atol = 1e-15
+        )
+    # first order network: the Jacobian is the rate matrix
+    np.testing.assert_allclose(
+        model.network.jac(y, 0, p), model.network.rate_matrix(p)
+        )
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chemical_kinetics import data, fit, plot
+
+
+def decay(y, t, p):
+    return np.array([-p["k"]*y[0], p["k"]*y[0]])
+
+
+def c_to_q(c):
+    return 2*c[:,1]
+
+
+def fitted_dataset(folder, k, with_q = True):
+    t = np.linspace(0, 10, 21)
+    file_c, file_q = str(folder / f"c{k}.csv"), str(folder / f"q{k}.csv")
+    pd.DataFrame({"t": t, "A": np.exp(-k*t), "B": 1 - np.exp(-k*t)}).to_csv(
+        file_c, index = False
+        )
+    pd.DataFrame({"t": t, "Q": 2*(1 - np.exp(-k*t))}).to_csv(file_q, index = False)
+    dataset = data.Dataset([file_c], [file_q] if with_q else None)
+    fit.fit_dataset(
+        dataset, decay, {"k": dict(value = 0.1, min = 0)},
+        c_to_q = c_to_q if with_q else None
+        )
+    return dataset
+
+
+@pytest.fixture
+def datasets(tmp_path):
+    return [fitted_dataset(tmp_path, 0.5), fitted_dataset(tmp_path, 0.2, False)]
+
+
+def test_render_report(datasets, tmp_path):
+    directory = tmp_path / "report"
+
+    paths = plot.render_report(
+        datasets, str(directory), names = ["run1", "run2"], formats = ["png", "pdf"]
+        )
+
+    assert paths == [
+        [str(directory / f"{name}.{fmt}") for fmt in ("png", "pdf")]
+        for name in ("run1", "run2")
+        ]
+    assert sorted(os.listdir(directory)) == [
+        "index.html", "run1.pdf", "run1.png", "run2.pdf", "run2.png"
+        ]
+    for name in ("run1", "run2"):
+        assert (directory / f"{name}.png").read_bytes()[:8] == b"\x89PNG\r\n\x1a\n"
+        assert (directory / f"{name}.pdf").read_bytes()[:5] == b"%PDF-"
+
+    index = (directory / "index.html").read_text()
+    assert index.count("<img") == 2
+    assert '<img src="run1.png">' in index and '<a href="run2.pdf">pdf</a>' in index
+
+
+def test_render_report_saved_datasets(datasets, tmp_path):
+    files = [str(tmp_path / "fits" / f"run{i}.npz") for i in (1, 2)]
+    os.makedirs(tmp_path / "fits")
+    for dataset, file in zip(datasets, files):
+        dataset.save(file)
+    directory = tmp_path / "report"
+
+    plot.render_report(files, str(directory), formats = "svg", processes = 2)
+
+    assert sorted(os.listdir(directory)) == ["index.html", "run1.svg", "run2.svg"]
+    assert '<img src="run2.svg">' in (directory / "index.html").read_text()
+
+
+def test_renderer_hides_missing_charge_passed(datasets):
+    renderer = plot.Renderer()
+
+    renderer.draw(datasets[0], "run1")
+    assert renderer.ax_q.get_visible()
+
+    # the figure is reused, the charge passed axes are hidden
+    renderer.draw(datasets[1])
+    assert not renderer.ax_q.get_visible()
+    assert len(renderer.ax_c.lines) > 0
@@ -0,0 +1,200 @@
+import importlib.util
+import os
+
+import lmfit
+import numpy as np
+import pandas as pd
+import pytest
+
+from chemical_kinetics import data, fit, reduction
+
+
+# A -> I -> B with a short-lived intermediate I
+def derivatives(y, t, p):
+    r1, r2 = p["k1"]*y[0], p["k2"]*y[1]
+    return np.array([-r1, r1 - r2, r2])
+
+
+def jac(y, t, p):
+    return np.array([
+        [-p["k1"], 0, 0],
+        [p["k1"], -p["k2"], 0],
+        [0, p["k2"], 0]
+        ])
+
+
+@pytest.fixture
+def params():
+    params = lmfit.Parameters()
+    for name, value in [("c0_A", 1), ("c0_I", 0), ("c0_B", 0)]:
+        params.add(name, value = value, vary = False)
+    params.add("k1", value = 0.1)
+    params.add("k2", value = 1e3)
+    return params
+
+
+WO3_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "examples", "HMF_oxidation_WO3"
+    )
+
+
+@pytest.fixture(scope = "module")
+def wo3_model():
+    spec = importlib.util.spec_from_file_location(
+        "wo3_model", os.path.join(WO3_DIR, "model.py")
+        )
+    model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(model)
+    return model
+
+
+def test_conservation_laws():
+    stoichiometry = [[-1, 0], [1, -1], [0, 1]]
+
+    laws = reduction.conservation_laws(stoichiometry)
+    np.testing.assert_allclose(laws, [[1, 1, 1]])
+
+    # same law by probing the derivatives function
+    laws = reduction.conservation_laws(
+        derivatives = derivatives, p = {"k1": 0.1, "k2": 1e3}, n_species = 3
+        )
+    np.testing.assert_allclose(laws, [[1, 1, 1]], atol = 1e-9)
+
+
+def test_conservation_laws_example_network(wo3_model):
+    n_species = len(wo3_model.all_species)
+    p = {k: 0.01 for k in wo3_model.network.rate_constants}
+
+    for laws in (
+        reduction.conservation_laws(wo3_model.network.stoichiometry),
+        reduction.conservation_laws(
+            derivatives = wo3_model.derivatives, p = p, n_species = n_species
+            )
+        ):
+        np.testing.assert_allclose(laws, np.ones((1, n_species)), atol = 1e-9)
+
+
+@pytest.mark.parametrize("with_jac", [False, True])
+def test_conserved_model_matches_full_model(params, with_jac):
+    laws = reduction.conservation_laws([[-1, 0], [1, -1], [0, 1]])
+    model = reduction.ConservedModel(derivatives, laws)
+    params["c0_I"].value = 0.2
+    params["k2"].value = 0.3
+    t = np.linspace(0, 50, 51)
+
+    # the last species is calculated from the law
+    np.testing.assert_array_equal(model.pivots, [2])
+    np.testing.assert_array_equal(model.independent, [0, 1])
+
+    solver = dict(rtol = 1e-10, atol = 1e-12)
+    c, c_full, error = reduction.validate(
+        model, params, t, solver, jac if with_jac else None
+        )
+
+    assert np.all(error < 1e-7)
+    np.testing.assert_allclose(c.sum(axis = 1), 1.2)
+
+
+def test_qssa_matches_full_model(params):
+    model = reduction.QSSAModel(derivatives, [1], jac = jac)
+    t = np.linspace(0, 50, 51)
+
+    solver = dict(method = "BDF", rtol = 1e-8, atol = 1e-12)
+    c, c_full, error = reduction.validate(model, params, t, solver)
+
+    # the initial concentration of I is replaced by its steady state value
+    assert np.all(error[[0, 2]] < 1e-3)
+    np.testing.assert_allclose(c[1:,1], c_full[1:,1], rtol = 1e-2)
+
+
+@pytest.mark.parametrize("reduced", ["qssa", "conserved"])
+def test_fit_curves_reduced_model(tmp_path, params, reduced):
+    if reduced == "qssa":
+        model = reduction.QSSAModel(derivatives, [1], jac = jac)
+    else:
+        model = reduction.ConservedModel(derivatives, [[1, 1, 1]])
+    solver = dict(method = "BDF", rtol = 1e-8, atol = 1e-12)
+
+    t = np.linspace(0, 50, 26)
+    c = fit.evaluate(model, params, t, solver)
+    file = tmp_path / "c.csv"
+    pd.DataFrame({"t": t, "A": c[:,0], "I": c[:,1], "B": c[:,2]}).to_csv(
+        file, index = False
+        )
+    dataset = data.Dataset([str(file)])
+    result = fit.fit_dataset(
+        dataset, model,
+        {"k1": dict(value = 0.2, min = 0), "k2": dict(value = 1e3, vary = False)},
+        c0 = {name: dict(value = params[f"c0_{name}"].value, vary = False)
+              for name in ("A", "I", "B")},
+        solver = solver
+        )
+
+    # the fit curves integrate the same reduced system as the fit
+    df = dataset.df_c_fit
+    c = fit.evaluate(model, result.params, df["t"].to_numpy(), solver)
+    np.testing.assert_allclose(
+        df[["A", "I", "B"]].to_numpy(), c, rtol = 1e-5, atol = 1e-9
+        )
+
+
+def test_qssa_derivatives_do_not_depend_on_call_history(params):
+    model = reduction.QSSAModel(derivatives, [1])
+    p = {"k1": 0.1, "k2": 1e3}
+    func, z0, _, _ = model.reduce([1, 0, 0], p)
+
+    z = np.array([0.5, 0.4])
+    first = func(z, 10, p)
+    func(np.array([0.01, 0.9]), 40, p)
+
+    np.testing.assert_array_equal(func(z, 10, p), first)
+
+
+def test_qssa_reduce_uses_jac(params):
+    calls = []
+    def counting_jac(y, t, p):
+        calls.append(t)
+        return jac(y, t, p)
+
+    model = reduction.QSSAModel(derivatives, [1])
+    p = {"k1": 0.1, "k2": 1e3}
+    func, z0, reduced_jac, _ = model.reduce([1, 0, 0], p, counting_jac)
+
+    assert reduced_jac is not None
+    reduced_jac(z0, 0, p)
+    assert calls
+
+
+def test_qssa_sensitivities_raise(params):
+    model = reduction.QSSAModel(derivatives, [1], jac = jac)
+
+    with pytest.raises(ValueError, match = "approximate"):
+        fit.evaluate_sensitivities(model, params, np.linspace(0, 10, 11))
+
+
+def test_timescales():
+    p = {"k1": 0.1, "k2": 1e3}
+
+    lifetimes, scales = reduction.timescales(derivatives, [0.5, 0.1, 0.4], 0, p)
+
+    np.testing.assert_allclose(lifetimes[:2], [10, 1e-3], rtol = 1e-5)
+    assert lifetimes[2] == np.inf
+    np.testing.assert_allclose(scales[:2], [1e-3, 10], rtol = 1e-5)
+    assert scales[2] == np.inf
+
+
+def test_fast_species():
+    p = {"k1": 0.1, "k2": 1e3}
+    t = np.linspace(0, 50, 51)
+    solver = dict(method = "BDF", rtol = 1e-8, atol = 1e-12)
+
+    fast, lifetimes = reduction.fast_species(derivatives, [1, 0, 0], p, t, jac, solver = solver)
+
+    np.testing.assert_array_equal(fast, [1])
+    np.testing.assert_allclose(lifetimes[:2], [10, 1e-3])
+
+    fast, _ = reduction.fast_species(
+        derivatives, [1, 0, 0], p, t, jac, exclude = [1], solver = solver
+        )
+    assert len(fast) == 0
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chemical_kinetics import data, fit, uncertainty
+
+
+def decay(y, t, p):
+    return np.array([-p["k"]*y[0], p["k"]*y[0]])
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 10, 21)
+    noise = 1 + 0.02*rng.standard_normal((2, len(t)))
+    file = tmp_path / "c.csv"
+    pd.DataFrame({
+        "t": t,
+        "A": np.exp(-0.5*t)*noise[0],
+        "B": (1 - np.exp(-0.5*t))*noise[1]
+        }).to_csv(file, index = False)
+    dataset = data.Dataset([str(file)])
+    fit.fit_dataset(
+        dataset, decay, {"k": dict(value = 0.1, min = 0)},
+        {"A": dict(vary = False), "B": dict(value = 0, vary = False)}
+        )
+    return dataset
+
+
+def assert_contains_fit(intervals, dataset):
+    k = dataset.fit_result.params["k"].value
+    assert list(intervals.index) == ["k"]
+    assert intervals.loc["k", "low"] < k < intervals.loc["k", "high"]
+
+
+def test_bootstrap(dataset, tmp_path):
+    samples = uncertainty.bootstrap(dataset, decay, n_samples = 20, seed = 0)
+
+    assert list(samples.columns) == ["k", "chisqr", "success"]
+    assert len(samples) == 20
+    assert_contains_fit(uncertainty.confidence_intervals(samples), dataset)
+
+    # the samples written to disk stay memory-mapped, with the same values
+    path = str(tmp_path / "samples.npy")
+    on_disk = uncertainty.bootstrap(
+        dataset, decay, n_samples = 20, seed = 0, path = path
+        )
+    loaded = uncertainty.load_samples(path)
+
+    assert isinstance(on_disk, np.memmap) and isinstance(loaded, np.memmap)
+    np.testing.assert_array_equal(loaded["k"], samples["k"])
+    pd.testing.assert_frame_equal(
+        uncertainty.confidence_intervals(loaded),
+        uncertainty.confidence_intervals(samples)
+        )
+
+
+def test_bootstrap_failed_sample(dataset, monkeypatch):
+    # the resampling of the third sample raises an error
+    resample = uncertainty._resample_residuals
+    calls = []
+    def failing_resample(*args):
+        calls.append(None)
+        if len(calls) == 3:
+            raise ValueError("resampling failed")
+        return resample(*args)
+    monkeypatch.setattr(uncertainty, "_resample_residuals", failing_resample)
+
+    with pytest.warns(RuntimeWarning, match = "bootstrap fit 2 failed"):
+        samples = uncertainty.bootstrap(dataset, decay, n_samples = 5, seed = 0)
+
+    assert len(samples) == 5
+    assert samples.iloc[2].isna().all()
+    assert samples.drop(index = 2)["success"].eq(1).all()
+    assert_contains_fit(uncertainty.confidence_intervals(samples), dataset)
+
+
+def test_sample_emcee(dataset):
+    samples = uncertainty.sample_emcee(
+        dataset, decay, steps = 200, nwalkers = 8, burn = 100, thin = 2, seed = 0
+        )
+
+    assert list(samples.columns) == ["k", "lnsigma", "log_prob"]
+    assert len(samples) == 50*8
+    assert np.all(np.isfinite(samples["log_prob"]))
+    assert_contains_fit(uncertainty.confidence_intervals(samples), dataset)
+
+
+
+def test_profile_likelihood(dataset):
+    intervals, profiles = uncertainty.profile_likelihood(dataset, decay, n_points = 5)
+
+    assert_contains_fit(intervals, dataset)
+    assert dataset.profile_intervals is intervals
+    profile = profiles["k"]
+    assert list(profile.columns) == ["k", "chisqr", "delta", "success"]
+    assert profile["delta"].min() == 0
+    assert profile["delta"].iloc[[0, -1]].min() > 3.84